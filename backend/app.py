@@ -1,12 +1,36 @@
-from flask import Flask, request
-from flask_socketio import SocketIO, emit
+from flask import Flask, request, Response
+from flask_socketio import SocketIO, emit, join_room
 import requests
 import time
 import os
 import logging
 from datetime import datetime
 import threading
-import json
+import itertools
+import bisect
+import hashlib
+import hmac
+import random
+import uuid
+
+import metrics
+import json_codec
+import wire_format
+from messages import MessageType, make_message
+from search import SearchIndex
+import vector_index
+from rag import Retriever, format_snippets
+from embedding_pipeline import EmbeddingPipeline
+from idle_sweeper import IdleSweeper
+from heartbeat import HeartbeatTracker
+import outbound
+from shutdown import GracefulShutdown
+from typing_indicators import TypingTracker
+from read_receipts import ReadCursors
+from direct_messages import DirectMessages
+from llm_provider import LLMError, OllamaProvider
+from model_manager import ModelManager
+from model_router import ModelRouter, ModelBusyError, LARGE_TAG, SMALL_TAG
 
 # Configure logging
 logging.basicConfig(
@@ -17,109 +41,481 @@ logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'your-secret-key-change-in-production')
+app.json = json_codec.JSONProvider(app)
 
-<<<<<<< HEAD
-# Initialize SocketIO with CORS enabled
-socketio = SocketIO(app, cors_allowed_origins="*", async_mode='threading')
-
-# Configuration
-OLLAMA_URL = os.getenv('OLLAMA_URL', 'http://localhost:11434')
-MODEL_NAME = os.getenv('MODEL_NAME', 'llama3.2:1b')  # Using smaller model for better performance
-
-# In-memory storage (use Redis/Database for production)
-active_users = {}
-chat_history = []
-MAX_HISTORY = 100
-=======
 # Initialize SocketIO with CORS enabled and better error handling
-socketio = SocketIO(app, cors_allowed_origins="*", async_mode='threading', logger=True, engineio_logger=True)
+socketio = SocketIO(app, cors_allowed_origins="*", async_mode='threading', logger=True, engineio_logger=True,
+                    json=json_codec)
 
 # Configuration
 OLLAMA_URL = os.getenv('OLLAMA_URL', 'http://localhost:11434')
-MODEL_NAME = os.getenv('MODEL_NAME', 'llama2')  # Changed to a more common model name
+# Comma-separated list of Ollama replicas; AI jobs go to the least-loaded healthy one
+OLLAMA_URLS = [url.strip() for url in os.getenv('OLLAMA_URLS', OLLAMA_URL).split(',') if url.strip()]
+OLLAMA_FAILURE_THRESHOLD = int(os.getenv('OLLAMA_FAILURE_THRESHOLD', 3))
+OLLAMA_EJECTION_SECONDS = float(os.getenv('OLLAMA_EJECTION_SECONDS', 30))
+OLLAMA_KEEP_ALIVE = int(os.getenv('OLLAMA_KEEP_ALIVE', 1800))  # Seconds Ollama keeps the model loaded
+MODEL_REWARM_INTERVAL = int(os.getenv('MODEL_REWARM_INTERVAL', OLLAMA_KEEP_ALIVE * 2 // 3))
+MODEL_PULL_RETRIES = int(os.getenv('MODEL_PULL_RETRIES', 5))
+START_BACKGROUND_SERVICES = os.getenv('START_BACKGROUND_SERVICES', 'true').lower() == 'true'
+MODEL_NAME = os.getenv('MODEL_NAME', 'llama3.2:1b')  # Small default model for short questions
+LARGE_MODEL_NAME = os.getenv('LARGE_MODEL_NAME', '')  # Optional bigger model for long or @ai-large questions
+LARGE_MODEL_MIN_CHARS = int(os.getenv('LARGE_MODEL_MIN_CHARS', 280))  # Longer questions go to the large model
+MODEL_CONCURRENCY = int(os.getenv('MODEL_CONCURRENCY', 4))  # Concurrent generations per model
+LARGE_MODEL_CONCURRENCY = int(os.getenv('LARGE_MODEL_CONCURRENCY', 1))
+MODEL_QUEUE_TIMEOUT = float(os.getenv('MODEL_QUEUE_TIMEOUT', 60))  # Max wait for a model slot
+EMBEDDING_MODEL = os.getenv('EMBEDDING_MODEL', 'nomic-embed-text')
+# Background embedding of every message, shared by semantic features (needs numpy)
+EMBEDDINGS_ENABLED = os.getenv('EMBEDDINGS_ENABLED', 'true').lower() == 'true' and vector_index.np is not None
+EMBEDDING_INDEX_PATH = os.getenv('EMBEDDING_INDEX_PATH', 'data/embeddings')  # Directory of the memory-mapped vectors
+EMBEDDING_BATCH_SIZE = int(os.getenv('EMBEDDING_BATCH_SIZE', 32))
+EMBEDDING_BATCH_WAIT_MS = int(os.getenv('EMBEDDING_BATCH_WAIT_MS', 250))  # Max time a message waits for its batch to fill
+EMBEDDING_MAX_PENDING = int(os.getenv('EMBEDDING_MAX_PENDING', 1000))  # Oldest messages are shed beyond this
+# Retrieval of relevant past messages into AI prompts
+RAG_ENABLED = os.getenv('RAG_ENABLED', 'true').lower() == 'true' and EMBEDDINGS_ENABLED
+RAG_TOP_K = int(os.getenv('RAG_TOP_K', 4))
+RAG_MIN_SCORE = float(os.getenv('RAG_MIN_SCORE', 0.3))  # Minimum cosine similarity for a snippet
+RAG_CONTEXT_CHARS = int(os.getenv('RAG_CONTEXT_CHARS', 1200))  # Prompt budget for retrieved snippets
 MAX_RECONNECT_ATTEMPTS = 5
-HEARTBEAT_INTERVAL = 30
+HEARTBEAT_INTERVAL = int(os.getenv('HEARTBEAT_INTERVAL', 10))  # Seconds between client heartbeats
+HEARTBEAT_TIMEOUT = int(os.getenv('HEARTBEAT_TIMEOUT', HEARTBEAT_INTERVAL * 3))  # Silence before a heartbeating socket counts as dead
+ADMIN_TOKEN = os.getenv('ADMIN_TOKEN')  # /admin/* requires a matching X-Admin-Token header; unset disables them
 
 # In-memory storage with better cleanup
 active_users = {}
+user_sids = {}  # username -> set of sids, the reverse of active_users for addressing users
+client_codecs = {}  # sid -> wire codec negotiated at connect ('json' or 'msgpack')
 chat_history = []
-MAX_HISTORY = 100
-last_cleanup = time.time()
-CLEANUP_INTERVAL = 300  # 5 minutes
->>>>>>> origin/master
+MAX_HISTORY = int(os.getenv('MAX_HISTORY', 100))  # Messages retained in memory
+DEFAULT_ROOM = 'general'  # The single public room; /history accepts it by name
+HISTORY_PAGE_SIZE = int(os.getenv('HISTORY_PAGE_SIZE', 50))
+HISTORY_MAX_PAGE_SIZE = 200
+SEARCH_PAGE_SIZE = 20
+DM_HISTORY = int(os.getenv('DM_HISTORY', 100))  # Messages retained per direct conversation
+DM_MAX_CONVERSATIONS = int(os.getenv('DM_MAX_CONVERSATIONS', 10000))  # Least recently used ones beyond this are dropped
+SEARCH_MAX_PAGE_SIZE = 100
+message_seq = itertools.count(1)  # Server-assigned, monotonically increasing message ids
+# Seqs are only comparable within one server process; clients resume incrementally only within the same epoch
+SERVER_EPOCH = uuid.uuid4().hex
+history_lock = threading.Lock()
+# Seqs in chat_history are contiguous, so a message is found by offset from the oldest one
+history_revision = 0  # Bumped by every edit/delete; ordered like seqs but counted separately
+history_revisions = []  # (rev, seq) of recent edits/deletes, oldest first, for incremental sync
+# Serialized once per change and shared by every recipient
+history_cache = json_codec.SnapshotCache('history_frame')
+history_msgpack_cache = json_codec.SnapshotCache('history_msgpack', serialize=wire_format.pack_messages)
+presence_cache = json_codec.SnapshotCache('presence_frame')
+search_index = SearchIndex()  # Kept in step with chat_history by add_to_history
+direct_messages = DirectMessages(DM_HISTORY, DM_MAX_CONVERSATIONS)  # Never searched, embedded or broadcast
+IDLE_TIMEOUT = int(os.getenv('IDLE_TIMEOUT', 300))  # Seconds without any socket event before a connection is dropped
+IDLE_SWEEP_INTERVAL = float(os.getenv('IDLE_SWEEP_INTERVAL', 10))
+TYPING_SNAPSHOT_INTERVAL = float(os.getenv('TYPING_SNAPSHOT_INTERVAL', 0.5))  # At most one typing snapshot per room this often
+READ_RECEIPT_INTERVAL = float(os.getenv('READ_RECEIPT_INTERVAL', 1))  # Cursor changes are published in batches this often
+TYPING_TIMEOUT = float(os.getenv('TYPING_TIMEOUT', 5))  # A typist silent this long is dropped without typing_stop
+OUTBOUND_BACKLOG_LIMIT = int(os.getenv('OUTBOUND_BACKLOG_LIMIT', 64))  # Unwritten packets before a socket counts as slow
+SHUTDOWN_GRACE_SECONDS = float(os.getenv('SHUTDOWN_GRACE_SECONDS', 20))  # How long SIGTERM waits for in-flight AI answers
+DRAIN_RECONNECT_WINDOW = float(os.getenv('DRAIN_RECONNECT_WINDOW', 10))  # Drained clients reconnect at random points in this window
+OUTBOUND_MAX_PENDING = int(os.getenv('OUTBOUND_MAX_PENDING', 256))  # Held-back events per slow socket before it is cut
+
+# Cached Ollama probe so connects and health checks don't hit Ollama every time
+OLLAMA_HEALTH_TTL = float(os.getenv('OLLAMA_HEALTH_TTL', 10))
+ollama_health_cache = {'available': False, 'checked_at': 0.0}
+ollama_health_lock = threading.Lock()
+
+llm = OllamaProvider(
+    OLLAMA_URLS,
+    failure_threshold=OLLAMA_FAILURE_THRESHOLD,
+    ejection_seconds=OLLAMA_EJECTION_SECONDS
+)
+model_router = ModelRouter(
+    MODEL_NAME,
+    LARGE_MODEL_NAME,
+    long_question_chars=LARGE_MODEL_MIN_CHARS,
+    small_concurrency=MODEL_CONCURRENCY,
+    large_concurrency=LARGE_MODEL_CONCURRENCY
+)
+model_managers = {
+    model: ModelManager(
+        llm,
+        model,
+        keep_alive=OLLAMA_KEEP_ALIVE,
+        rewarm_interval=MODEL_REWARM_INTERVAL,
+        pull_retries=MODEL_PULL_RETRIES,
+        # Pull progress and readiness changes are pushed to every client
+        on_change=lambda status: broadcast('model_status', status, policy=outbound.COALESCE,
+                                           key=('model_status', status['model']))
+    )
+    for model in model_router.models
+}
+model_manager = model_managers[MODEL_NAME]  # The default model gates readiness
+
+embedding_pipeline = None
+message_vectors = None  # seq -> embedding, for any feature that needs message vectors
+retriever = None
+if EMBEDDINGS_ENABLED:
+    try:
+        message_vectors = vector_index.VectorIndex(EMBEDDING_INDEX_PATH, EMBEDDING_MODEL)
+    except OSError as e:
+        # e.g. a volume the app user can't write to; chat still works without vectors
+        logger.warning(f"Cannot open the vector index at {EMBEDDING_INDEX_PATH}: {e}; "
+                       f"running without embeddings or RAG")
+        EMBEDDINGS_ENABLED = RAG_ENABLED = False
+if EMBEDDINGS_ENABLED:
+    model_managers[EMBEDDING_MODEL] = ModelManager(
+        llm,
+        EMBEDDING_MODEL,
+        keep_alive=OLLAMA_KEEP_ALIVE,
+        rewarm_interval=MODEL_REWARM_INTERVAL,
+        pull_retries=MODEL_PULL_RETRIES,
+        on_change=lambda status: broadcast('model_status', status, policy=outbound.COALESCE,
+                                           key=('model_status', status['model'])),
+        embedding=True
+    )
+    embedding_pipeline = EmbeddingPipeline(
+        llm,
+        EMBEDDING_MODEL,
+        batch_size=EMBEDDING_BATCH_SIZE,
+        max_wait=EMBEDDING_BATCH_WAIT_MS / 1000,
+        max_pending=EMBEDDING_MAX_PENDING,
+        ready=model_managers[EMBEDDING_MODEL].is_ready
+    )
+    embedding_pipeline.subscribe(message_vectors.add)
+    # Continue numbering after the messages persisted in the index so seqs stay unique
+    message_seq = itertools.count(message_vectors.max_seq + 1)
+    if RAG_ENABLED:
+        retriever = Retriever(embedding_pipeline, message_vectors)
+
+def disconnect_idle(sid, idle_seconds):
+    """Tell an idle client why, then drop it; handle_disconnect announces the departure"""
+    socketio.emit('idle_disconnect', {'idle_seconds': round(idle_seconds), 'timeout': IDLE_TIMEOUT}, to=sid)
+    socketio.server.disconnect(sid, namespace='/')
+    metrics.IDLE_DISCONNECTS.inc()
+
+def disconnect_dead(sid, silent_seconds):
+    """Drop a connection that stopped heartbeating (likely half-open)"""
+    logger.warning(f"Connection {sid} missed heartbeats for {silent_seconds:.0f}s, evicting")
+    socketio.server.disconnect(sid, namespace='/')
+
+def socket_backlog(sid):
+    """Packets Engine.IO has buffered for a connection but not yet written"""
+    socket = socketio.server.eio.sockets.get(socketio.server.manager.eio_sid_from_sid(sid, '/'))
+    return socket.queue.qsize() if socket else 0
+
+def disconnect_slow(sid, pending):
+    """Close a connection that can't keep up, discarding its buffered packets"""
+    socket = socketio.server.eio.sockets.pop(socketio.server.manager.eio_sid_from_sid(sid, '/'), None)
+    if socket:
+        # Waiting for the backlog to drain is exactly what we can't afford; handle_disconnect still runs
+        socket.close(wait=False, abort=True)
+
+idle_sweeper = IdleSweeper(IDLE_TIMEOUT, IDLE_SWEEP_INTERVAL, on_expire=disconnect_idle)
+heartbeats = HeartbeatTracker(HEARTBEAT_TIMEOUT, interval=max(1, HEARTBEAT_INTERVAL / 2), on_dead=disconnect_dead)
+outbound_queues = outbound.OutboundQueues(
+    socket_backlog,
+    lambda sid, event, data: socketio.emit(event, data, to=sid),
+    backlog_limit=OUTBOUND_BACKLOG_LIMIT,
+    max_pending=OUTBOUND_MAX_PENDING,
+    on_overflow=disconnect_slow
+)
+shutdown = GracefulShutdown()
+typing_tracker = TypingTracker(
+    # Only the newest snapshot matters, so slow consumers get it coalesced
+    lambda room, usernames: broadcast('typing', {'room': room, 'usernames': usernames},
+                                      policy=outbound.COALESCE, key=('typing', room)),
+    interval=TYPING_SNAPSHOT_INTERVAL,
+    timeout=TYPING_TIMEOUT
+)
+read_cursors = ReadCursors(
+    # Receipts are advisory; a slow consumer may miss some rather than hold them all
+    lambda room, cursors: broadcast('read_receipts', {'room': room, 'cursors': cursors}, policy=outbound.DROPPABLE),
+    interval=READ_RECEIPT_INTERVAL
+)
+# Only things a person does count as activity; heartbeats, pings, status polls and automatic
+# read acks would keep an abandoned tab alive forever, and liveness is the heartbeat tracker's job
+ACTIVITY_EVENTS = {
+    'join_chat', 'send_message', 'send_direct_message', 'get_direct_history', 'edit_message',
+    'delete_message', 'get_chat_history', 'search_messages', 'typing_start', 'typing_stop'
+}
+metrics.event_hooks.append(lambda event: event in ACTIVITY_EVENTS and idle_sweeper.touch(request.sid))
+
+def drain_server():
+    """On SIGTERM: warn clients, let AI answers finish, embed what's queued, then drop every connection"""
+    sids = list(active_users)
+    logger.info(f"Draining {len(sids)} connections with {shutdown.jobs} AI requests in flight")
+    for sid in sids:
+        # Spread the reconnects so the instance taking over isn't hit all at once
+        delay = round(random.uniform(1, max(1, DRAIN_RECONNECT_WINDOW)), 1)
+        socketio.emit('server_draining', {'reconnect_delay': delay, 'grace': SHUTDOWN_GRACE_SECONDS}, to=sid)
+    
+    abandoned = shutdown.wait_for_jobs(SHUTDOWN_GRACE_SECONDS)
+    if abandoned:
+        logger.warning(f"{abandoned} AI requests still running after {SHUTDOWN_GRACE_SECONDS}s, abandoning them")
+    if embedding_pipeline:
+        unembedded = embedding_pipeline.drain(timeout=5)
+        if unembedded:
+            logger.warning(f"{unembedded} messages left unembedded at shutdown")
+    
+    for worker in (idle_sweeper, heartbeats, outbound_queues, typing_tracker, read_cursors):
+        worker.stop()
+    outbound_queues.flush()
+    for sid in list(active_users):
+        socketio.server.disconnect(sid, namespace='/')
+
+def retrieval_ready():
+    return retriever is not None and model_managers[EMBEDDING_MODEL].is_ready()
 
 def check_ollama_health():
-    """Check if Ollama service is available"""
+    """Check if at least one Ollama replica is available"""
     try:
-        response = requests.get(f"{OLLAMA_URL}/api/tags", timeout=5)
-        if response.status_code == 200:
+        if llm.check_health():
             logger.info("Ollama service is healthy")
             return True
         else:
-            logger.warning(f"Ollama health check failed with status: {response.status_code}")
+            logger.warning(f"No healthy Ollama replica among: {', '.join(llm.urls)}")
             return False
-    except requests.exceptions.ConnectionError:
-        logger.error("Cannot connect to Ollama service - connection refused")
-        return False
-    except requests.exceptions.Timeout:
-        logger.error("Ollama health check timed out")
-        return False
     except Exception as e:
         logger.error(f"Ollama health check failed: {e}")
         return False
 
-def pull_model_if_needed():
-    """Pull the model if it's not available"""
+def refresh_ollama_health():
+    """Probe Ollama and update the cached availability; skipped while another probe is running"""
+    if not ollama_health_lock.acquire(blocking=False):
+        return
     try:
-        logger.info("Checking if model needs to be pulled...")
+        ollama_health_cache['available'] = check_ollama_health()
+        ollama_health_cache['checked_at'] = time.time()
+    finally:
+        ollama_health_lock.release()
+
+def monitor_ollama_health():
+    """Background loop keeping the cached availability fresh so callers never probe inline"""
+    refresh_ollama_health()
+    while not shutdown.draining.wait(OLLAMA_HEALTH_TTL):
+        refresh_ollama_health()
+
+def get_ollama_available(max_age=OLLAMA_HEALTH_TTL):
+    """The cached Ollama availability, without blocking.
+
+    Probes can take seconds per replica, so a stale value is returned as-is
+    and a refresh is started in the background (normally the monitor thread
+    has already refreshed it).
+    """
+    if time.time() - ollama_health_cache['checked_at'] < max_age:
+        metrics.CACHE_REQUESTS.labels('ollama_health', 'hit').inc()
+    else:
+        metrics.CACHE_REQUESTS.labels('ollama_health', 'miss').inc()
+        if not ollama_health_lock.locked():
+            threading.Thread(target=refresh_ollama_health, daemon=True).start()
+    return ollama_health_cache['available']
+
+def add_to_history(message):
+    """Stamp a message with the next sequence number and append it to the history"""
+    with history_lock:
+        message.seq = next(message_seq)
+        chat_history.append(message)
+        search_index.add(message)
+        if embedding_pipeline and message.type in (MessageType.USER, MessageType.AI):
+            embedding_pipeline.submit(message)
         
-        # Check if model exists
-        response = requests.get(f"{OLLAMA_URL}/api/tags", timeout=10)
-        if response.status_code == 200:
-            models = response.json().get('models', [])
-            model_exists = any(MODEL_NAME in model.get('name', '') for model in models)
-            
-            if not model_exists:
-                logger.info(f"Model {MODEL_NAME} not found. Pulling...")
-                pull_response = requests.post(
-                    f"{OLLAMA_URL}/api/pull",
-                    json={"name": MODEL_NAME},
-                    timeout=300  # 5 minutes timeout for model pull
-                )
-                if pull_response.status_code == 200:
-                    logger.info(f"Successfully pulled model {MODEL_NAME}")
-                else:
-                    logger.error(f"Failed to pull model: {pull_response.text}")
-            else:
-                logger.info(f"Model {MODEL_NAME} is already available")
-        else:
-            logger.error(f"Failed to check available models: {response.status_code}")
-                
-    except Exception as e:
-        logger.error(f"Error checking/pulling model: {e}")
+        # Keep history manageable
+        while len(chat_history) > MAX_HISTORY:
+            search_index.remove(chat_history.pop(0))
+    metrics.MESSAGES_TOTAL.labels(message.type.value).inc()
+    return message
+
+def codec_room(codec):
+    return f"codec:{codec}"
+
+def broadcast(event, data, to=None, policy=outbound.ESSENTIAL, key=None):
+    """Emit to a room (everyone by default); slow connections get the event through their outbound queue"""
+    slow = [sid for sid, _ in socketio.server.manager.get_participants('/', to) if outbound_queues.is_slow(sid)]
+    socketio.emit(event, data, to=to, skip_sid=slow or None)
+    for sid in slow:
+        outbound_queues.enqueue(sid, event, data, policy, key)
+
+def send_to(sid, event, data):
+    """Emit to one connection, through its outbound queue if it is behind"""
+    if outbound_queues.is_slow(sid):
+        outbound_queues.enqueue(sid, event, data)
+    else:
+        socketio.emit(event, data, to=sid)
+
+def broadcast_message(message, event='new_message'):
+    """Emit a message to every connected client, timing the fan-out"""
+    with metrics.BROADCAST_SECONDS.time():
+        wire = message.to_wire()
+        if wire_format.MSGPACK not in client_codecs.values():
+            broadcast(event, wire)
+            return
+        # Each codec room gets one encoding of the message
+        broadcast(event, wire, to=codec_room(wire_format.JSON))
+        broadcast(event, wire_format.pack_messages([wire]), to=codec_room(wire_format.MSGPACK))
 
-def get_ai_response(message, context=""):
-    """Enhanced AI response function with better error handling"""
+def emit_message(message):
+    """Send one message to the current client only, in its negotiated codec"""
+    if client_codecs.get(request.sid) == wire_format.MSGPACK:
+        emit('new_message', wire_format.pack_messages([message.to_wire()]))
+    else:
+        emit('new_message', message.to_wire())
+
+def emit_messages(event, messages):
+    """Send a list of messages to the current client in its negotiated codec"""
+    wires = [message.to_wire() for message in messages]
+    if client_codecs.get(request.sid) == wire_format.MSGPACK:
+        emit(event, wire_format.pack_messages(wires))
+    else:
+        emit(event, wires)
+
+def history_frame(codec=wire_format.JSON):
+    """The full chat history as a pre-serialized frame in the given codec"""
+    cache = history_msgpack_cache if codec == wire_format.MSGPACK else history_cache
+    with history_lock:
+        key = (chat_history[-1].seq if chat_history else 0, len(chat_history), history_revision)
+        return cache.get(key, lambda: [msg.to_wire() for msg in chat_history])
+
+def presence_frame():
+    """The active usernames as a pre-serialized frame"""
+    usernames = tuple(sorted(set(u.get('username') for u in list(active_users.values()) if u.get('username'))))
+    return presence_cache.get(usernames, lambda: list(usernames))
+
+def history_bounds():
+    """(latest seq, oldest retained seq) of the chat history"""
+    with history_lock:
+        if not chat_history:
+            return 0, 1
+        return chat_history[-1].seq, chat_history[0].seq
+
+def unread_count(username, room=DEFAULT_ROOM):
+    return read_cursors.unread(room, username, *history_bounds())
+
+def history_message(seq):
+    """The retained message with this seq, in O(1); call with history_lock held"""
+    if not chat_history or not isinstance(seq, int):
+        return None
+    index = seq - chat_history[0].seq
+    if 0 <= index < len(chat_history):
+        return chat_history[index]
+    return None
+
+def revise_message(username, seq, text=None):
+    """Edit (text) or delete (text=None) one of username's messages; returns (message, error)"""
+    global history_revision
+    with history_lock:
+        message = history_message(seq)
+        if message is None:
+            return None, 'Message not found or too old to change'
+        if message.type is not MessageType.USER or message.username != username:
+            return None, 'You can only change your own messages'
+        if message.deleted:
+            return None, 'Message was deleted'
+        
+        old_text = message.message
+        if text is None:
+            search_index.remove(message)  # Needs the text it was indexed with
+        history_revision += 1
+        message.revise(history_revision, text)
+        if text is not None:
+            search_index.update(message, old_text)
+        history_revisions.append((history_revision, seq))
+        if len(history_revisions) > MAX_HISTORY:
+            history_revisions.pop(0)
+    
+    if message_vectors is not None:
+        message_vectors.remove(seq)
+        if text is not None:
+            embedding_pipeline.submit(message)
+    return message, None
+
+def get_history_since(last_seq, last_rev=None):
+    """Messages newer than last_seq plus older ones revised after last_rev, or None if a full resync is needed"""
+    with history_lock:
+        latest_seq = chat_history[-1].seq if chat_history else 0
+        # Ahead of us means the client's seqs came from another history
+        if last_seq > latest_seq or (last_rev or 0) > history_revision:
+            return None
+        if chat_history and chat_history[0].seq > last_seq + 1:
+            return None
+        missed = [msg for msg in chat_history if msg.seq > last_seq]
+        if last_rev is None or last_rev == history_revision:
+            return missed
+        # The revision log must still reach back to last_rev
+        if not history_revisions or history_revisions[0][0] > last_rev + 1:
+            return None
+        start = bisect.bisect_right(history_revisions, last_rev, key=lambda entry: entry[0])
+        seqs = sorted({seq for _, seq in history_revisions[start:] if seq <= last_seq})
+        revised = [msg for msg in map(history_message, seqs) if msg is not None]
+        return revised + missed
+
+def get_history_page(before_seq=None, limit=HISTORY_PAGE_SIZE):
+    """Up to `limit` messages older than before_seq (newest page when None), oldest first"""
+    with history_lock:
+        end = len(chat_history) if before_seq is None else bisect.bisect_left(chat_history, before_seq, key=lambda msg: msg.seq)
+        start = max(0, end - limit)
+        return chat_history[start:end], start > 0
+
+def parse_search_params(params):
+    """Validate search arguments from a socket payload or query string; raises ValueError"""
+    query = str(params.get('q') or '').strip()
+    if not query:
+        raise ValueError('q is required')
+    limit = int(params.get('limit') or SEARCH_PAGE_SIZE)
+    if not 1 <= limit <= SEARCH_MAX_PAGE_SIZE:
+        raise ValueError(f'limit must be between 1 and {SEARCH_MAX_PAGE_SIZE}')
+    optional = lambda key, cast: cast(params[key]) if params.get(key) not in (None, '') else None
+    return {
+        'query': query,
+        'username': optional('username', str),
+        'since': optional('since', float),
+        'until': optional('until', float),
+        'before_seq': optional('before_seq', int),
+        'limit': limit
+    }
+
+def search_messages(params):
+    """Run a search and build the result page shared by the socket event and HTTP endpoint"""
+    with metrics.SEARCH_SECONDS.time():
+        results, has_more = search_index.search(**params)
+    return {
+        'query': params['query'],
+        'results': [msg.to_wire() for msg in results],
+        'has_more': has_more,
+        'next_before_seq': results[-1].seq if has_more else None
+    }
+
+def select_model(message):
+    """Route a message to a model, falling back to the default while the chosen one is cold"""
+    model = model_router.choose(message)
+    if model != MODEL_NAME and not model_managers[model].is_ready() and model_manager.is_ready():
+        logger.info(f"Model {model} not ready yet, answering with {MODEL_NAME}")
+        return MODEL_NAME
+    return model
+
+def get_ai_response(message, context="", model=MODEL_NAME, retrieved=""):
+    """The model's answer; raises LLMError with a user-facing message when it can't get one"""
+    if not get_ollama_available():
+        raise LLMError("❌ AI service is currently unavailable. Please try again later.")
     try:
-        if not check_ollama_health():
-            return "❌ AI service is currently unavailable. Please try again later."
         
         # Prepare a more structured prompt
         system_prompt = "You are a helpful AI assistant in a group chat. Keep responses concise, friendly, and under 200 words."
         
+        if retrieved:
+            system_prompt += f"\n\nRelevant earlier messages:\n{retrieved}"
+        
         if context:
             prompt = f"{system_prompt}\n\nRecent conversation:\n{context}\n\nUser question: {message}\n\nAssistant:"
         else:
             prompt = f"{system_prompt}\n\nUser: {message}\nAssistant:"
         
-        logger.info(f"Sending prompt to Ollama (first 100 chars): {prompt[:100]}...")
+        logger.info(f"Sending prompt to Ollama ({model}, first 100 chars): {prompt[:100]}...")
         
-        response = requests.post(
-            f"{OLLAMA_URL}/api/generate",
+        request_start = time.perf_counter()
+        response = llm.post(
+            '/api/generate',
             json={
-                "model": MODEL_NAME,
+                "model": model,
                 "prompt": prompt,
                 "stream": False,
+                "keep_alive": OLLAMA_KEEP_ALIVE,
                 "options": {
                     "temperature": 0.7,
                     "top_p": 0.9,
@@ -130,10 +526,16 @@ def get_ai_response(message, context=""):
             timeout=45  # Increased timeout
         )
         
+        metrics.OLLAMA_REQUEST_SECONDS.labels(model).observe(time.perf_counter() - request_start)
         logger.info(f"Ollama response status: {response.status_code}")
         
         if response.status_code == 200:
             result = response.json()
+            
+            # Ollama reports durations in nanoseconds; load + prompt eval is the time to first token
+            if 'prompt_eval_duration' in result:
+                first_token_ns = result.get('load_duration', 0) + result['prompt_eval_duration']
+                metrics.OLLAMA_FIRST_TOKEN_SECONDS.labels(model).observe(first_token_ns / 1e9)
             ai_text = result.get('response', 'No response generated').strip()
             
             if not ai_text:
@@ -151,98 +553,183 @@ def get_ai_response(message, context=""):
             return ai_text
         else:
             logger.error(f"Ollama API error: {response.status_code} - {response.text}")
-            return f"❌ Sorry, I couldn't process your request (Error: {response.status_code})"
+            raise LLMError(f"❌ Sorry, I couldn't process your request (Error: {response.status_code})")
             
     except requests.exceptions.Timeout:
         logger.error("AI request timed out")
-        return "⏱️ Sorry, that request took too long. Please try again!"
+        raise LLMError("⏱️ Sorry, that request took too long. Please try again!")
     except requests.exceptions.ConnectionError:
         logger.error("Cannot connect to Ollama service")
-        return "❌ AI service is currently unavailable. Please check if Ollama is running."
+        raise LLMError("❌ AI service is currently unavailable. Please check if Ollama is running.")
+    except LLMError:
+        raise
     except Exception as e:
         logger.error(f"AI response error: {e}")
-        return f"❌ Something went wrong: {str(e)}"
+        raise LLMError(f"❌ Something went wrong: {str(e)}") from e
+
+@app.route('/livez')
+def liveness_check():
+    """Lightweight liveness endpoint - never touches Ollama"""
+    return {
+        'status': 'alive',
+        'timestamp': time.time()
+    }, 200
+
+@app.route('/readyz')
+def readiness_check():
+    """Readiness: the model is loaded and warm on at least one replica, and we're not shutting down"""
+    if shutdown.draining.is_set():
+        return {'status': 'draining', 'model': MODEL_NAME, 'timestamp': time.time()}, 503
+    if model_manager.is_ready():
+        return {'status': 'ready', 'model': MODEL_NAME, 'timestamp': time.time()}, 200
+    return {'status': 'warming', 'model': MODEL_NAME, 'timestamp': time.time()}, 503
 
 @app.route('/health')
 def health_check():
-    """Health check endpoint"""
-    ollama_status = check_ollama_health()
+    """Deep health (readiness) check including Ollama"""
+    ollama_status = get_ollama_available()
     return {
         'status': 'healthy',
         'timestamp': datetime.now().isoformat(),
         'ollama_available': ollama_status,
         'active_users': len(active_users),
+        'tracked_connections': len(idle_sweeper),
+        'direct_messages': direct_messages.stats(),
+        'outbound': outbound_queues.status(),
         'chat_history_size': len(chat_history),
         'model': MODEL_NAME,
-        'ollama_url': OLLAMA_URL
+        'ollama_urls': llm.urls,
+        'ollama_replicas': llm.status()['replicas'],
+        'model_ready': model_manager.is_ready(),
+        'model_routing': model_router.status(),
+        'embeddings': dict(embedding_pipeline.status(), index=message_vectors.stats()) if embedding_pipeline else None,
+        'rag_enabled': retriever is not None,
+        'model_status': {model: manager.status() for model, manager in model_managers.items()}
     }, 200
 
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus scrape endpoint"""
+    body, content_type = metrics.render_metrics()
+    return Response(body, content_type=content_type)
+
+def is_admin_request():
+    """Check the admin token for /admin/* endpoints; without ADMIN_TOKEN configured nobody is admin"""
+    if not ADMIN_TOKEN:
+        return False
+    return hmac.compare_digest(request.headers.get('X-Admin-Token', '').encode(), ADMIN_TOKEN.encode())
+
+@app.route('/admin/events')
+def admin_event_stats():
+    """Rolling per-event handler latency and payload aggregates"""
+    if not is_admin_request():
+        return {'error': 'Forbidden'}, 403
+    return {
+        'slow_threshold_ms': metrics.SLOW_EVENT_THRESHOLD * 1000,
+        'events': metrics.get_event_stats(),
+        'timestamp': time.time()
+    }, 200
+
+@app.route('/history')
+def history_page():
+    """Paginated scrollback with strong ETags so proxies and clients can cache and revalidate pages"""
+    room = request.args.get('room', DEFAULT_ROOM)
+    if room != DEFAULT_ROOM:
+        return {'error': f'Unknown room: {room}'}, 404
+    try:
+        before_seq = request.args.get('before_seq')
+        before_seq = int(before_seq) if before_seq is not None else None
+        limit = int(request.args.get('limit', HISTORY_PAGE_SIZE))
+    except ValueError:
+        return {'error': 'before_seq and limit must be integers'}, 400
+    if not 1 <= limit <= HISTORY_MAX_PAGE_SIZE:
+        return {'error': f'limit must be between 1 and {HISTORY_MAX_PAGE_SIZE}'}, 400
+    
+    page, has_more = get_history_page(before_seq, limit)
+    messages = [msg.to_wire() for msg in page]
+    response = app.json.response({
+        'room': room,
+        'messages': messages,
+        'has_more': has_more,
+        'next_before_seq': messages[0]['seq'] if has_more and messages else None
+    })
+    response.set_etag(hashlib.sha1(response.get_data()).hexdigest())
+    # Shared caches may keep pages, but an edit or delete can change any of them, so they
+    # revalidate every time; the ETag covers the page content, so a 304 is cheap
+    response.headers['Cache-Control'] = 'public, no-cache'
+    return response.make_conditional(request)
+
+@app.route('/search')
+def search_endpoint():
+    """Full-text search over the retained history: ?q=&username=&since=&until=&before_seq=&limit="""
+    try:
+        params = parse_search_params(request.args)
+    except (TypeError, ValueError) as e:
+        return {'error': str(e)}, 400
+    return search_messages(params), 200
+
+@app.route('/admin/connections')
+def admin_connections():
+    """Per-connection heartbeat RTT and liveness"""
+    if not is_admin_request():
+        return {'error': 'Forbidden'}, 403
+    return dict(heartbeats.status(), heartbeat_interval=HEARTBEAT_INTERVAL,
+                heartbeat_timeout=HEARTBEAT_TIMEOUT, timestamp=time.time()), 200
+
 @app.route('/')
 def index():
     """Basic index endpoint"""
     return {
         'message': 'Enhanced Chat Backend API with AI Integration',
         'version': '2.0',
-        'endpoints': ['/health'],
+        'endpoints': ['/health', '/livez', '/readyz', '/metrics', '/history', '/search', '/admin/events', '/admin/connections'],
         'socketio': 'enabled',
         'ai_integration': 'ollama',
         'model': MODEL_NAME
     }
 
 @socketio.on('connect')
-def handle_connect():
-<<<<<<< HEAD
-    """Handle client connection"""
-    logger.info(f"Client connected: {request.sid}")
-    emit('connect_response', {
-        'status': 'connected',
-        'sid': request.sid,
-        'ai_available': check_ollama_health()
-    })
-
-@socketio.on('disconnect')
-def handle_disconnect():
-    """Handle client disconnection"""
-    logger.info(f"Client disconnected: {request.sid}")
-    
-    # Remove user from active users
-    username = active_users.pop(request.sid, None)
-    if username:
-        logger.info(f"User {username} left the chat")
-        
-        # Notify other users about updated user list
-        socketio.emit('active_users', list(set(active_users.values())))
-=======
+@metrics.observe_event('connect')
+def handle_connect(auth=None):
     """Enhanced connection handling"""
+    if shutdown.draining.is_set():
+        return False  # Refused; the client retries against another instance
     try:
         logger.info(f"Client connected: {request.sid}")
+        metrics.CONNECTED_SOCKETS.inc()
+        # Clients may ask for compact MessagePack message payloads via the connect auth
+        codec = wire_format.negotiate((auth or {}).get('codec') if isinstance(auth, dict) else None)
+        client_codecs[request.sid] = codec
+        join_room(codec_room(codec))
         # Initialize user data
-        active_users[request.sid] = {
-            'username': None,
-            'last_activity': time.time()
-        }
+        active_users[request.sid] = {'username': None}
+        idle_sweeper.track(request.sid)
         
         # Send connection response with more details
         emit('connect_response', {
             'status': 'connected',
             'sid': request.sid,
-            'ai_available': check_ollama_health(),
+            'codec': codec,
+            'codecs': wire_format.supported_codecs(),
+            'ai_available': get_ollama_available() and model_manager.is_ready(),
+            'model_status': [manager.status() for manager in model_managers.values()],
             'server_time': time.time(),
+            'heartbeat_interval': HEARTBEAT_INTERVAL,
+            'epoch': SERVER_EPOCH,
             'active_users_count': len(active_users)
         })
         
-        # Start periodic cleanup
-        cleanup_inactive_users()
-        
     except Exception as e:
         logger.error(f"Error in handle_connect: {e}")
         emit('error', {'message': 'Connection error occurred'})
 
 @socketio.on('disconnect')
+@metrics.observe_event('disconnect')
 def handle_disconnect():
     """Enhanced disconnection handling"""
     try:
         logger.info(f"Client disconnected: {request.sid}")
+        metrics.CONNECTED_SOCKETS.dec()
         
         # Get username before removing
         user_data = active_users.get(request.sid, {})
@@ -251,32 +738,52 @@ def handle_disconnect():
         # Remove user from active users
         if request.sid in active_users:
             del active_users[request.sid]
+        if username:
+            forget_user_sid(username, request.sid)
+        client_codecs.pop(request.sid, None)
+        idle_sweeper.forget(request.sid)
+        heartbeats.forget(request.sid)
+        outbound_queues.forget(request.sid)
         
         if username:
+            typing_tracker.forget(username)
+        # While draining everyone leaves at once; announcing each departure would be n² noise
+        if username and not shutdown.draining.is_set():
             logger.info(f"User {username} left the chat")
             
             # Notify other users about updated user list
-            socketio.emit('active_users', list(set(u.get('username') for u in active_users.values() if u.get('username'))))
+            broadcast('active_users', presence_frame(), policy=outbound.COALESCE)
             
             # Add system message
-            system_message = {
-                'username': 'System',
-                'message': f'👋 {username} left the chat',
-                'timestamp': time.time(),
-                'type': 'system'
-            }
-            chat_history.append(system_message)
-            
-            # Keep history manageable
-            if len(chat_history) > MAX_HISTORY:
-                chat_history.pop(0)
+            system_message = make_message(f'👋 {username} left the chat', MessageType.SYSTEM)
+            add_to_history(system_message)
             
-            socketio.emit('new_message', system_message)
+            broadcast_message(system_message)
             
     except Exception as e:
         logger.error(f"Error in handle_disconnect: {e}")
 
+def forget_user_sid(username, sid):
+    sids = user_sids.get(username)
+    if sids is not None:
+        sids.discard(sid)
+        if not sids:
+            del user_sids[username]
+
+def release_username(username, sid):
+    """Take a username back from a connection its client replaced (e.g. after a network drop)
+
+    The old connection loses its user first, so closing it announces no departure.
+    """
+    active_users.pop(sid, None)
+    forget_user_sid(username, sid)
+    typing_tracker.forget(username)
+    logger.info(f"User {username} resumed on a new connection, dropping {sid}")
+    if socketio.server.manager.is_connected(sid, '/'):
+        socketio.server.disconnect(sid, namespace='/')
+
 @socketio.on('join_chat')
+@metrics.observe_event('join_chat')
 def handle_join_chat(data):
     """Enhanced join chat handling with better validation"""
     try:
@@ -290,109 +797,64 @@ def handle_join_chat(data):
             emit('error', {'message': 'Username too long (max 50 characters)'})
             return
         
-        # Check if username is already taken
-        if any(u.get('username') == username for u in active_users.values()):
+        # Check if username is already taken, reclaiming it from this user's own dead connections
+        holders = user_sids.get(username, set()) - {request.sid}
+        for sid in list(holders):
+            if sid == data.get('previous_sid') or not socketio.server.manager.is_connected(sid, '/'):
+                release_username(username, sid)
+                holders.discard(sid)
+        if holders:
             emit('error', {'message': 'Username already taken'})
             return
         
         # Update user data
-        active_users[request.sid] = {
-            'username': username,
-            'last_activity': time.time()
-        }
+        previous = active_users.get(request.sid, {}).get('username')
+        if previous:
+            forget_user_sid(previous, request.sid)
+        active_users[request.sid] = {'username': username}
+        user_sids.setdefault(username, set()).add(request.sid)
         
         logger.info(f"User {username} joined chat (SID: {request.sid})")
         
-        # Send chat history to new user
-        emit('chat_history', chat_history)
+        # Send chat history to new user, or only what was missed when resuming
+        last_seq = data.get('last_seq')
+        last_rev = data.get('last_rev')
+        missed = None
+        if isinstance(last_seq, int) and data.get('epoch') == SERVER_EPOCH:
+            missed = get_history_since(last_seq, last_rev if isinstance(last_rev, int) else None)
+        if missed is not None:
+            emit_messages('chat_history_delta', missed)
+        else:
+            emit('chat_history', history_frame(client_codecs.get(request.sid, wire_format.JSON)))
         
         # Send updated active users list to all clients
-        socketio.emit('active_users', list(set(u.get('username') for u in active_users.values() if u.get('username'))))
->>>>>>> origin/master
+        broadcast('active_users', presence_frame(), policy=outbound.COALESCE)
         
         # Add system message
-        system_message = {
-            'username': 'System',
-<<<<<<< HEAD
-            'message': f'👋 {username} left the chat',
-=======
-            'message': f'🎉 {username} joined the chat',
->>>>>>> origin/master
-            'timestamp': time.time(),
-            'type': 'system'
-        }
-        chat_history.append(system_message)
+        system_message = make_message(f'🎉 {username} joined the chat', MessageType.SYSTEM)
+        add_to_history(system_message)
         
-        # Keep history manageable
-        if len(chat_history) > MAX_HISTORY:
-            chat_history.pop(0)
-        
-<<<<<<< HEAD
-        socketio.emit('new_message', system_message)
-
-@socketio.on('join_chat')
-def handle_join_chat(data):
-    """Handle user joining chat with validation"""
-    username = data.get('username', '').strip()
-    
-    if not username:
-        emit('error', {'message': 'Username is required'})
-        return
-    
-    if len(username) > 50:
-        emit('error', {'message': 'Username too long (max 50 characters)'})
-        return
-    
-    # Check if username is already taken
-    if username in active_users.values():
-        emit('error', {'message': 'Username already taken'})
-        return
-    
-    # Add user to active users
-    active_users[request.sid] = username
-    
-    logger.info(f"User {username} joined chat (SID: {request.sid})")
-    
-    # Send chat history to new user
-    emit('chat_history', chat_history)
-    
-    # Send updated active users list to all clients
-    socketio.emit('active_users', list(set(active_users.values())))
-    
-    # Add system message
-    system_message = {
-        'username': 'System',
-        'message': f'🎉 {username} joined the chat',
-        'timestamp': time.time(),
-        'type': 'system'
-    }
-    chat_history.append(system_message)
-    
-    # Keep history manageable
-    if len(chat_history) > MAX_HISTORY:
-        chat_history.pop(0)
-    
-    # Broadcast system message to all clients
-    socketio.emit('new_message', system_message)
-    
-    # Send success confirmation to the joining user
-    emit('join_success', {'username': username})
-=======
         # Broadcast system message to all clients
-        socketio.emit('new_message', system_message)
+        broadcast_message(system_message)
         
-        # Send success confirmation to the joining user
-        emit('join_success', {'username': username})
+        # Send success confirmation to the joining user, with where they left off reading
+        emit('join_success', {
+            'username': username,
+            'epoch': SERVER_EPOCH,
+            'read_seq': read_cursors.cursor(DEFAULT_ROOM, username),
+            'unread': unread_count(username)
+        })
+        emit('read_receipts', {'room': DEFAULT_ROOM, 'cursors': read_cursors.snapshot(DEFAULT_ROOM)})
         
     except Exception as e:
         logger.error(f"Error in handle_join_chat: {e}")
         emit('error', {'message': 'An error occurred while joining the chat'})
->>>>>>> origin/master
 
 @socketio.on('send_message')
+@metrics.observe_event('send_message')
 def handle_send_message(data):
     """Handle message sending with improved AI detection"""
-    username = active_users.get(request.sid)
+    username = active_users.get(request.sid, {}).get('username')
     if not username:
         emit('error', {'message': 'Not logged in'})
         return
@@ -406,23 +868,23 @@ def handle_send_message(data):
         emit('error', {'message': 'Message too long (max 1000 characters)'})
         return
     
+    # Sending ends typing without waiting for the client's typing_stop
+    typing_tracker.stop_typing(DEFAULT_ROOM, username)
+    
     # Create message object
-    user_message = {
-        'username': username,
-        'message': message,
-        'timestamp': time.time(),
-        'type': 'user'
-    }
+    user_message = make_message(message, username=username)
     
     # Add to history
-    chat_history.append(user_message)
+    add_to_history(user_message)
+    # Writing a message implies having read everything before it
+    read_cursors.ack(DEFAULT_ROOM, username, user_message.seq)
     
     # Broadcast message to all clients
-    socketio.emit('new_message', user_message)
+    broadcast_message(user_message)
     
     # Improved AI detection - more flexible triggers
     message_lower = message.lower()
-    ai_triggers = ['@ai', '@bot', 'ai:', 'bot:', 'hey ai', 'ask ai', 'ai please', 'ai help']
+    ai_triggers = [LARGE_TAG, SMALL_TAG, '@ai', '@bot', 'ai:', 'bot:', 'hey ai', 'ask ai', 'ai please', 'ai help']
     is_ai_request = any(trigger in message_lower for trigger in ai_triggers)
     
     # Also trigger AI if message is a question and mentions AI-related terms
@@ -430,24 +892,29 @@ def handle_send_message(data):
     ai_mentions = ['artificial intelligence', 'machine learning', 'algorithm']
     is_ai_question = any(q in message_lower for q in question_indicators) and any(ai in message_lower for ai in ai_mentions)
     
-    if is_ai_request or is_ai_question:
-        logger.info(f"AI request detected from {username}: {message[:100]}...")
+    model = select_model(message) if is_ai_request or is_ai_question else None
+    if model and shutdown.draining.is_set():
+        emit_message(make_message('🔄 The server is restarting. Please ask again in a moment.', MessageType.SYSTEM))
+    elif model and not model_managers[model].is_ready():
+        # AI is gated until the model is pulled and warm; tell only the sender
+        emit_message(make_message(
+            f'⏳ The AI model is still loading ({model_managers[model].progress():.0f}% downloaded). Please try again shortly.',
+            MessageType.SYSTEM
+        ))
+    elif model:
+        logger.info(f"AI request detected from {username} for {model}: {message[:100]}...")
         
         # Send immediate acknowledgment
-        ack_message = {
-            'username': 'System',
-            'message': '🤖 AI is thinking...',
-            'timestamp': time.time(),
-            'type': 'system'
-        }
-        socketio.emit('new_message', ack_message)
+        ack_message = make_message('🤖 AI is thinking...', MessageType.SYSTEM)
+        broadcast_message(ack_message)
         
         # Process AI request in background thread
         def process_ai_request():
             try:
                 # Get recent context (last 5 messages excluding system messages)
-                context_messages = [msg for msg in chat_history[-6:-1] if msg['type'] not in ['system', 'error']][-5:]
-                context = "\n".join([f"{msg['username']}: {msg['message']}" 
+                context_messages = [msg for msg in chat_history[-6:-1]
+                                    if msg.type not in (MessageType.SYSTEM, MessageType.ERROR) and not msg.deleted][-5:]
+                context = "\n".join([f"{msg.username}: {msg.message}" 
                                    for msg in context_messages])
                 
                 # Clean the message for AI (remove trigger words)
@@ -461,60 +928,234 @@ def handle_send_message(data):
                 if not clean_message:
                     clean_message = "Hello! How can I help you?"
                 
-                logger.info(f"Sending to AI: {clean_message[:100]}...")
+                # Pull in older messages relevant to the question, within the prompt budget
+                retrieved = ""
+                if retrieval_ready():
+                    recent_seqs = {msg.seq for msg in chat_history[-6:]}
+                    results = retriever.retrieve(clean_message, RAG_TOP_K, RAG_MIN_SCORE, exclude_seqs=recent_seqs)
+                    retrieved = format_snippets(results, RAG_CONTEXT_CHARS)
+                
+                logger.info(f"Sending to AI: {clean_message[:100]}... ({len(retrieved)} chars retrieved)")
                 
-                # Get AI response
-                ai_response = get_ai_response(clean_message, context)
+                # Get AI response, waiting for a free slot on the routed model
+                try:
+                    with model_router.slot(model, timeout=MODEL_QUEUE_TIMEOUT):
+                        ai_response = get_ai_response(clean_message, context, model, retrieved)
+                except ModelBusyError:
+                    logger.warning(f"Model {model} stayed busy for {MODEL_QUEUE_TIMEOUT}s")
+                    ai_response = "⏳ The AI assistant is busy with other questions. Please try again in a moment."
+                except LLMError as e:
+                    # Counted as an error by the slot; the user still gets an answer explaining it
+                    ai_response = str(e)
                 
                 logger.info(f"AI responded (first 100 chars): {ai_response[:100]}...")
                 
                 # Create AI message
-                ai_message = {
-                    'username': 'AI Assistant',
-                    'message': ai_response,
-                    'timestamp': time.time(),
-                    'type': 'ai'
-                }
+                ai_message = make_message(ai_response, MessageType.AI, model=model)
                 
                 # Add to history
-                chat_history.append(ai_message)
-                
-                # Keep history manageable
-                if len(chat_history) > MAX_HISTORY:
-                    chat_history.pop(0)
+                add_to_history(ai_message)
                 
                 # Broadcast AI response
-                socketio.emit('new_message', ai_message)
+                broadcast_message(ai_message)
                 logger.info("AI response broadcasted successfully")
                 
             except Exception as e:
                 logger.error(f"AI processing error: {e}")
-                error_message = {
-                    'username': 'System',
-                    'message': f'❌ Sorry, the AI assistant encountered an error: {str(e)[:100]}',
-                    'timestamp': time.time(),
-                    'type': 'error'
-                }
-                socketio.emit('new_message', error_message)
+                error_message = make_message(
+                    f'❌ Sorry, the AI assistant encountered an error: {str(e)[:100]}',
+                    MessageType.ERROR
+                )
+                broadcast_message(error_message)
+            finally:
+                metrics.AI_QUEUE_DEPTH.dec()
         
         # Start AI processing in background
-        threading.Thread(target=process_ai_request, daemon=True).start()
+        metrics.AI_QUEUE_DEPTH.inc()
+        shutdown.spawn(process_ai_request)
+
+@socketio.on('send_direct_message')
+@metrics.observe_event('send_direct_message')
+def handle_send_direct_message(data):
+    """Deliver a private message to one user's connections only"""
+    username = active_users.get(request.sid, {}).get('username')
+    if not username:
+        emit('error', {'message': 'Not logged in'})
+        return
+    
+    recipient = str(data.get('to') or '').strip()
+    message = (data.get('message') or '').strip()
+    if not message:
+        return
+    if len(message) > 1000:
+        emit('error', {'message': 'Message too long (max 1000 characters)'})
+        return
+    if recipient == username:
+        emit('error', {'message': 'You cannot message yourself'})
+        return
+    # Resolved through the presence registry; nothing reaches the global fan-out
+    recipient_sids = list(user_sids.get(recipient, ()))
+    if not recipient_sids:
+        emit('error', {'message': f'User {recipient} is not online'})
+        return
     
-    # Keep history manageable
-    if len(chat_history) > MAX_HISTORY:
-        chat_history.pop(0)
+    direct_message = direct_messages.add(make_message(message, username=username, to=recipient))
+    wire = direct_message.to_wire()
+    # The sender's own connections get it too, as confirmation and for their other tabs
+    for sid in recipient_sids + list(user_sids.get(username, ())):
+        send_to(sid, 'direct_message', wire)
+
+@socketio.on('get_direct_history')
+@metrics.observe_event('get_direct_history')
+def handle_get_direct_history(data):
+    """A page of the conversation between the user and data['with'], oldest first"""
+    username = active_users.get(request.sid, {}).get('username')
+    if not username:
+        emit('error', {'message': 'Not logged in'})
+        return
+    
+    other = str(data.get('with') or '').strip()
+    try:
+        before_seq = int(data['before_seq']) if data.get('before_seq') is not None else None
+        limit = int(data.get('limit') or HISTORY_PAGE_SIZE)
+    except (TypeError, ValueError):
+        emit('error', {'message': 'before_seq and limit must be integers'})
+        return
+    if not other or not 1 <= limit <= HISTORY_MAX_PAGE_SIZE:
+        emit('error', {'message': f'with is required and limit must be between 1 and {HISTORY_MAX_PAGE_SIZE}'})
+        return
+    
+    messages, has_more = direct_messages.history(username, other, before_seq, limit)
+    emit('direct_history', {
+        'with': other,
+        'messages': [msg.to_wire() for msg in messages],
+        'has_more': has_more,
+        'next_before_seq': messages[0].extras['dm_seq'] if has_more else None
+    })
+
+@socketio.on('edit_message')
+@metrics.observe_event('edit_message')
+def handle_edit_message(data):
+    """Replace the text of one of the user's own messages"""
+    username = active_users.get(request.sid, {}).get('username')
+    if not username:
+        emit('error', {'message': 'Not logged in'})
+        return
+    
+    text = (data.get('message') or '').strip()
+    if not text:
+        emit('error', {'message': 'Message cannot be empty; use delete_message instead'})
+        return
+    if len(text) > 1000:
+        emit('error', {'message': 'Message too long (max 1000 characters)'})
+        return
+    
+    message, error = revise_message(username, data.get('seq'), text)
+    if error:
+        emit('error', {'message': error})
+        return
+    broadcast_message(message, 'message_updated')
+
+@socketio.on('delete_message')
+@metrics.observe_event('delete_message')
+def handle_delete_message(data):
+    """Replace one of the user's own messages with a tombstone"""
+    username = active_users.get(request.sid, {}).get('username')
+    if not username:
+        emit('error', {'message': 'Not logged in'})
+        return
+    
+    message, error = revise_message(username, data.get('seq'))
+    if error:
+        emit('error', {'message': error})
+        return
+    broadcast_message(message, 'message_updated')
 
 @socketio.on('get_active_users')
+@metrics.observe_event('get_active_users')
 def handle_get_active_users():
     """Handle request for active users"""
-    emit('active_users', list(set(active_users.values())))
+    emit('active_users', presence_frame())
 
 @socketio.on('get_chat_history')
+@metrics.observe_event('get_chat_history')
 def handle_get_chat_history():
     """Handle request for chat history"""
-    emit('chat_history', chat_history)
+    emit('chat_history', history_frame(client_codecs.get(request.sid, wire_format.JSON)))
+
+@socketio.on('search_messages')
+@metrics.observe_event('search_messages')
+def handle_search_messages(data):
+    """Handle a full-text search over the chat history"""
+    try:
+        params = parse_search_params(data if isinstance(data, dict) else {})
+    except (TypeError, ValueError) as e:
+        emit('error', {'message': f'Invalid search: {e}'})
+        return
+    emit('search_results', search_messages(params))
+
+@socketio.on('get_model_status')
+@metrics.observe_event('get_model_status')
+def handle_get_model_status():
+    """Handle request for model pull/readiness status"""
+    for manager in model_managers.values():
+        emit('model_status', manager.status())
+
+@socketio.on('heartbeat')
+@metrics.observe_event('heartbeat')
+def handle_heartbeat(data=None):
+    """Record a heartbeat and the RTT the client measured for its previous one; the return value is the ack"""
+    heartbeats.record(request.sid, data.get('rtt_ms') if isinstance(data, dict) else None)
+    return {'server_time': time.time(), 'interval': HEARTBEAT_INTERVAL}
+
+def event_room(data):
+    """The room a typing event refers to, or None (after telling the client) if it can't use it"""
+    if not active_users.get(request.sid, {}).get('username'):
+        emit('error', {'message': 'Not logged in'})
+        return None
+    room = (data or {}).get('room', DEFAULT_ROOM) if isinstance(data, dict) else DEFAULT_ROOM
+    if room != DEFAULT_ROOM:
+        emit('error', {'message': f'Unknown room: {room}'})
+        return None
+    return room
+
+@socketio.on('typing_start')
+@metrics.observe_event('typing_start')
+def handle_typing_start(data=None):
+    """Mark the user as typing; repeat every few seconds while typing continues"""
+    room = event_room(data)
+    if room:
+        typing_tracker.start_typing(room, active_users[request.sid]['username'])
+
+@socketio.on('typing_stop')
+@metrics.observe_event('typing_stop')
+def handle_typing_stop(data=None):
+    room = event_room(data)
+    if room:
+        typing_tracker.stop_typing(room, active_users[request.sid]['username'])
+
+@socketio.on('ack_read')
+@metrics.observe_event('ack_read')
+def handle_ack_read(data=None):
+    """Mark everything up to data['seq'] as read; one ack covers any number of messages"""
+    if not isinstance(data, dict):
+        emit('error', {'message': 'ack_read needs an object with an integer seq'})
+        return
+    room = event_room(data)
+    if not room:
+        return
+    seq = data.get('seq')
+    if not isinstance(seq, int) or isinstance(seq, bool):
+        emit('error', {'message': 'ack_read needs an integer seq'})
+        return
+    username = active_users[request.sid]['username']
+    latest, oldest = history_bounds()
+    cursor = read_cursors.ack(room, username, min(seq, latest))
+    # The ack carries the new cursor and unread count
+    return {'room': room, 'seq': cursor, 'unread': read_cursors.unread(room, username, latest, oldest)}
 
 @socketio.on('ping')
+@metrics.observe_event('ping')
 def handle_ping():
     """Handle ping requests for connection testing"""
     emit('pong', {'timestamp': time.time()})
@@ -559,47 +1200,50 @@ def internal_error(error):
     logger.error(f"Internal server error: {error}")
     return {'error': 'Internal server error'}, 500
 
-<<<<<<< HEAD
-=======
-def cleanup_inactive_users():
-    """Clean up inactive users and old messages"""
-    global last_cleanup
-    current_time = time.time()
+def prepare_model():
+    """Background startup: wait for Ollama, pull the model, warm it, then keep it warm"""
+    while not check_ollama_health():
+        logger.warning("⚠️  Ollama service not available - AI features disabled until it is")
+        time.sleep(model_manager.check_interval)
     
-    if current_time - last_cleanup > CLEANUP_INTERVAL:
-        # Remove inactive users
-        inactive_sids = []
-        for sid, user_data in active_users.items():
-            if current_time - user_data.get('last_activity', 0) > 300:  # 5 minutes
-                inactive_sids.append(sid)
-        
-        for sid in inactive_sids:
-            username = active_users[sid].get('username')
-            if username:
-                logger.info(f"Cleaning up inactive user: {username}")
-                del active_users[sid]
-        
-        # Trim chat history if too long
-        while len(chat_history) > MAX_HISTORY:
-            chat_history.pop(0)
-        
-        last_cleanup = current_time
+    logger.info("✅ Ollama service is available")
+    # The default model first so /readyz flips as early as possible
+    for manager in model_managers.values():
+        if manager.prepare():
+            logger.info(f"🔥 Model {manager.model} is warm and ready")
+    for manager in list(model_managers.values())[1:]:
+        threading.Thread(target=manager.run, daemon=True).start()
+    model_manager.run()
+
+background_services_started = False
+
+def start_background_services():
+    """Start model preparation and the background workers once per process"""
+    global background_services_started
+    if background_services_started:
+        return
+    background_services_started = True
+    threading.Thread(target=prepare_model, daemon=True).start()
+    threading.Thread(target=monitor_ollama_health, daemon=True).start()
+    threading.Thread(target=idle_sweeper.run, daemon=True).start()
+    threading.Thread(target=heartbeats.run, daemon=True).start()
+    threading.Thread(target=outbound_queues.run, daemon=True).start()
+    threading.Thread(target=typing_tracker.run, daemon=True).start()
+    threading.Thread(target=read_cursors.run, daemon=True).start()
+    shutdown.install(drain_server)
+    if embedding_pipeline:
+        threading.Thread(target=embedding_pipeline.run, daemon=True).start()
+
+# Gunicorn imports this module without running __main__, so start here rather than below
+if START_BACKGROUND_SERVICES:
+    start_background_services()
 
->>>>>>> origin/master
 if __name__ == '__main__':
     logger.info("🚀 Starting Enhanced Chat Backend...")
-    logger.info(f"📡 Ollama URL: {OLLAMA_URL}")
-    logger.info(f"🤖 AI Model: {MODEL_NAME}")
+    logger.info(f"📡 Ollama URL(s): {', '.join(llm.urls)}")
+    logger.info(f"🤖 AI Model: {MODEL_NAME}" + (f" (large: {model_router.large_model})" if model_router.large_model else ""))
     logger.info(f"🔧 Environment: {'Production' if not app.debug else 'Development'}")
     
-    # Check Ollama health on startup
-    if check_ollama_health():
-        logger.info("✅ Ollama service is available")
-        # Check and pull model in background
-        threading.Thread(target=pull_model_if_needed, daemon=True).start()
-    else:
-        logger.warning("⚠️  Ollama service not available - AI features will be disabled")
-    
     # Run the application
     try:
         socketio.run(
@@ -0,0 +1,67 @@
+"""One-to-one conversations, stored and delivered apart from the public room"""
+import threading
+from collections import OrderedDict
+
+import metrics
+
+
+class DirectMessages:
+    """Bounded per-conversation histories of direct messages.
+
+    A conversation is keyed by its two usernames, sorted. Each one
+    numbers its messages with its own contiguous `dm_seq` (kept in the
+    message extras), so the public room's seqs, read cursors and indexes
+    are untouched, and a page lookup is an offset rather than a search.
+    Each conversation keeps its newest `max_history` messages, and the
+    least recently used conversations beyond `max_conversations` are
+    forgotten.
+    """
+
+    def __init__(self, max_history=100, max_conversations=10000):
+        self.max_history = max_history
+        self.max_conversations = max_conversations
+        self.conversations = OrderedDict()  # (user, user) -> {'next_seq': int, 'messages': [ChatMessage]}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def key(a, b):
+        return (a, b) if a <= b else (b, a)
+
+    def add(self, message):
+        """Store a message made with to=<recipient>, stamping its dm_seq"""
+        key = self.key(message.username, message.extras['to'])
+        with self.lock:
+            conversation = self.conversations.get(key)
+            if conversation is None:
+                conversation = self.conversations[key] = {'next_seq': 1, 'messages': []}
+                while len(self.conversations) > self.max_conversations:
+                    self.conversations.popitem(last=False)
+            self.conversations.move_to_end(key)
+            message.extras['dm_seq'] = conversation['next_seq']
+            conversation['next_seq'] += 1
+            conversation['messages'].append(message)
+            if len(conversation['messages']) > self.max_history:
+                conversation['messages'].pop(0)
+        metrics.DIRECT_MESSAGES.inc()
+        return message
+
+    def history(self, a, b, before_seq=None, limit=50):
+        """Up to `limit` messages of a conversation older than before_seq, oldest first, and has_more"""
+        with self.lock:
+            conversation = self.conversations.get(self.key(a, b))
+            if conversation is None:
+                return [], False
+            messages = conversation['messages']
+            end = len(messages)
+            if before_seq is not None and messages:
+                # dm_seqs are contiguous, so the cut-off is an offset from the oldest one
+                end = max(0, min(end, before_seq - messages[0].extras['dm_seq']))
+            start = max(0, end - limit)
+            return messages[start:end], start > 0
+
+    def stats(self):
+        with self.lock:
+            return {
+                'conversations': len(self.conversations),
+                'messages': sum(len(c['messages']) for c in self.conversations.values())
+            }
@@ -0,0 +1,157 @@
+"""Background embedding of chat messages, batched and bounded, shared by semantic features"""
+import logging
+import threading
+import time
+from collections import deque
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingPipeline:
+    """Embeds submitted messages in batches with one /api/embed call each.
+
+    A batch is sent when it reaches `batch_size` or `max_wait` seconds
+    after its first message arrived. The queue is bounded by `max_pending`:
+    past half full the worker stops waiting and sends full batches back to
+    back; when full, `submit()` either drops the oldest pending message
+    (the default, so socket handlers never block) or, with `block=True`,
+    waits for room. Failed batches are retried with backoff `retries`
+    times before being dropped.
+
+    Embedded batches are handed to every subscriber as (messages,
+    vectors); the VectorIndex is one, and other features subscribe the
+    same way instead of calling Ollama per message.
+    """
+
+    def __init__(self, provider, model, batch_size=32, max_wait=0.25, max_pending=1000,
+                 retries=3, timeout=30, ready=lambda: True):
+        self.provider = provider
+        self.model = model
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.max_pending = max_pending
+        self.retries = retries
+        self.timeout = timeout
+        self.ready = ready
+        self.pending = deque()
+        self.condition = threading.Condition()
+        self.subscribers = []
+        self.stopped = threading.Event()
+        self.idle = threading.Event()  # Set while no batch is being embedded
+        self.idle.set()
+
+    def subscribe(self, callback):
+        """Register callback(messages, vectors) for every embedded batch"""
+        self.subscribers.append(callback)
+
+    def embed(self, texts):
+        """Embed texts synchronously (e.g. a query); raises on failure"""
+        response = self.provider.post(
+            '/api/embed',
+            json={"model": self.model, "input": texts},
+            timeout=self.timeout
+        )
+        response.raise_for_status()
+        return response.json()['embeddings']
+
+    def submit(self, message, block=False):
+        """Queue a message for embedding; a full queue sheds its oldest message unless block=True"""
+        with self.condition:
+            while len(self.pending) >= self.max_pending:
+                if not block:
+                    self.pending.popleft()
+                    metrics.EMBEDDING_DROPPED.inc()
+                    break
+                self.condition.wait()
+            self.pending.append((time.monotonic(), message))
+            metrics.EMBEDDING_QUEUE_DEPTH.set(len(self.pending))
+            self.condition.notify_all()
+
+    def next_batch(self):
+        """Wait until a batch is due and take it off the queue"""
+        with self.condition:
+            while not self.pending and not self.stopped.is_set():
+                self.condition.wait(timeout=1)
+            if not self.pending:
+                return []
+            # Under pressure send right away; otherwise let the batch fill up
+            if len(self.pending) < self.max_pending // 2:
+                deadline = self.pending[0][0] + self.max_wait
+                while len(self.pending) < self.batch_size and not self.stopped.is_set():
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self.condition.wait(timeout=remaining)
+
+            batch = [self.pending.popleft()[1] for _ in range(min(self.batch_size, len(self.pending)))]
+            self.idle.clear()  # Under the lock, so drain() never sees an empty queue with a batch in neither place
+            metrics.EMBEDDING_QUEUE_DEPTH.set(len(self.pending))
+            self.condition.notify_all()  # Wake producers blocked on a full queue
+            return batch
+
+    def process(self, batch):
+        for attempt in range(1, self.retries + 1):
+            start = time.perf_counter()
+            try:
+                vectors = self.embed([msg.message for msg in batch])
+            except Exception as e:
+                logger.warning(f"Embedding {len(batch)} messages failed (attempt {attempt}): {e}")
+                if self.stopped.wait(min(30, 2 ** attempt)):
+                    return
+                continue
+
+            metrics.EMBEDDING_SECONDS.observe(time.perf_counter() - start)
+            metrics.EMBEDDING_BATCH_SIZE.observe(len(batch))
+            for callback in self.subscribers:
+                try:
+                    callback(batch, vectors)
+                except Exception as e:
+                    logger.error(f"Embedding subscriber failed: {e}")
+            return
+
+        metrics.EMBEDDING_DROPPED.inc(len(batch))
+        logger.error(f"Dropping {len(batch)} messages after {self.retries} embedding attempts")
+
+    def run(self):
+        """Worker loop; messages stay queued while the embedding model isn't ready"""
+        while not self.stopped.is_set():
+            if not self.ready():
+                self.stopped.wait(1)
+                continue
+            batch = self.next_batch()
+            if batch:
+                try:
+                    self.process(batch)
+                finally:
+                    self.idle.set()
+
+    def stop(self):
+        self.stopped.set()
+        with self.condition:
+            self.condition.notify_all()
+
+    def drain(self, timeout):
+        """Let the worker empty the queue (for at most timeout seconds), then stop it; returns messages left behind"""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline and self.ready():
+            with self.condition:
+                if not self.pending and self.idle.is_set():
+                    break
+            time.sleep(0.05)
+        self.stop()
+        self.idle.wait(max(0, deadline - time.monotonic()))
+        with self.condition:
+            return len(self.pending)
+
+    def status(self):
+        with self.condition:
+            pending = len(self.pending)
+        return {
+            'model': self.model,
+            'pending': pending,
+            'max_pending': self.max_pending,
+            'batch_size': self.batch_size,
+            'max_wait_ms': self.max_wait * 1000
+        }
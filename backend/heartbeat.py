@@ -0,0 +1,76 @@
+"""Client heartbeats: per-connection RTT and liveness, with eviction of dead sockets"""
+import threading
+import time
+
+import metrics
+from idle_sweeper import IdleSweeper
+
+MAX_RTT_MS = 600000  # Anything larger is a bogus report
+
+
+class HeartbeatTracker:
+    """Keeps RTT and liveness for every connection that heartbeats.
+
+    Clients send `heartbeat` every interval with the RTT they measured
+    from the previous ack. A connection is tracked from its first
+    heartbeat; once it misses heartbeats for `timeout` seconds the
+    embedded IdleSweeper calls `on_dead(sid, silent_seconds)`. Clients that
+    never heartbeat are left to the general idle sweeper.
+    """
+
+    def __init__(self, timeout, interval=5, on_dead=None, ewma_alpha=0.2):
+        self.ewma_alpha = ewma_alpha
+        self.connections = {}  # sid -> stats
+        self.lock = threading.Lock()
+        self.sweeper = IdleSweeper(timeout, interval, on_expire=self.expire)
+        self.on_dead = on_dead
+
+    def record(self, sid, rtt_ms=None):
+        if not isinstance(rtt_ms, (int, float)) or not 0 <= rtt_ms < MAX_RTT_MS:
+            rtt_ms = None
+        with self.lock:
+            stats = self.connections.get(sid)
+            if stats is None:
+                stats = self.connections[sid] = {
+                    'heartbeats': 0, 'last_heartbeat': None, 'last_rtt_ms': None, 'rtt_ewma_ms': None
+                }
+                self.sweeper.track(sid)
+            else:
+                self.sweeper.touch(sid)
+            stats['heartbeats'] += 1
+            stats['last_heartbeat'] = time.time()
+            if rtt_ms is not None:
+                stats['last_rtt_ms'] = round(rtt_ms, 1)
+                ewma = stats['rtt_ewma_ms']
+                stats['rtt_ewma_ms'] = round(rtt_ms if ewma is None else ewma + self.ewma_alpha * (rtt_ms - ewma), 1)
+        if rtt_ms is not None:
+            metrics.HEARTBEAT_RTT_SECONDS.observe(rtt_ms / 1000)
+
+    def forget(self, sid):
+        self.sweeper.forget(sid)
+        with self.lock:
+            self.connections.pop(sid, None)
+
+    def expire(self, sid, silent_seconds):
+        with self.lock:
+            self.connections.pop(sid, None)
+        metrics.HEARTBEAT_TIMEOUTS.inc()
+        if self.on_dead:
+            self.on_dead(sid, silent_seconds)
+
+    def run(self):
+        self.sweeper.run()
+
+    def stop(self):
+        self.sweeper.stop()
+
+    def status(self):
+        """Per-connection stats plus RTT percentiles over the connections' latest RTTs"""
+        with self.lock:
+            connections = {sid: dict(stats) for sid, stats in self.connections.items()}
+        rtts = sorted(stats['last_rtt_ms'] for stats in connections.values() if stats['last_rtt_ms'] is not None)
+        pick = lambda q: rtts[min(len(rtts) - 1, int(q * len(rtts)))] if rtts else None
+        return {
+            'connections': connections,
+            'rtt_ms': {'p50': pick(0.5), 'p90': pick(0.9), 'p99': pick(0.99), 'max': rtts[-1] if rtts else None}
+        }
@@ -0,0 +1,84 @@
+"""Background expiry of connections that have gone quiet"""
+import heapq
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class IdleSweeper:
+    """Calls `on_expire(sid, idle_seconds)` for connections idle longer than `timeout`.
+
+    `touch()` only records the activity time (O(1), no heap update). Each
+    tracked sid has one heap entry holding its earliest possible expiry;
+    a tick pops the entries that are due and either expires the sid or,
+    if it was touched since, pushes it back with its new deadline. A tick
+    therefore costs O(due entries · log n), not a scan of every connection.
+    """
+
+    def __init__(self, timeout, interval=10, on_expire=None):
+        self.timeout = timeout
+        self.interval = interval
+        self.on_expire = on_expire
+        self.last_activity = {}  # sid -> monotonic time of the last event
+        self.heap = []  # (deadline, sid)
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+
+    def track(self, sid):
+        now = time.monotonic()
+        with self.lock:
+            self.last_activity[sid] = now
+            heapq.heappush(self.heap, (now + self.timeout, sid))
+
+    def touch(self, sid):
+        with self.lock:
+            if sid in self.last_activity:
+                self.last_activity[sid] = time.monotonic()
+
+    def forget(self, sid):
+        # The heap entry is discarded lazily when it comes due
+        with self.lock:
+            self.last_activity.pop(sid, None)
+
+    def idle_seconds(self, sid):
+        with self.lock:
+            last = self.last_activity.get(sid)
+        return None if last is None else time.monotonic() - last
+
+    def sweep(self):
+        """Expire every connection whose deadline has passed; returns the expired sids"""
+        now = time.monotonic()
+        expired = []
+        with self.lock:
+            while self.heap and self.heap[0][0] <= now:
+                _, sid = heapq.heappop(self.heap)
+                last = self.last_activity.get(sid)
+                if last is None:
+                    continue  # Already disconnected
+                if last + self.timeout > now:
+                    heapq.heappush(self.heap, (last + self.timeout, sid))
+                    continue
+                del self.last_activity[sid]
+                expired.append((sid, now - last))
+
+        for sid, idle in expired:
+            logger.info(f"Connection {sid} idle for {idle:.0f}s, disconnecting")
+            if self.on_expire:
+                try:
+                    self.on_expire(sid, idle)
+                except Exception as e:
+                    logger.error(f"Idle expiry of {sid} failed: {e}")
+        return [sid for sid, _ in expired]
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.sweep()
+
+    def stop(self):
+        self.stopped.set()
+
+    def __len__(self):
+        with self.lock:
+            return len(self.last_activity)
@@ -0,0 +1,99 @@
+"""JSON codec for Socket.IO packets and HTTP responses: orjson when installed, stdlib json otherwise"""
+import json
+import threading
+
+from flask.json.provider import DefaultJSONProvider
+
+import metrics
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; the stdlib is only slower
+    orjson = None
+
+BACKEND = 'orjson' if orjson else 'json'
+
+
+class CachedFrame:
+    """A payload serialized once and reused for every recipient.
+
+    Pass it to emit() in place of the value; the codec splices the stored
+    text into the packet instead of serializing the value again.
+    """
+
+    __slots__ = ('value', 'text')
+
+    def __init__(self, value):
+        self.value = value
+        self.text = _dumps(value)
+
+
+def _default(obj):
+    if isinstance(obj, CachedFrame):
+        return obj.value
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+if orjson:
+    def _dumps(obj):
+        return orjson.dumps(obj, default=_default, option=orjson.OPT_NON_STR_KEYS).decode()
+
+    def loads(s, **kwargs):
+        return orjson.loads(s)
+else:
+    def _dumps(obj):
+        return json.dumps(obj, default=_default, separators=(',', ':'), ensure_ascii=False)
+
+    def loads(s, **kwargs):
+        return json.loads(s)
+
+
+def dumps(obj, **kwargs):
+    """Serialize compactly; formatting kwargs (separators, indent, ...) are accepted and ignored.
+
+    Socket.IO packets are lists of [event, *args], so cached frames at the
+    top level are spliced in as text rather than re-encoded.
+    """
+    if isinstance(obj, CachedFrame):
+        return obj.text
+    if isinstance(obj, list) and any(isinstance(item, CachedFrame) for item in obj):
+        return '[' + ','.join(item.text if isinstance(item, CachedFrame) else _dumps(item) for item in obj) + ']'
+    return _dumps(obj)
+
+
+class SnapshotCache:
+    """Keeps the frame of the latest snapshot; rebuilt only when its key changes.
+
+    `serialize` turns the built value into the frame (a CachedFrame by
+    default; e.g. a MessagePack encoder for binary clients).
+    """
+
+    def __init__(self, name, serialize=CachedFrame):
+        self.name = name
+        self.serialize = serialize
+        self.key = None
+        self.frame = None
+        self.lock = threading.Lock()
+
+    def get(self, key, build):
+        """Return the cached frame for key, calling build() for the value on a miss"""
+        with self.lock:
+            if self.frame is not None and self.key == key:
+                metrics.CACHE_REQUESTS.labels(self.name, 'hit').inc()
+                return self.frame
+            metrics.CACHE_REQUESTS.labels(self.name, 'miss').inc()
+            self.frame = self.serialize(build())
+            self.key = key
+            return self.frame
+
+
+class JSONProvider(DefaultJSONProvider):
+    """Flask JSON provider backed by this codec"""
+
+    def dumps(self, obj, **kwargs):
+        return dumps(obj)
+
+    def loads(self, s, **kwargs):
+        return loads(s)
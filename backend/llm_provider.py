@@ -0,0 +1,191 @@
+"""LLM provider layer: routes model calls across one or more Ollama replicas"""
+import abc
+import logging
+import threading
+import time
+
+import requests
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class LLMError(Exception):
+    """A model request failed; the message is worded for chat users"""
+
+
+class LLMProvider(abc.ABC):
+    """Interface the backend uses to reach a model server"""
+
+    @abc.abstractmethod
+    def request(self, method, path, **kwargs):
+        """Send an HTTP request to the model server and return the response"""
+
+    def post(self, path, **kwargs):
+        return self.request('POST', path, **kwargs)
+
+    def get(self, path, **kwargs):
+        return self.request('GET', path, **kwargs)
+
+    @abc.abstractmethod
+    def check_health(self):
+        """Return True if at least one backend can serve requests"""
+
+    def status(self):
+        """Provider state for /health"""
+        return {}
+
+
+class OllamaReplica:
+    """One Ollama endpoint and its load/latency bookkeeping"""
+
+    def __init__(self, url):
+        self.url = url.rstrip('/')
+        self.in_flight = 0
+        self.latency_ewma = None
+        self.consecutive_failures = 0
+        self.ejected_until = 0.0
+        self.last_used = {}  # model -> time of the last successful request naming it
+
+    def is_healthy(self, now):
+        return now >= self.ejected_until
+
+    def status(self, now):
+        return {
+            'url': self.url,
+            'healthy': self.is_healthy(now),
+            'in_flight': self.in_flight,
+            'latency_ewma_ms': round(self.latency_ewma * 1000, 1) if self.latency_ewma is not None else None,
+            'consecutive_failures': self.consecutive_failures
+        }
+
+
+class OllamaProvider(LLMProvider):
+    """Least-loaded routing over Ollama replicas with passive and active ejection.
+
+    Each call goes to the healthy replica with the fewest in-flight requests,
+    ties broken by latency EWMA. A replica is ejected for `ejection_seconds`
+    after `failure_threshold` consecutive failures (connection errors,
+    timeouts, 5xx) and re-admitted when the ejection expires or a health
+    probe succeeds. Connection errors are retried on another replica since
+    the request never reached a model.
+    """
+
+    def __init__(self, urls, ewma_alpha=0.3, failure_threshold=3, ejection_seconds=30):
+        if not urls:
+            raise ValueError("OllamaProvider needs at least one URL")
+        self.replicas = [OllamaReplica(url) for url in urls]
+        self.ewma_alpha = ewma_alpha
+        self.failure_threshold = failure_threshold
+        self.ejection_seconds = ejection_seconds
+        self.lock = threading.Lock()
+
+    def acquire(self, exclude=()):
+        """Pick a replica and count the request against it"""
+        with self.lock:
+            now = time.time()
+            candidates = [r for r in self.replicas if r not in exclude]
+            if not candidates:
+                return None
+            healthy = [r for r in candidates if r.is_healthy(now)]
+            if healthy:
+                replica = min(healthy, key=lambda r: (r.in_flight, r.latency_ewma or 0.0))
+            else:
+                # Everything is ejected: try the one closest to re-admission
+                replica = min(candidates, key=lambda r: r.ejected_until)
+            replica.in_flight += 1
+            metrics.OLLAMA_REPLICA_IN_FLIGHT.labels(replica.url).set(replica.in_flight)
+            return replica
+
+    def release(self, replica, elapsed, ok, model=None):
+        """Record the outcome of a request made through acquire()"""
+        with self.lock:
+            replica.in_flight -= 1
+            metrics.OLLAMA_REPLICA_IN_FLIGHT.labels(replica.url).set(replica.in_flight)
+            if ok:
+                if model:
+                    replica.last_used[model] = time.time()
+                if replica.latency_ewma is None:
+                    replica.latency_ewma = elapsed
+                else:
+                    replica.latency_ewma += self.ewma_alpha * (elapsed - replica.latency_ewma)
+                self.mark_healthy(replica)
+            else:
+                self.mark_failed(replica)
+
+    def mark_healthy(self, replica):
+        if replica.ejected_until:
+            logger.info(f"Ollama replica {replica.url} re-admitted")
+        replica.consecutive_failures = 0
+        replica.ejected_until = 0.0
+        metrics.OLLAMA_REPLICA_HEALTHY.labels(replica.url).set(1)
+
+    def mark_failed(self, replica):
+        replica.consecutive_failures += 1
+        if replica.consecutive_failures >= self.failure_threshold:
+            if replica.ejected_until <= time.time():
+                logger.warning(f"Ejecting Ollama replica {replica.url} for {self.ejection_seconds}s "
+                               f"after {replica.consecutive_failures} consecutive failures")
+            replica.ejected_until = time.time() + self.ejection_seconds
+            metrics.OLLAMA_REPLICA_HEALTHY.labels(replica.url).set(0)
+
+    def last_used(self, replica, model):
+        """When `model` last served a request on `replica` (0 if never)"""
+        with self.lock:
+            return replica.last_used.get(model, 0.0)
+
+    def request(self, method, path, **kwargs):
+        model = (kwargs.get('json') or {}).get('model')
+        tried = []
+        while True:
+            replica = self.acquire(exclude=tried)
+            if replica is None:
+                raise requests.exceptions.ConnectionError("No Ollama replica reachable")
+            tried.append(replica)
+
+            start = time.perf_counter()
+            try:
+                response = requests.request(method, f"{replica.url}{path}", **kwargs)
+            except requests.exceptions.ConnectionError:
+                self.release(replica, time.perf_counter() - start, ok=False)
+                logger.warning(f"Cannot connect to Ollama replica {replica.url}")
+                if len(tried) < len(self.replicas):
+                    continue
+                raise
+            except Exception:
+                self.release(replica, time.perf_counter() - start, ok=False)
+                raise
+
+            self.release(replica, time.perf_counter() - start, ok=response.status_code < 500,
+                         model=model if response.status_code == 200 else None)
+            return response
+
+    def check_health(self):
+        """Actively probe every replica's /api/tags; re-admits recovered replicas"""
+        any_healthy = False
+        for replica in self.replicas:
+            try:
+                ok = requests.get(f"{replica.url}/api/tags", timeout=5).status_code == 200
+            except requests.exceptions.RequestException:
+                ok = False
+            with self.lock:
+                if ok:
+                    self.mark_healthy(replica)
+                else:
+                    # A failed probe ejects immediately; no traffic should go there
+                    replica.consecutive_failures = max(replica.consecutive_failures, self.failure_threshold - 1)
+                    self.mark_failed(replica)
+            if not ok:
+                logger.warning(f"Ollama replica {replica.url} failed its health probe")
+            any_healthy = any_healthy or ok
+        return any_healthy
+
+    @property
+    def urls(self):
+        return [replica.url for replica in self.replicas]
+
+    def status(self):
+        with self.lock:
+            now = time.time()
+            return {'replicas': [replica.status(now) for replica in self.replicas]}
@@ -0,0 +1,92 @@
+"""Chat message records: compact in memory, turned into wire dicts only when emitted"""
+import enum
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+SYSTEM_USER = 'System'
+AI_USER = 'AI Assistant'
+WIRE_CACHE_SIZE = 256  # Wire dicts kept for recent messages (broadcasts, reconnect deltas)
+
+
+class MessageType(str, enum.Enum):
+    USER = 'user'
+    AI = 'ai'
+    SYSTEM = 'system'
+    ERROR = 'error'
+
+
+class ChatMessage:
+    """One chat message.
+
+    Slotted instead of a dict per message; usernames are interned so each
+    distinct name is stored once however many messages it wrote. Wire dicts
+    are built at emit time and only the most recent WIRE_CACHE_SIZE are
+    kept, so old history doesn't carry a dict per message again (full
+    history snapshots are cached as serialized frames instead).
+    """
+
+    __slots__ = ('seq', 'type', 'username', 'message', 'timestamp', 'extras')
+    wire_cache = OrderedDict()  # seq -> wire dict
+    wire_lock = threading.Lock()
+
+    def __init__(self, type, username, message, timestamp, extras=None):
+        self.seq = None
+        self.type = type
+        self.username = username
+        self.message = message
+        self.timestamp = timestamp
+        self.extras = extras
+
+    @property
+    def deleted(self):
+        return bool(self.extras and self.extras.get('deleted'))
+
+    def to_wire(self):
+        """The dict sent to clients (cached once the message has its seq)"""
+        with self.wire_lock:
+            wire = self.wire_cache.get(self.seq)
+            if wire is not None:
+                return wire
+
+            # Built under the lock so a concurrent revise() can't leave a stale dict cached
+            wire = {
+                'username': self.username,
+                'message': self.message,
+                'timestamp': self.timestamp,
+                'type': self.type.value
+            }
+            if self.seq is not None:
+                wire['seq'] = self.seq
+            if self.extras:
+                wire.update(self.extras)
+            if self.seq is not None:
+                self.wire_cache[self.seq] = wire
+                while len(self.wire_cache) > WIRE_CACHE_SIZE:
+                    self.wire_cache.popitem(last=False)
+            return wire
+
+    def revise(self, rev, text=None):
+        """Edit the text, or with text=None turn the message into a tombstone; `rev` orders revisions"""
+        extras = dict(self.extras or {}, rev=rev)
+        if text is None:
+            extras['deleted'] = True
+            extras.pop('edited_at', None)
+        else:
+            extras['edited_at'] = time.time()
+        with self.wire_lock:
+            self.message = '' if text is None else text
+            self.extras = extras
+            self.wire_cache.pop(self.seq, None)
+
+    def __repr__(self):
+        return f"ChatMessage(seq={self.seq}, type={self.type.value}, username={self.username!r})"
+
+
+def make_message(text, type=MessageType.USER, username=None, **extras):
+    """The one way messages are created; system/AI/error messages get their sender name here"""
+    type = MessageType(type)
+    if username is None:
+        username = AI_USER if type is MessageType.AI else SYSTEM_USER
+    return ChatMessage(type, sys.intern(username), text, time.time(), extras or None)
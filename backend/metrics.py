@@ -0,0 +1,228 @@
+"""Prometheus metrics and Socket.IO handler instrumentation for the chat backend"""
+import functools
+import inspect
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+from flask import request
+from prometheus_client import Counter, Gauge, Histogram, CONTENT_TYPE_LATEST, generate_latest
+
+logger = logging.getLogger(__name__)
+
+SLOW_EVENT_THRESHOLD = float(os.getenv('SLOW_EVENT_THRESHOLD_MS', 100)) / 1000
+EVENT_STATS_WINDOW = int(os.getenv('EVENT_STATS_WINDOW', 1000))  # Samples kept per event
+
+# Latency buckets in seconds: socket handlers are sub-millisecond, Ollama calls take seconds
+FAST_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+SLOW_BUCKETS = (0.1, 0.25, 0.5, 1, 2, 5, 10, 20, 30, 45, 60, 120)
+
+MESSAGES_TOTAL = Counter(
+    'chat_messages_total', 'Messages added to the chat history', ['type']
+)
+BROADCAST_SECONDS = Histogram(
+    'chat_broadcast_seconds', 'Time spent fanning a message out to all sockets',
+    buckets=FAST_BUCKETS
+)
+AI_QUEUE_DEPTH = Gauge(
+    'chat_ai_queue_depth', 'AI requests waiting for or receiving an Ollama response'
+)
+OLLAMA_REQUEST_SECONDS = Histogram(
+    'chat_ollama_request_seconds', 'Total Ollama generate latency', ['model'], buckets=SLOW_BUCKETS
+)
+OLLAMA_FIRST_TOKEN_SECONDS = Histogram(
+    'chat_ollama_first_token_seconds', 'Ollama time to first token (model load + prompt eval)',
+    ['model'], buckets=SLOW_BUCKETS
+)
+MODEL_REQUESTS = Counter(
+    'chat_model_requests_total', 'AI requests per routed model by outcome (ok, error, busy)',
+    ['model', 'result']
+)
+MODEL_IN_FLIGHT = Gauge(
+    'chat_model_in_flight', 'AI requests holding a concurrency slot per model', ['model']
+)
+SEARCH_SECONDS = Histogram(
+    'chat_search_seconds', 'Time to answer a full-text history search', buckets=FAST_BUCKETS
+)
+EMBEDDING_QUEUE_DEPTH = Gauge(
+    'chat_embedding_queue_depth', 'Messages waiting to be embedded'
+)
+EMBEDDING_BATCH_SIZE = Histogram(
+    'chat_embedding_batch_size', 'Messages per /api/embed call', buckets=(1, 2, 4, 8, 16, 32, 64, 128)
+)
+EMBEDDING_SECONDS = Histogram(
+    'chat_embedding_seconds', 'Latency of one batched /api/embed call', buckets=SLOW_BUCKETS
+)
+EMBEDDING_DROPPED = Counter(
+    'chat_embedding_dropped_total', 'Messages dropped by embedding backpressure or failures'
+)
+CACHE_REQUESTS = Counter(
+    'chat_cache_requests_total', 'Cache lookups by cache and result', ['cache', 'result']
+)
+OLLAMA_REPLICA_IN_FLIGHT = Gauge(
+    'chat_ollama_replica_in_flight', 'Requests in flight per Ollama replica', ['endpoint']
+)
+OLLAMA_REPLICA_HEALTHY = Gauge(
+    'chat_ollama_replica_healthy', '1 if the Ollama replica is taking traffic, 0 if ejected', ['endpoint']
+)
+CONNECTED_SOCKETS = Gauge(
+    'chat_connected_sockets', 'Currently connected Socket.IO clients'
+)
+HEARTBEAT_RTT_SECONDS = Histogram(
+    'chat_heartbeat_rtt_seconds', 'Client-measured heartbeat round-trip time',
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+)
+HEARTBEAT_TIMEOUTS = Counter(
+    'chat_heartbeat_timeouts_total', 'Connections evicted after missing heartbeats'
+)
+OUTBOUND_PENDING = Gauge(
+    'chat_outbound_pending', 'Broadcast events held back in per-connection queues for slow consumers'
+)
+OUTBOUND_SLOW_CONNECTIONS = Gauge(
+    'chat_outbound_slow_connections', 'Connections currently receiving through their outbound queue'
+)
+OUTBOUND_SHED = Counter(
+    'chat_outbound_shed_total', 'Held-back events never delivered, by reason (coalesced, dropped)', ['reason']
+)
+SLOW_CONSUMER_DISCONNECTS = Counter(
+    'chat_slow_consumer_disconnects_total', 'Connections cut because their outbound queue overflowed'
+)
+DIRECT_MESSAGES = Counter(
+    'chat_direct_messages_total', 'Direct messages delivered to their recipient only'
+)
+READ_ACKS = Counter(
+    'chat_read_acks_total', 'ack_read events by whether they moved the cursor (advanced, stale)', ['result']
+)
+TYPING_SNAPSHOTS = Counter(
+    'chat_typing_snapshots_total', 'Who-is-typing snapshots published (one per changed room per tick)'
+)
+IDLE_DISCONNECTS = Counter(
+    'chat_idle_disconnects_total', 'Connections dropped by the idle sweeper'
+)
+EVENT_HANDLER_SECONDS = Histogram(
+    'chat_event_handler_seconds', 'Socket.IO event handler wall time', ['event'],
+    buckets=FAST_BUCKETS
+)
+EVENT_PAYLOAD_BYTES = Histogram(
+    'chat_event_payload_bytes', 'Socket.IO event payload size', ['event'],
+    buckets=(64, 256, 1024, 4096, 16384, 65536)
+)
+SLOW_EVENTS = Counter(
+    'chat_slow_events_total', 'Handlers slower than SLOW_EVENT_THRESHOLD_MS', ['event']
+)
+
+
+class EventStats:
+    """Rolling window of recent timings for one event, for in-process percentiles"""
+
+    def __init__(self, window=EVENT_STATS_WINDOW):
+        self.durations = deque(maxlen=window)
+        self.payload_sizes = deque(maxlen=window)
+        self.count = 0
+        self.slow_count = 0
+        self.lock = threading.Lock()
+
+    def record(self, duration, payload_size, slow):
+        with self.lock:
+            self.durations.append(duration)
+            self.payload_sizes.append(payload_size)
+            self.count += 1
+            if slow:
+                self.slow_count += 1
+
+    def summary(self):
+        with self.lock:
+            durations = sorted(self.durations)
+            sizes = list(self.payload_sizes)
+            count, slow_count = self.count, self.slow_count
+
+        def percentile(p):
+            if not durations:
+                return 0.0
+            index = min(len(durations) - 1, int(p / 100 * len(durations)))
+            return round(durations[index] * 1000, 3)
+
+        return {
+            'count': count,
+            'slow_count': slow_count,
+            'window': len(durations),
+            'p50_ms': percentile(50),
+            'p90_ms': percentile(90),
+            'p99_ms': percentile(99),
+            'max_ms': round(durations[-1] * 1000, 3) if durations else 0.0,
+            'avg_payload_bytes': round(sum(sizes) / len(sizes), 1) if sizes else 0.0,
+            'max_payload_bytes': max(sizes) if sizes else 0
+        }
+
+
+# Event name -> EventStats, filled in as handlers are decorated
+event_stats = {}
+event_hooks = []  # Called as hook(event) before every observed handler, e.g. to stamp activity
+
+
+def payload_size(args):
+    """Approximate wire size of the arguments a handler received"""
+    size = 0
+    for arg in args:
+        if arg is None:
+            continue
+        if isinstance(arg, (str, bytes)):
+            size += len(arg)
+        else:
+            size += len(json.dumps(arg, default=str))
+    return size
+
+
+def observe_event(event):
+    """Decorator timing a Socket.IO handler and measuring its payload.
+
+    Feeds the Prometheus histograms and the rolling EventStats window, and
+    logs handlers slower than SLOW_EVENT_THRESHOLD_MS with their sid.
+    Every function in `event_hooks` is called with the event name before
+    the handler runs.
+    Extra positional arguments are dropped so handlers keep their narrow
+    signatures (Flask-SocketIO passes auth/reason to connect/disconnect).
+    """
+    def decorator(func):
+        params = inspect.signature(func).parameters.values()
+        arity = sum(1 for p in params if p.kind in (p.POSITIONAL_ONLY, p.POSITIONAL_OR_KEYWORD))
+        histogram = EVENT_HANDLER_SECONDS.labels(event)
+        size_histogram = EVENT_PAYLOAD_BYTES.labels(event)
+        stats = event_stats.setdefault(event, EventStats())
+
+        @functools.wraps(func)
+        def wrapper(*args):
+            args = args[:arity]
+            for hook in event_hooks:
+                hook(event)
+            start = time.perf_counter()
+            try:
+                return func(*args)
+            finally:
+                duration = time.perf_counter() - start
+                size = payload_size(args)
+                slow = duration > SLOW_EVENT_THRESHOLD
+                histogram.observe(duration)
+                size_histogram.observe(size)
+                stats.record(duration, size, slow)
+                if slow:
+                    SLOW_EVENTS.labels(event).inc()
+                    logger.warning(
+                        f"Slow event '{event}' took {duration * 1000:.1f} ms "
+                        f"(SID: {getattr(request, 'sid', None)}, payload: {size} bytes)"
+                    )
+        return wrapper
+    return decorator
+
+
+def get_event_stats():
+    """Rolling per-event aggregates for the admin endpoint"""
+    return {event: stats.summary() for event, stats in event_stats.items()}
+
+
+def render_metrics():
+    """Return the Prometheus text exposition and its content type"""
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -0,0 +1,244 @@
+"""Model lifecycle on the Ollama replicas: pull, warm-up, keep-alive and readiness"""
+import json
+import logging
+import threading
+import time
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_model_name(name):
+    """Ollama names without a tag mean ':latest'; compare names in that form"""
+    name = (name or '').strip()
+    return name if ':' in name.rsplit('/', 1)[-1] else f"{name}:latest"
+
+
+class ModelManager:
+    """Makes the chat model available and resident on every replica.
+
+    For each replica the model is pulled if missing (streaming progress,
+    retried with backoff; Ollama resumes partial downloads), then loaded
+    with a one-token generation and `keep_alive`, so the first real
+    question doesn't pay the load time. Replicas idle for
+    `rewarm_interval` seconds (shorter than keep_alive) are warmed again
+    before Ollama unloads the model. `on_change` is called with the new
+    status whenever a replica changes state (progress at most once per
+    `notify_interval` seconds). Embedding models (`embedding=True`) are
+    warmed through /api/embed instead of /api/generate.
+    """
+
+    def __init__(self, provider, model, keep_alive=1800, rewarm_interval=1200,
+                 check_interval=30, warmup_timeout=300, pull_retries=5,
+                 pull_read_timeout=120, notify_interval=1.0, on_change=None, embedding=False):
+        self.provider = provider
+        self.model = model
+        self.keep_alive = keep_alive
+        self.rewarm_interval = rewarm_interval
+        self.check_interval = check_interval
+        self.warmup_timeout = warmup_timeout
+        self.pull_retries = pull_retries
+        self.pull_read_timeout = pull_read_timeout
+        self.notify_interval = notify_interval
+        self.on_change = on_change
+        self.embedding = embedding
+        self.last_notify = 0.0
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.replica_state = {
+            replica.url: {
+                'pull': {'status': 'pending', 'detail': None, 'completed': 0, 'total': 0, 'percent': 0.0,
+                         'attempts': 0, 'error': None},
+                'warm': False,
+                'last_warm': 0.0,
+                'warmup_seconds': None,
+                'error': None
+            }
+            for replica in provider.replicas
+        }
+
+    def notify(self, progress=False):
+        """Report a state change; progress-only updates are throttled"""
+        if not self.on_change:
+            return
+        now = time.time()
+        if progress and now - self.last_notify < self.notify_interval:
+            return
+        self.last_notify = now
+        try:
+            self.on_change(self.status())
+        except Exception as e:
+            logger.error(f"Model status callback failed: {e}")
+
+    def update_pull(self, replica, progress=False, **changes):
+        with self.lock:
+            self.replica_state[replica.url]['pull'].update(changes)
+        self.notify(progress=progress)
+
+    def has_model(self, replica):
+        """Exact (tag-normalized) match against the replica's local models"""
+        response = requests.get(f"{replica.url}/api/tags", timeout=10)
+        response.raise_for_status()
+        wanted = normalize_model_name(self.model)
+        return any(
+            normalize_model_name(model.get('name') or model.get('model')) == wanted
+            for model in response.json().get('models', [])
+        )
+
+    def stream_pull(self, replica):
+        """Run one streaming /api/pull; raises on failure"""
+        layers = {}  # digest -> (completed, total)
+        with requests.post(
+            f"{replica.url}/api/pull",
+            json={"model": self.model, "name": self.model, "stream": True},
+            stream=True,
+            timeout=(10, self.pull_read_timeout)  # Read timeout applies per chunk, not overall
+        ) as response:
+            if response.status_code != 200:
+                raise RuntimeError(f"HTTP {response.status_code}: {response.text[:200]}")
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                event = json.loads(line)
+                if 'error' in event:
+                    raise RuntimeError(event['error'])
+
+                status = event.get('status', '')
+                if event.get('digest') and event.get('total'):
+                    layers[event['digest']] = (event.get('completed', 0), event['total'])
+                completed = sum(c for c, _ in layers.values())
+                total = sum(t for _, t in layers.values())
+                self.update_pull(
+                    replica, progress=True, status='pulling', detail=status,
+                    completed=completed, total=total,
+                    percent=round(completed / total * 100, 1) if total else 0.0
+                )
+                if status == 'success':
+                    return
+
+        raise RuntimeError("Pull stream ended without success")
+
+    def ensure_pulled(self, replica):
+        """Pull the model on one replica if missing, retrying with backoff"""
+        for attempt in range(1, self.pull_retries + 1):
+            if self.stopped.is_set():
+                return False
+            try:
+                self.update_pull(replica, status='checking', attempts=attempt)
+                if self.has_model(replica):
+                    self.update_pull(replica, status='ready', percent=100.0, error=None)
+                    logger.info(f"Model {self.model} is available on {replica.url}")
+                    return True
+
+                logger.info(f"Pulling model {self.model} on {replica.url} (attempt {attempt})...")
+                self.stream_pull(replica)
+                self.update_pull(replica, status='ready', percent=100.0, error=None)
+                logger.info(f"Successfully pulled model {self.model} on {replica.url}")
+                return True
+            except Exception as e:
+                delay = min(60, 2 ** attempt)
+                logger.error(f"Pulling {self.model} on {replica.url} failed: {e}; retrying in {delay}s")
+                self.update_pull(replica, status='error', error=str(e)[:200])
+                # Re-pulling resumes from the layers already downloaded
+                if self.stopped.wait(delay):
+                    return False
+        return False
+
+    def warm_replica(self, replica):
+        """Load the model on one replica with a one-token generation (or one embedding)"""
+        start = time.perf_counter()
+        if self.embedding:
+            path, payload = '/api/embed', {"model": self.model, "input": "Hi", "keep_alive": self.keep_alive}
+        else:
+            path, payload = '/api/generate', {
+                "model": self.model,
+                "prompt": "Hi",
+                "stream": False,
+                "keep_alive": self.keep_alive,
+                "options": {"num_predict": 1}
+            }
+        try:
+            response = requests.post(f"{replica.url}{path}", json=payload, timeout=self.warmup_timeout)
+            ok = response.status_code == 200
+            error = None if ok else f"HTTP {response.status_code}: {response.text[:200]}"
+        except requests.exceptions.RequestException as e:
+            ok, error = False, str(e)
+
+        elapsed = time.perf_counter() - start
+        with self.lock:
+            state = self.replica_state[replica.url]
+            changed = state['warm'] != ok
+            state['warm'] = ok
+            state['error'] = error
+            if ok:
+                state['last_warm'] = time.time()
+                state['warmup_seconds'] = round(elapsed, 3)
+        if changed:
+            self.notify()
+
+        if ok:
+            logger.info(f"Model {self.model} warm on {replica.url} ({elapsed:.1f}s)")
+        else:
+            logger.warning(f"Warm-up of {self.model} on {replica.url} failed: {error}")
+        return ok
+
+    def prepare_replica(self, replica):
+        return self.ensure_pulled(replica) and self.warm_replica(replica)
+
+    def prepare(self):
+        """Pull and warm all replicas in parallel; returns True if at least one is ready"""
+        threads = [threading.Thread(target=self.prepare_replica, args=(replica,), daemon=True)
+                   for replica in self.provider.replicas]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return self.is_ready()
+
+    def needs_warming(self, replica, now):
+        with self.lock:
+            state = self.replica_state[replica.url]
+            # Only requests for this model keep it resident; other models' traffic doesn't count
+            last_active = max(state['last_warm'], self.provider.last_used(replica, self.model))
+            return not state['warm'] or now - last_active > self.rewarm_interval
+
+    def run(self):
+        """Background loop: finish failed pulls, warm cold replicas and re-warm idle ones"""
+        while not self.stopped.is_set():
+            now = time.time()
+            for replica in self.provider.replicas:
+                with self.lock:
+                    pulled = self.replica_state[replica.url]['pull']['status'] == 'ready'
+                if not pulled:
+                    self.prepare_replica(replica)
+                elif self.needs_warming(replica, now):
+                    self.warm_replica(replica)
+            self.stopped.wait(self.check_interval)
+
+    def stop(self):
+        self.stopped.set()
+
+    def is_ready(self):
+        """Ready when the model is resident on at least one replica"""
+        with self.lock:
+            return any(state['warm'] for state in self.replica_state.values())
+
+    def progress(self):
+        """Overall pull progress across replicas, in percent"""
+        with self.lock:
+            pulls = [state['pull'] for state in self.replica_state.values()]
+        return round(max(p['percent'] for p in pulls), 1) if pulls else 0.0
+
+    def status(self):
+        with self.lock:
+            replicas = {
+                url: dict(state, pull=dict(state['pull']))
+                for url, state in self.replica_state.items()
+            }
+        return {
+            'model': self.model,
+            'ready': any(state['warm'] for state in replicas.values()),
+            'keep_alive': self.keep_alive,
+            'replicas': replicas
+        }
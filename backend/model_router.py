@@ -0,0 +1,76 @@
+"""Per-request model selection with per-model concurrency limits"""
+import threading
+from contextlib import contextmanager
+
+import metrics
+
+LARGE_TAG = '@ai-large'
+SMALL_TAG = '@ai-small'
+
+
+class ModelBusyError(Exception):
+    """Raised when a model's concurrency limit stays saturated past the wait timeout"""
+
+
+class ModelRouter:
+    """Sends short questions to a small fast model and long/tagged ones to a large model.
+
+    A question goes to the large model when it carries `@ai-large`, is
+    longer than `long_question_chars`, or contains code/multiple lines.
+    `@ai-small` forces the small model. Without a large model configured
+    everything goes to the small one.
+    """
+
+    def __init__(self, small_model, large_model=None, long_question_chars=280,
+                 small_concurrency=4, large_concurrency=1):
+        self.small_model = small_model
+        self.large_model = large_model if large_model and large_model != small_model else None
+        self.long_question_chars = long_question_chars
+        self.limits = {small_model: small_concurrency}
+        if self.large_model:
+            self.limits[self.large_model] = large_concurrency
+        self.semaphores = {model: threading.BoundedSemaphore(limit) for model, limit in self.limits.items()}
+
+    @property
+    def models(self):
+        return list(self.limits)
+
+    def choose(self, message):
+        """Pick the model for a (raw, untrimmed) chat message"""
+        if not self.large_model:
+            return self.small_model
+
+        lowered = message.lower()
+        if SMALL_TAG in lowered:
+            return self.small_model
+        if LARGE_TAG in lowered:
+            return self.large_model
+        if len(message) > self.long_question_chars or '```' in message or message.count('\n') >= 2:
+            return self.large_model
+        return self.small_model
+
+    @contextmanager
+    def slot(self, model, timeout=None):
+        """Hold one of the model's concurrency slots for the duration of a request"""
+        semaphore = self.semaphores[model]
+        if not semaphore.acquire(timeout=timeout):
+            metrics.MODEL_REQUESTS.labels(model, 'busy').inc()
+            raise ModelBusyError(f"Model {model} is at its concurrency limit")
+        metrics.MODEL_IN_FLIGHT.labels(model).inc()
+        try:
+            yield
+            metrics.MODEL_REQUESTS.labels(model, 'ok').inc()
+        except Exception:
+            metrics.MODEL_REQUESTS.labels(model, 'error').inc()
+            raise
+        finally:
+            metrics.MODEL_IN_FLIGHT.labels(model).dec()
+            semaphore.release()
+
+    def status(self):
+        return {
+            'small_model': self.small_model,
+            'large_model': self.large_model,
+            'long_question_chars': self.long_question_chars,
+            'concurrency_limits': dict(self.limits)
+        }
@@ -0,0 +1,139 @@
+"""Per-connection outbound queues that keep slow consumers from slowing down everyone"""
+import logging
+import threading
+from collections import deque
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Delivery policies for held-back events
+ESSENTIAL = 'essential'  # Never dropped; a connection that can't keep up is cut instead
+COALESCE = 'coalesce'  # Only the newest pending value per key is delivered (presence, model status)
+DROPPABLE = 'droppable'  # Shed oldest first when the queue is full
+
+
+class OutboundQueues:
+    """Holds broadcast events back for connections whose socket buffer is backed up.
+
+    `backlog(sid)` reports how many packets the transport has buffered for
+    a connection but not yet written. At `backlog_limit` or more the
+    connection is slow: broadcasts skip it and `enqueue()` parks the event
+    in its own queue instead, so the shared emit path never grows an
+    unbounded buffer. `flush()` moves parked events to the socket as the
+    backlog drains. Each queue holds at most `max_pending` events; when it
+    is full the oldest non-essential event is shed, and if everything left
+    is essential `on_overflow(sid, pending)` is called to disconnect it.
+    """
+
+    def __init__(self, backlog, send, backlog_limit=64, max_pending=256, interval=0.05, on_overflow=None):
+        self.backlog = backlog
+        self.send = send
+        self.backlog_limit = backlog_limit
+        self.max_pending = max_pending
+        self.interval = interval
+        self.on_overflow = on_overflow
+        self.pending = {}  # sid -> deque of [event, data, policy, key]
+        self.keyed = {}  # sid -> {key: entry} for coalescing
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+
+    def is_slow(self, sid):
+        """True if new events for sid must queue behind held-back ones or the socket is backed up"""
+        with self.lock:
+            if sid in self.pending:
+                return True
+        return self.backlog(sid) >= self.backlog_limit
+
+    def enqueue(self, sid, event, data, policy=ESSENTIAL, key=None):
+        overflow = None
+        with self.lock:
+            queue = self.pending.setdefault(sid, deque())
+            keyed = self.keyed.setdefault(sid, {})
+            if policy == COALESCE:
+                key = key or event
+                entry = keyed.get(key)
+                if entry is not None:
+                    entry[1] = data
+                    metrics.OUTBOUND_SHED.labels('coalesced').inc()
+                    return
+            if len(queue) >= self.max_pending and not self.shed(queue, keyed):
+                overflow = len(queue)
+                self.discard(sid)
+            else:
+                entry = [event, data, policy, key]
+                queue.append(entry)
+                if policy == COALESCE:
+                    keyed[key] = entry
+                metrics.OUTBOUND_PENDING.inc()
+            metrics.OUTBOUND_SLOW_CONNECTIONS.set(len(self.pending))
+
+        if overflow is not None:
+            metrics.SLOW_CONSUMER_DISCONNECTS.inc()
+            logger.warning(f"Connection {sid} fell {overflow} events behind, disconnecting")
+            if self.on_overflow:
+                self.on_overflow(sid, overflow)
+
+    def shed(self, queue, keyed):
+        """Drop the oldest non-essential entry; False if every entry is essential"""
+        for entry in queue:
+            if entry[2] != ESSENTIAL:
+                queue.remove(entry)
+                if entry[2] == COALESCE:
+                    del keyed[entry[3]]
+                metrics.OUTBOUND_PENDING.dec()
+                metrics.OUTBOUND_SHED.labels('dropped').inc()
+                return True
+        return False
+
+    def discard(self, sid):
+        queue = self.pending.pop(sid, None)
+        self.keyed.pop(sid, None)
+        if queue:
+            metrics.OUTBOUND_PENDING.dec(len(queue))
+
+    def forget(self, sid):
+        with self.lock:
+            self.discard(sid)
+            metrics.OUTBOUND_SLOW_CONNECTIONS.set(len(self.pending))
+
+    def flush(self):
+        """Send parked events to every connection whose backlog has room; returns the number sent"""
+        sent = 0
+        with self.lock:
+            for sid in list(self.pending):
+                queue, keyed = self.pending[sid], self.keyed[sid]
+                room = self.backlog_limit - self.backlog(sid)
+                while queue and room > 0:
+                    event, data, policy, key = queue.popleft()
+                    if policy == COALESCE:
+                        del keyed[key]
+                    self.send(sid, event, data)
+                    metrics.OUTBOUND_PENDING.dec()
+                    room -= 1
+                    sent += 1
+                if not queue:
+                    self.discard(sid)
+            metrics.OUTBOUND_SLOW_CONNECTIONS.set(len(self.pending))
+        return sent
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Outbound flush failed: {e}")
+
+    def stop(self):
+        self.stopped.set()
+
+    def status(self):
+        with self.lock:
+            depths = {sid: len(queue) for sid, queue in self.pending.items()}
+        return {
+            'slow_connections': len(depths),
+            'pending': sum(depths.values()),
+            'max_depth': max(depths.values(), default=0),
+            'backlog_limit': self.backlog_limit,
+            'max_pending': self.max_pending
+        }
@@ -0,0 +1,40 @@
+"""Retrieval stage for AI answers: relevant past messages as prompt snippets"""
+import logging
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+
+class Retriever:
+    """Finds stored messages relevant to a question.
+
+    Messages reach the VectorIndex through the EmbeddingPipeline; the
+    question itself is embedded synchronously and matched against it.
+    """
+
+    def __init__(self, pipeline, index):
+        self.pipeline = pipeline
+        self.index = index
+
+    def retrieve(self, question, k=4, min_score=0.3, exclude_seqs=()):
+        """Stored messages most similar to the question, best first"""
+        try:
+            embedding = self.pipeline.embed([question])[0]
+        except Exception as e:
+            logger.warning(f"Could not embed question for retrieval: {e}")
+            return []
+        return [(score, record) for score, record in self.index.search(embedding, k, exclude_seqs)
+                if score >= min_score]
+
+
+def format_snippets(results, budget):
+    """Render retrieved messages oldest first, stopping before the character budget is exceeded"""
+    lines = []
+    used = 0
+    for _, (seq, username, message, timestamp) in results:
+        line = f"[{datetime.fromtimestamp(timestamp):%Y-%m-%d %H:%M}] {username}: {message}"
+        if used + len(line) > budget:
+            continue
+        lines.append((seq, line))
+        used += len(line) + 1
+    return "\n".join(line for _, line in sorted(lines))
@@ -0,0 +1,73 @@
+"""Per-user read cursors and batched read-receipt snapshots"""
+import logging
+import threading
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class ReadCursors:
+    """One integer per user per room: the highest message seq the user has read.
+
+    Seqs in a room are contiguous, so the unread count is just the
+    room's latest seq minus the cursor (clamped to what is still
+    retained) — O(1), no per-message read state. `ack()` only moves a
+    cursor forward and marks it changed; `tick()` publishes the changed
+    cursors of each room as one `publish(room, {username: seq})` every
+    `interval` seconds, however many acks arrived in between.
+    """
+
+    def __init__(self, publish, interval=1.0):
+        self.publish = publish
+        self.interval = interval
+        self.cursors = {}  # room -> {username: seq}
+        self.changed = {}  # room -> set of usernames whose cursor moved since the last tick
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+
+    def ack(self, room, username, seq):
+        """Advance username's cursor to seq; returns the cursor afterwards"""
+        with self.lock:
+            cursors = self.cursors.setdefault(room, {})
+            if seq > cursors.get(username, 0):
+                cursors[username] = seq
+                self.changed.setdefault(room, set()).add(username)
+                metrics.READ_ACKS.labels('advanced').inc()
+            else:
+                metrics.READ_ACKS.labels('stale').inc()
+            return cursors[username] if username in cursors else 0
+
+    def cursor(self, room, username):
+        with self.lock:
+            return self.cursors.get(room, {}).get(username, 0)
+
+    def unread(self, room, username, latest_seq, oldest_seq):
+        """Messages in (cursor, latest_seq], counting only the retained ones from oldest_seq on"""
+        return max(0, latest_seq - max(self.cursor(room, username), oldest_seq - 1))
+
+    def snapshot(self, room):
+        with self.lock:
+            return dict(self.cursors.get(room, {}))
+
+    def tick(self):
+        """Publish each room's changed cursors; returns the number of rooms published"""
+        with self.lock:
+            batches = [
+                (room, {username: self.cursors[room][username] for username in usernames})
+                for room, usernames in self.changed.items()
+            ]
+            self.changed = {}
+        for room, cursors in batches:
+            self.publish(room, cursors)
+        return len(batches)
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                self.tick()
+            except Exception as e:
+                logger.error(f"Read receipt publish failed: {e}")
+
+    def stop(self):
+        self.stopped.set()
@@ -0,0 +1,109 @@
+"""Incremental inverted index over the in-memory chat history"""
+import re
+import threading
+
+from messages import MessageType
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+INDEXED_TYPES = (MessageType.USER, MessageType.AI)  # Join/leave and error notices aren't searchable
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(text.lower())
+
+
+class SearchIndex:
+    """Token -> seqs postings kept in step with the history ring buffer.
+
+    Postings are insertion-ordered dicts, so they stay sorted by seq,
+    evicting the oldest message is O(tokens in it), and results can be
+    read newest-first. A query walks the shortest posting list for its
+    terms and checks the rest by membership, so cost follows the rarest
+    term rather than the history size.
+    """
+
+    def __init__(self):
+        self.postings = {}  # token -> {seq: None}
+        self.messages = {}  # seq -> ChatMessage
+        self.lock = threading.Lock()
+
+    def add(self, message):
+        if message.type not in INDEXED_TYPES:
+            return
+        with self.lock:
+            self.messages[message.seq] = message
+            for token in set(tokenize(message.message)):
+                self.postings.setdefault(token, {})[message.seq] = None
+
+    def remove(self, message):
+        with self.lock:
+            if self.messages.pop(message.seq, None) is None:
+                return
+            for token in set(tokenize(message.message)):
+                posting = self.postings.get(token)
+                if posting is None:
+                    continue
+                posting.pop(message.seq, None)
+                if not posting:
+                    del self.postings[token]
+
+    def update(self, message, old_text):
+        """Re-index a message whose text changed from old_text, keeping postings in seq order"""
+        if message.type not in INDEXED_TYPES:
+            return
+        old_tokens, new_tokens = set(tokenize(old_text)), set(tokenize(message.message))
+        with self.lock:
+            if message.seq not in self.messages:
+                return
+            for token in old_tokens - new_tokens:
+                posting = self.postings[token]
+                del posting[message.seq]
+                if not posting:
+                    del self.postings[token]
+            for token in new_tokens - old_tokens:
+                posting = self.postings.setdefault(token, {})
+                if posting and next(reversed(posting)) > message.seq:
+                    # An old message gaining a term; rebuild this posting so newest-first walks stay ordered
+                    self.postings[token] = dict.fromkeys(sorted([*posting, message.seq]))
+                else:
+                    posting[message.seq] = None
+
+    def search(self, query, username=None, since=None, until=None, before_seq=None, limit=20):
+        """Messages containing every query term, newest first.
+
+        Returns (messages, has_more); pass the last message's seq as
+        before_seq to get the next page.
+        """
+        terms = set(tokenize(query))
+        if not terms:
+            return [], False
+
+        with self.lock:
+            postings = [self.postings.get(term) for term in terms]
+            if any(posting is None for posting in postings):
+                return [], False
+            postings.sort(key=len)
+            shortest, rest = postings[0], postings[1:]
+
+            results = []
+            for seq in reversed(shortest):
+                if before_seq is not None and seq >= before_seq:
+                    continue
+                if any(seq not in posting for posting in rest):
+                    continue
+                message = self.messages[seq]
+                if username is not None and message.username != username:
+                    continue
+                if since is not None and message.timestamp < since:
+                    # Older messages can only be older still
+                    break
+                if until is not None and message.timestamp > until:
+                    continue
+                if len(results) == limit:
+                    return results, True
+                results.append(message)
+            return results, False
+
+    def stats(self):
+        with self.lock:
+            return {'messages': len(self.messages), 'terms': len(self.postings)}
@@ -0,0 +1,85 @@
+"""Graceful shutdown: drain in-flight work on SIGTERM before the process exits"""
+import logging
+import os
+import signal
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class GracefulShutdown:
+    """Tracks in-flight jobs and runs a drain routine once when SIGTERM arrives.
+
+    While draining, `draining` is set so the app can refuse new
+    connections and new work; `spawn()` starts work that should be
+    allowed to finish, and `wait_for_jobs()` blocks until it has (or the
+    grace period runs out). The drain routine runs on its own thread so the
+    server keeps serving the connections it already has. Afterwards the
+    previous SIGTERM handler is called (gunicorn's, which stops the
+    worker), or, when there was none, the process re-sends itself SIGTERM
+    with the default action restored, so it exits even where SIGINT is
+    ignored (e.g. under nohup). In that case a second SIGTERM during the
+    drain stops the process at once.
+    """
+
+    def __init__(self):
+        self.draining = threading.Event()
+        self.jobs = 0
+        self.condition = threading.Condition()
+        self.previous_handler = None
+
+    def spawn(self, target):
+        """Run target on a daemon thread, counted as in flight from this call until it returns"""
+        with self.condition:
+            self.jobs += 1
+
+        def run():
+            try:
+                target()
+            finally:
+                with self.condition:
+                    self.jobs -= 1
+                    self.condition.notify_all()
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def wait_for_jobs(self, timeout):
+        """Wait until no job is in flight; returns how many were still running at the deadline"""
+        deadline = time.monotonic() + timeout
+        with self.condition:
+            while self.jobs:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self.condition.wait(remaining)
+            return self.jobs
+
+    def install(self, drain):
+        """Run drain() on SIGTERM; returns False where signals can't be handled (not the main thread)"""
+        def handle(signum, frame):
+            if self.draining.is_set():
+                return
+            self.draining.set()
+            if not callable(self.previous_handler):
+                # Handlers can only be changed from the main thread, which is where this runs
+                signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            logger.info("🛑 SIGTERM received, draining")
+            threading.Thread(target=self.run, args=(drain, signum, frame), daemon=True).start()
+
+        try:
+            self.previous_handler = signal.signal(signal.SIGTERM, handle)
+        except ValueError:
+            return False
+        return True
+
+    def run(self, drain, signum, frame):
+        try:
+            drain()
+        except Exception as e:
+            logger.error(f"Drain failed: {e}")
+        logger.info("👋 Drained, exiting")
+        if callable(self.previous_handler):
+            self.previous_handler(signum, frame)
+        else:
+            os.kill(os.getpid(), signal.SIGTERM)
@@ -0,0 +1,59 @@
+"""Idle sweeping: only user activity keeps a connection, and idle ones are kicked with a notice"""
+import os
+import time
+
+os.environ.setdefault('START_BACKGROUND_SERVICES', 'false')
+os.environ.setdefault('EMBEDDINGS_ENABLED', 'false')
+
+import pytest
+
+import app
+from idle_sweeper import IdleSweeper
+
+TIMEOUT = 0.2
+
+
+@pytest.fixture(autouse=True)
+def sweeper(monkeypatch):
+    sweeper = IdleSweeper(TIMEOUT, on_expire=app.disconnect_idle)
+    monkeypatch.setattr(app, 'idle_sweeper', sweeper)
+    return sweeper
+
+
+def joined(username):
+    client = app.socketio.test_client(app.app)
+    client.emit('join_chat', {'username': username})
+    client.get_received()
+    return client
+
+
+def received(client, event):
+    # get_received() refuses once disconnected, so read what was queued directly
+    return [packet['args'][0] for packet in client.queue if packet['name'] == event]
+
+
+def test_heartbeats_and_acks_do_not_keep_an_idle_reader(sweeper):
+    client = joined('reader')
+    sid = next(iter(app.user_sids['reader']))
+    for _ in range(3):
+        time.sleep(TIMEOUT / 2)
+        client.emit('heartbeat', {'rtt_ms': 1})
+        client.emit('ping')
+        client.emit('ack_read', {'seq': 1})
+
+    assert sweeper.sweep() == [sid]
+    notice, = received(client, 'idle_disconnect')
+    assert notice['timeout'] == app.IDLE_TIMEOUT
+    assert not client.is_connected()
+    assert 'reader' not in app.user_sids
+    assert any(message.message == '👋 reader left the chat' for message in app.chat_history)
+
+
+def test_user_actions_keep_a_connection(sweeper):
+    client = joined('writer')
+    for _ in range(3):
+        time.sleep(TIMEOUT / 2)
+        client.emit('typing_start', {})
+    assert sweeper.sweep() == []
+    assert client.is_connected()
+    client.disconnect()
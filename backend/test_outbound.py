@@ -0,0 +1,119 @@
+"""Slow-consumer queues: shedding the oldest droppable event, coalescing and overflow"""
+import pytest
+
+from outbound import COALESCE, DROPPABLE, OutboundQueues
+
+
+class FakeSocket:
+    """Backlog per sid set by the test; sent events recorded in order"""
+
+    def __init__(self):
+        self.backlogs = {}
+        self.sent = []
+        self.overflowed = []
+
+    def backlog(self, sid):
+        return self.backlogs.get(sid, 0)
+
+    def send(self, sid, event, data):
+        self.sent.append((sid, event, data))
+
+    def on_overflow(self, sid, pending):
+        self.overflowed.append((sid, pending))
+
+
+@pytest.fixture
+def socket():
+    return FakeSocket()
+
+
+@pytest.fixture
+def queues(socket):
+    return OutboundQueues(socket.backlog, socket.send, backlog_limit=4, max_pending=3,
+                          on_overflow=socket.on_overflow)
+
+
+def pending(queues, sid):
+    return [(event, data) for event, data, _, _ in queues.pending.get(sid, ())]
+
+
+def test_a_connection_is_slow_while_backed_up_or_holding_events(queues, socket):
+    assert not queues.is_slow('a')
+    socket.backlogs['a'] = 4
+    assert queues.is_slow('a')
+
+    socket.backlogs['a'] = 0
+    queues.enqueue('a', 'new_message', 1)
+    assert queues.is_slow('a')  # New events must not overtake the held-back ones
+
+
+def test_full_queue_drops_the_oldest_droppable_event(queues):
+    queues.enqueue('a', 'new_message', 1)
+    queues.enqueue('a', 'read_receipts', 'r1', DROPPABLE)
+    queues.enqueue('a', 'read_receipts', 'r2', DROPPABLE)
+    queues.enqueue('a', 'new_message', 2)
+    assert pending(queues, 'a') == [('new_message', 1), ('read_receipts', 'r2'), ('new_message', 2)]
+    queues.enqueue('a', 'new_message', 3)
+    assert pending(queues, 'a') == [('new_message', 1), ('new_message', 2), ('new_message', 3)]
+
+
+def test_coalesced_events_keep_their_place_and_only_the_newest_value(queues):
+    queues.enqueue('a', 'active_users', ['alice'], COALESCE)
+    queues.enqueue('a', 'new_message', 1)
+    queues.enqueue('a', 'active_users', ['alice', 'bob'], COALESCE)
+    queues.enqueue('a', 'active_users', ['bob'], COALESCE)
+    assert pending(queues, 'a') == [('active_users', ['bob']), ('new_message', 1)]
+
+
+def test_coalescing_is_per_key(queues):
+    queues.enqueue('a', 'model_status', 'small loading', COALESCE, key=('model_status', 'small'))
+    queues.enqueue('a', 'model_status', 'large loading', COALESCE, key=('model_status', 'large'))
+    queues.enqueue('a', 'model_status', 'small ready', COALESCE, key=('model_status', 'small'))
+    assert pending(queues, 'a') == [('model_status', 'small ready'), ('model_status', 'large loading')]
+
+
+def test_shedding_a_coalesced_event_frees_its_key(queues):
+    queues.enqueue('a', 'active_users', ['alice'], COALESCE)
+    queues.enqueue('a', 'new_message', 1)
+    queues.enqueue('a', 'new_message', 2)
+    queues.enqueue('a', 'new_message', 3)
+    assert queues.keyed['a'] == {}
+    assert pending(queues, 'a') == [('new_message', 1), ('new_message', 2), ('new_message', 3)]
+
+
+def test_overflow_with_only_essential_events_disconnects(queues, socket):
+    for seq in range(3):
+        queues.enqueue('a', 'new_message', seq)
+    queues.enqueue('b', 'new_message', 'other')
+    queues.enqueue('a', 'new_message', 3)
+    assert socket.overflowed == [('a', 3)]
+    assert 'a' not in queues.pending
+    assert pending(queues, 'b') == [('new_message', 'other')]
+
+
+def test_flush_sends_in_order_within_the_backlog_room(queues, socket):
+    socket.backlogs['a'] = 2
+    for seq in range(3):
+        queues.enqueue('a', 'new_message', seq)
+    assert queues.flush() == 2
+    assert socket.sent == [('a', 'new_message', 0), ('a', 'new_message', 1)]
+
+    socket.backlogs['a'] = 0
+    assert queues.flush() == 1
+    assert socket.sent[-1] == ('a', 'new_message', 2)
+    assert 'a' not in queues.pending
+    assert queues.status()['slow_connections'] == 0
+
+
+def test_flushed_coalesced_events_start_a_new_slot(queues, socket):
+    queues.enqueue('a', 'active_users', ['alice'], COALESCE)
+    queues.flush()
+    queues.enqueue('a', 'active_users', ['bob'], COALESCE)
+    assert pending(queues, 'a') == [('active_users', ['bob'])]
+
+
+def test_forget_drops_a_connection_queue(queues):
+    queues.enqueue('a', 'new_message', 1)
+    queues.forget('a')
+    assert queues.status() == {'slow_connections': 0, 'pending': 0, 'max_depth': 0,
+                               'backlog_limit': 4, 'max_pending': 3}
@@ -0,0 +1,129 @@
+"""Edit/delete permissions and incremental resync of revised messages"""
+import itertools
+import os
+
+os.environ.setdefault('START_BACKGROUND_SERVICES', 'false')
+os.environ.setdefault('EMBEDDINGS_ENABLED', 'false')
+
+import pytest
+
+import app
+from messages import ChatMessage, MessageType, make_message
+from search import SearchIndex
+
+
+@pytest.fixture(autouse=True)
+def history(monkeypatch):
+    monkeypatch.setattr(app, 'chat_history', [])
+    monkeypatch.setattr(app, 'message_seq', itertools.count(1))
+    monkeypatch.setattr(app, 'history_revision', 0)
+    monkeypatch.setattr(app, 'history_revisions', [])
+    monkeypatch.setattr(app, 'search_index', SearchIndex())
+    ChatMessage.wire_cache.clear()
+    yield
+    ChatMessage.wire_cache.clear()
+
+
+def post(username, text):
+    return app.add_to_history(make_message(text, username=username))
+
+
+def test_author_can_edit_and_delete():
+    message = post('alice', 'helo')
+
+    edited, error = app.revise_message('alice', message.seq, 'hello')
+    assert error is None
+    assert edited.message == 'hello'
+    assert edited.extras['rev'] == 1
+    assert 'edited_at' in edited.extras
+
+    deleted, error = app.revise_message('alice', message.seq)
+    assert error is None
+    assert deleted.deleted
+    assert deleted.message == ''
+    assert deleted.extras['rev'] == 2
+    assert 'edited_at' not in deleted.extras
+
+
+def test_only_the_author_can_change_a_message():
+    message = post('alice', 'mine')
+    assert app.revise_message('bob', message.seq, 'yours') == (None, 'You can only change your own messages')
+    assert app.revise_message('bob', message.seq) == (None, 'You can only change your own messages')
+    assert message.message == 'mine'
+    assert app.history_revision == 0
+
+
+def test_system_and_ai_messages_cannot_be_changed():
+    system = app.add_to_history(make_message('alice joined', type=MessageType.SYSTEM))
+    ai = app.add_to_history(make_message('an answer', type=MessageType.AI))
+    for message in (system, ai):
+        assert app.revise_message(message.username, message.seq, 'x')[1] == 'You can only change your own messages'
+
+
+def test_deleted_messages_stay_deleted():
+    message = post('alice', 'oops')
+    app.revise_message('alice', message.seq)
+    assert app.revise_message('alice', message.seq, 'back') == (None, 'Message was deleted')
+    assert app.revise_message('alice', message.seq) == (None, 'Message was deleted')
+
+
+def test_unknown_and_evicted_seqs_are_rejected(monkeypatch):
+    monkeypatch.setattr(app, 'MAX_HISTORY', 2)
+    first = post('alice', 'one')
+    post('alice', 'two')
+    post('alice', 'three')
+    assert app.revise_message('alice', first.seq, 'x') == (None, 'Message not found or too old to change')
+    assert app.revise_message('alice', 99, 'x') == (None, 'Message not found or too old to change')
+    assert app.revise_message('alice', 'abc', 'x') == (None, 'Message not found or too old to change')
+
+
+def test_edits_are_searchable_and_deletes_are_not():
+    message = post('alice', 'apples')
+    app.revise_message('alice', message.seq, 'pears')
+    assert app.search_index.search('apples') == ([], False)
+    assert app.search_index.search('pears') == ([message], False)
+
+    app.revise_message('alice', message.seq)
+    assert app.search_index.search('pears') == ([], False)
+
+
+def test_since_without_revisions_returns_only_new_messages():
+    messages = [post('alice', f'm{i}') for i in range(5)]
+    assert app.get_history_since(3, 0) == messages[3:]
+    assert app.get_history_since(5, 0) == []
+
+
+def test_since_replays_revisions_of_already_seen_messages():
+    messages = [post('alice', f'm{i}') for i in range(5)]
+    app.revise_message('alice', messages[1].seq, 'edited')
+    app.revise_message('alice', messages[0].seq)
+    app.revise_message('alice', messages[1].seq, 'edited again')
+    app.revise_message('alice', messages[4].seq, 'not seen yet')
+
+    # Revised messages the client already has come first, once each and in seq order;
+    # ones it hasn't seen yet arrive with the new messages
+    assert app.get_history_since(3, 0) == [messages[0], messages[1], messages[3], messages[4]]
+    # Only revisions after last_rev are replayed
+    assert app.get_history_since(3, 2) == [messages[1], messages[3], messages[4]]
+    assert app.get_history_since(5, 4) == []
+
+
+def test_since_asks_for_a_full_resync_when_it_cannot_replay(monkeypatch):
+    messages = [post('alice', f'm{i}') for i in range(3)]
+    # A client ahead of the server saw another history
+    assert app.get_history_since(10, 0) is None
+    app.revise_message('alice', messages[0].seq, 'x')
+    assert app.get_history_since(3, 5) is None
+
+    # The revision log no longer reaches back to the client's revision
+    monkeypatch.setattr(app, 'MAX_HISTORY', 3)
+    for message in messages:
+        app.revise_message('alice', message.seq, 'y')
+    assert app.history_revisions[0][0] == 2
+    assert app.get_history_since(3, 0) is None
+    assert app.get_history_since(3, 1) == messages
+
+    # Messages the client missed were evicted
+    for i in range(3):
+        post('alice', f'n{i}')
+    assert app.get_history_since(2, app.history_revision) is None
@@ -0,0 +1,106 @@
+"""Tokenization, filtering and paging of the in-memory search index"""
+import itertools
+
+import pytest
+
+from messages import MessageType, make_message
+from search import SearchIndex, tokenize
+
+
+@pytest.fixture
+def index():
+    return SearchIndex()
+
+
+@pytest.fixture
+def post(index):
+    seqs = itertools.count(1)
+
+    def post(text, username='alice', timestamp=None, type=MessageType.USER):
+        message = make_message(text, type=type, username=username)
+        message.seq = next(seqs)
+        if timestamp is not None:
+            message.timestamp = timestamp
+        index.add(message)
+        return message
+    return post
+
+
+def test_tokenize_lowercases_and_splits_on_non_word_characters():
+    assert tokenize("Hello, World! It's 2024-01-01") == ['hello', 'world', 'it', 's', '2024', '01', '01']
+    assert tokenize('snake_case stays') == ['snake_case', 'stays']
+    assert tokenize('Grüße aus Köln') == ['grüße', 'aus', 'köln']
+    assert tokenize('  ...  ') == []
+
+
+def test_search_matches_every_term_newest_first(index, post):
+    first = post('the quick brown fox')
+    post('a quick reply')
+    third = post('Brown and QUICK')
+    assert index.search('quick brown') == ([third, first], False)
+    assert index.search('brown, quick!') == ([third, first], False)
+
+
+def test_unknown_terms_and_empty_queries_find_nothing(index, post):
+    post('hello there')
+    assert index.search('hello nobody') == ([], False)
+    assert index.search('?!') == ([], False)
+
+
+def test_only_user_and_ai_messages_are_indexed(index, post):
+    user = post('deploy done')
+    ai = post('deploy looks good', type=MessageType.AI)
+    post('deploy joined the chat', type=MessageType.SYSTEM)
+    post('deploy failed', type=MessageType.ERROR)
+    assert index.search('deploy') == ([ai, user], False)
+
+
+def test_username_and_time_filters(index, post):
+    old = post('status update', username='alice', timestamp=100)
+    middle = post('status update', username='bob', timestamp=200)
+    new = post('status update', username='alice', timestamp=300)
+    assert index.search('status', username='alice') == ([new, old], False)
+    assert index.search('status', since=200) == ([new, middle], False)
+    assert index.search('status', until=200) == ([middle, old], False)
+    assert index.search('status', since=150, until=250) == ([middle], False)
+
+
+def test_limit_and_before_seq_page_through_results(index, post):
+    messages = [post(f'page item {i}') for i in range(5)]
+
+    page, has_more = index.search('item', limit=2)
+    assert (page, has_more) == ([messages[4], messages[3]], True)
+    page, has_more = index.search('item', before_seq=page[-1].seq, limit=2)
+    assert (page, has_more) == ([messages[2], messages[1]], True)
+    page, has_more = index.search('item', before_seq=page[-1].seq, limit=2)
+    assert (page, has_more) == ([messages[0]], False)
+
+
+def test_an_exactly_full_page_has_no_more(index, post):
+    messages = [post('twice') for _ in range(2)]
+    assert index.search('twice', limit=2) == ([messages[1], messages[0]], False)
+
+
+def test_since_stops_paging_at_older_messages(index, post):
+    post('ping', timestamp=100)
+    recent = [post('ping', timestamp=200 + i) for i in range(3)]
+    assert index.search('ping', since=200, limit=2) == ([recent[2], recent[1]], True)
+    assert index.search('ping', since=200, before_seq=recent[1].seq, limit=2) == ([recent[0]], False)
+
+
+def test_removed_messages_drop_out_of_postings(index, post):
+    message = post('ephemeral words')
+    index.remove(message)
+    assert index.search('ephemeral') == ([], False)
+    assert index.stats() == {'messages': 0, 'terms': 0}
+
+
+def test_update_keeps_postings_in_seq_order(index, post):
+    old = post('first')
+    new = post('second topic')
+    old_text = old.message
+    old.message = 'first topic'
+    index.update(old, old_text)
+    assert list(index.postings['topic']) == [old.seq, new.seq]
+    assert index.search('topic') == ([new, old], False)
+    assert index.search('topic', before_seq=new.seq) == ([old], False)
@@ -0,0 +1,75 @@
+"""Persistence of the vector index across restarts, including edits and deletes"""
+import os
+
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from messages import make_message
+from vector_index import VectorIndex
+
+
+def message(seq, text, username='alice'):
+    msg = make_message(text, username=username)
+    msg.seq = seq
+    return msg
+
+
+def on_disk(path):
+    """Everything the index has written, as text"""
+    return ''.join(open(os.path.join(path, name), errors='replace').read()
+                   for name in os.listdir(path) if name.endswith(('.json', '.jsonl')))
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / 'index')
+
+
+def test_records_and_vectors_survive_a_reopen(path):
+    index = VectorIndex(path, 'embed')
+    index.add([message(1, 'first'), message(2, 'second')], [[1, 0], [0, 1]])
+
+    reopened = VectorIndex(path, 'embed')
+    assert reopened.max_seq == 2
+    assert [record[2] for record in reopened.records] == ['first', 'second']
+    assert reopened.search([0, 1], k=1)[0][1][0] == 2
+
+
+def test_edits_are_replayed_on_reopen(path):
+    index = VectorIndex(path, 'embed')
+    original = message(1, 'draft')
+    index.add([original], [[1, 0]])
+    original.message = 'final'
+    index.add([original], [[0, 1]])
+
+    reopened = VectorIndex(path, 'embed')
+    assert reopened.records[0][2] == 'final'
+    assert reopened.count == 1
+
+
+def test_deleted_text_is_gone_from_disk_after_reopen(path):
+    index = VectorIndex(path, 'embed')
+    kept, deleted = message(1, 'keep this'), message(2, 'secret plans')
+    index.add([kept, deleted], [[1, 0], [0, 1]])
+    deleted.message = 'secret plans revised'
+    index.add([deleted], [[0, 1]])
+    index.remove(2)
+
+    assert 'secret' not in on_disk(path)
+    reopened = VectorIndex(path, 'embed')
+    assert reopened.records == [index.records[0], (2, 'alice', None, deleted.timestamp)]
+    assert 'secret' not in on_disk(path)
+    assert not reopened.get(2).any()
+    assert [record[0] for _, record in reopened.search([0, 1], k=2)] == [1]
+
+
+def test_rows_added_after_a_delete_line_up_with_their_vectors(path):
+    index = VectorIndex(path, 'embed')
+    index.add([message(1, 'one'), message(2, 'two')], [[1, 0], [0, 1]])
+    index.remove(1)
+    index.add([message(3, 'three')], [[0, 1]])
+
+    reopened = VectorIndex(path, 'embed')
+    assert [record[0] for record in reopened.records] == [1, 2, 3]
+    assert reopened.rows == {1: 0, 2: 1, 3: 2}
@@ -0,0 +1,82 @@
+"""Who-is-typing state, published as rate-limited per-room snapshots"""
+import logging
+import threading
+import time
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class TypingTracker:
+    """Aggregates typing_start/typing_stop into at most one snapshot per room per interval.
+
+    Starting and stopping only update a dict and mark the room dirty, so a
+    client repeating typing_start costs nothing beyond refreshing its
+    deadline. Every `interval` seconds `tick()` expires typists silent
+    for `timeout` seconds and calls `publish(room, usernames)` for each
+    room whose set of typists changed. Frames per second are therefore
+    bounded by rooms / interval, however many users are typing.
+    """
+
+    def __init__(self, publish, interval=0.5, timeout=5):
+        self.publish = publish
+        self.interval = interval
+        self.timeout = timeout
+        self.typists = {}  # room -> {username: deadline}
+        self.dirty = set()
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+
+    def start_typing(self, room, username):
+        with self.lock:
+            typists = self.typists.setdefault(room, {})
+            if username not in typists:
+                self.dirty.add(room)
+            typists[username] = time.monotonic() + self.timeout
+
+    def stop_typing(self, room, username):
+        with self.lock:
+            if self.typists.get(room, {}).pop(username, None) is not None:
+                self.dirty.add(room)
+
+    def forget(self, username):
+        """Drop a user from every room, e.g. when they disconnect"""
+        with self.lock:
+            for room, typists in self.typists.items():
+                if typists.pop(username, None) is not None:
+                    self.dirty.add(room)
+
+    def typing(self, room):
+        with self.lock:
+            return sorted(self.typists.get(room, {}))
+
+    def tick(self):
+        """Expire silent typists and publish the rooms that changed"""
+        now = time.monotonic()
+        with self.lock:
+            for room, typists in self.typists.items():
+                expired = [username for username, deadline in typists.items() if deadline <= now]
+                for username in expired:
+                    del typists[username]
+                if expired:
+                    self.dirty.add(room)
+            snapshots = [(room, sorted(self.typists.get(room, {}))) for room in self.dirty]
+            self.dirty.clear()
+            # Forget rooms nobody is typing in so the dict doesn't grow with every room ever used
+            self.typists = {room: typists for room, typists in self.typists.items() if typists}
+
+        for room, usernames in snapshots:
+            metrics.TYPING_SNAPSHOTS.inc()
+            self.publish(room, usernames)
+        return len(snapshots)
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                self.tick()
+            except Exception as e:
+                logger.error(f"Typing snapshot failed: {e}")
+
+    def stop(self):
+        self.stopped.set()
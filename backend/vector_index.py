@@ -0,0 +1,209 @@
+"""Disk-backed vector index for retrieval over past chat messages"""
+import json
+import logging
+import os
+import threading
+
+try:
+    import numpy as np
+except ImportError:  # numpy is optional; retrieval is disabled without it
+    np = None
+
+logger = logging.getLogger(__name__)
+
+
+class VectorIndex:
+    """Unit-normalized float32 embeddings keyed by message seq, with top-k cosine search.
+
+    Vectors live in a memory-mapped file (`<path>/vectors.f32`, grown by
+    doubling), so the index survives restarts and only the pages a search
+    touches need to be resident. Each row's message (seq, username, text,
+    timestamp) is appended to `<path>/messages.jsonl` in row order; that
+    file's line count is the number of valid rows. Edits rewrite their row
+    in place and append `[row, record]` to `<path>/updates.jsonl`, which is
+    replayed on load. A deleted message keeps its row as a zeroed
+    tombstone with a None text, and both files are compacted so its text
+    no longer exists on disk. `index.json` records the embedding model and
+    dimension, and the index starts over when either changes.
+    """
+
+    def __init__(self, path, model):
+        self.path = path
+        self.model = model
+        self.dim = None
+        self.count = 0
+        self.capacity = 0
+        self.vectors = None
+        self.records = []  # row -> (seq, username, message, timestamp)
+        self.rows = {}  # seq -> row
+        self.lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+        self.load()
+
+    @property
+    def vectors_file(self):
+        return os.path.join(self.path, 'vectors.f32')
+
+    @property
+    def records_file(self):
+        return os.path.join(self.path, 'messages.jsonl')
+
+    @property
+    def updates_file(self):
+        return os.path.join(self.path, 'updates.jsonl')
+
+    @property
+    def meta_file(self):
+        return os.path.join(self.path, 'index.json')
+
+    def load(self):
+        try:
+            with open(self.meta_file) as f:
+                meta = json.load(f)
+            with open(self.records_file) as f:
+                records = [tuple(json.loads(line)) for line in f if line.strip()]
+        except (OSError, ValueError):
+            return
+        if meta.get('model') != self.model or not meta.get('dim'):
+            logger.info(f"Vector index at {self.path} was built with another model; starting over")
+            return
+
+        self.dim = meta['dim']
+        rows = os.path.getsize(self.vectors_file) // (self.dim * 4) if os.path.exists(self.vectors_file) else 0
+        # A crash between writing a vector and its record leaves extra rows; they get overwritten
+        self.records = records[:rows]
+        if os.path.exists(self.updates_file):
+            with open(self.updates_file) as f:
+                for line in f:
+                    if line.strip():
+                        row, record = json.loads(line)
+                        if row < len(self.records):
+                            self.records[row] = tuple(record)
+        self.rows = {record[0]: row for row, record in enumerate(self.records)}
+        self.count = len(self.records)
+        if rows:
+            self.capacity = rows
+            self.vectors = np.memmap(self.vectors_file, dtype=np.float32, mode='r+', shape=(rows, self.dim))
+        logger.info(f"Loaded {self.count} message vectors from {self.path}")
+
+    def reset(self, dim):
+        self.dim = dim
+        self.count = 0
+        self.capacity = 0
+        self.vectors = None
+        self.records = []
+        self.rows = {}
+        for name in (self.vectors_file, self.records_file, self.updates_file):
+            if os.path.exists(name):
+                os.remove(name)
+        with open(self.meta_file, 'w') as f:
+            json.dump({'model': self.model, 'dim': dim}, f)
+
+    def grow(self, needed):
+        capacity = max(1024, self.capacity)
+        while capacity < needed:
+            capacity *= 2
+        if self.vectors is not None:
+            self.vectors.flush()
+        with open(self.vectors_file, 'ab') as f:
+            f.truncate(capacity * self.dim * 4)
+        self.vectors = np.memmap(self.vectors_file, dtype=np.float32, mode='r+', shape=(capacity, self.dim))
+        self.capacity = capacity
+
+    @property
+    def max_seq(self):
+        with self.lock:
+            return max(self.rows, default=0)
+
+    def get(self, seq):
+        """The stored unit vector for a message seq, or None"""
+        with self.lock:
+            row = self.rows.get(seq)
+            return None if row is None else np.array(self.vectors[row])
+
+    def add(self, messages, embeddings):
+        """Store embeddings for ChatMessages (same order); already indexed seqs are overwritten"""
+        # One entry per seq (a message edited twice may be queued twice) and none for deleted messages
+        pairs = list({msg.seq: (msg, vector) for msg, vector in zip(messages, embeddings) if not msg.deleted}.values())
+        if not pairs:
+            return
+        batch = np.asarray([vector for _, vector in pairs], dtype=np.float32)
+        norms = np.linalg.norm(batch, axis=1, keepdims=True)
+        batch /= np.maximum(norms, 1e-12)
+
+        with self.lock:
+            if self.dim != batch.shape[1]:
+                self.reset(batch.shape[1])
+            records = [(msg.seq, msg.username, msg.message, msg.timestamp) for msg, _ in pairs]
+            # Re-embedded edits go back into their own rows
+            updates = [(self.rows[record[0]], record, vector)
+                       for record, vector in zip(records, batch) if record[0] in self.rows]
+            new = [(record, vector) for record, vector in zip(records, batch) if record[0] not in self.rows]
+
+            if self.count + len(new) > self.capacity:
+                self.grow(self.count + len(new))
+            for row, record, vector in updates:
+                self.vectors[row] = vector
+                self.records[row] = record
+            if new:
+                self.vectors[self.count:self.count + len(new)] = [vector for _, vector in new]
+            self.vectors.flush()
+
+            if updates:
+                self.log_updates((row, record) for row, record, _ in updates)
+            with open(self.records_file, 'a') as f:
+                f.writelines(json.dumps(record) + '\n' for record, _ in new)
+            for record, _ in new:
+                self.rows[record[0]] = self.count
+                self.records.append(record)
+                self.count += 1
+
+    def remove(self, seq):
+        """Tombstone a message's row so it is never retrieved again"""
+        with self.lock:
+            row = self.rows.get(seq)
+            if row is None or self.records[row][2] is None:
+                return
+            self.vectors[row] = 0
+            self.vectors.flush()
+            seq, username, _, timestamp = self.records[row]
+            self.records[row] = (seq, username, None, timestamp)
+            # Logged first so that a crash mid-compaction still replays to a tombstone
+            self.log_updates([(row, self.records[row])])
+            self.compact()
+
+    def compact(self):
+        """Rewrite messages.jsonl from the current records and drop the update log; call with the lock held"""
+        temp_file = self.records_file + '.tmp'
+        with open(temp_file, 'w') as f:
+            f.writelines(json.dumps(record) + '\n' for record in self.records)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_file, self.records_file)
+        os.remove(self.updates_file)
+
+    def log_updates(self, updates):
+        with open(self.updates_file, 'a') as f:
+            f.writelines(json.dumps([row, record]) + '\n' for row, record in updates)
+
+    def search(self, embedding, k=4, exclude_seqs=()):
+        """Top-k (score, record) pairs by cosine similarity, best first"""
+        with self.lock:
+            if not self.count:
+                return []
+            query = np.asarray(embedding, dtype=np.float32)
+            if query.shape[0] != self.dim:
+                return []
+            query = query / max(float(np.linalg.norm(query)), 1e-12)
+            scores = self.vectors[:self.count] @ query
+
+            wanted = min(self.count, k + len(exclude_seqs))
+            top = np.argpartition(-scores, wanted - 1)[:wanted]
+            top = top[np.argsort(-scores[top])]
+            results = [(float(scores[row]), self.records[row]) for row in top
+                       if self.records[row][0] not in exclude_seqs and self.records[row][2] is not None]
+            return results[:k]
+
+    def stats(self):
+        with self.lock:
+            return {'vectors': self.count, 'dim': self.dim, 'model': self.model, 'path': self.path}
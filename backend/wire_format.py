@@ -0,0 +1,63 @@
+"""Compact MessagePack encoding of chat messages for clients that negotiate it.
+
+Each message is a positional array instead of a dict with repeated keys:
+
+    [seq, type, username, message, timestamp]            # common case
+    [seq, type, username, message, timestamp, {extras}]  # any other keys
+
+`type` is an index into MESSAGE_TYPES (or the raw string for unknown
+types). A payload is always a list of such arrays, so one decoder handles
+new_message, chat_history and chat_history_delta alike.
+"""
+try:
+    import msgpack
+except ImportError:  # msgpack is optional; clients then fall back to JSON
+    msgpack = None
+
+JSON = 'json'
+MSGPACK = 'msgpack'
+
+MESSAGE_TYPES = ('user', 'ai', 'system', 'error')
+TYPE_CODES = {name: code for code, name in enumerate(MESSAGE_TYPES)}
+FIELDS = ('seq', 'type', 'username', 'message', 'timestamp')
+
+
+def supported_codecs():
+    return [JSON, MSGPACK] if msgpack else [JSON]
+
+
+def negotiate(requested):
+    """Pick the codec for a client from what it asked for at connect time"""
+    return MSGPACK if requested == MSGPACK and msgpack else JSON
+
+
+def compact_message(message):
+    record = [
+        message.get('seq'),
+        TYPE_CODES.get(message.get('type'), message.get('type')),
+        message.get('username'),
+        message.get('message'),
+        message.get('timestamp')
+    ]
+    extras = {key: value for key, value in message.items() if key not in FIELDS}
+    if extras:
+        record.append(extras)
+    return record
+
+
+def expand_message(record):
+    message = dict(zip(FIELDS, record))
+    if isinstance(message['type'], int):
+        message['type'] = MESSAGE_TYPES[message['type']]
+    if len(record) > len(FIELDS):
+        message.update(record[len(FIELDS)])
+    return message
+
+
+def pack_messages(messages):
+    """Encode a list of message dicts as one MessagePack binary payload"""
+    return msgpack.packb([compact_message(message) for message in messages], use_bin_type=True)
+
+
+def unpack_messages(data):
+    return [expand_message(record) for record in msgpack.unpackb(data, raw=False)]
@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+"""
+Load-generation and latency benchmark for the real-time chat backend.
+Spawns many simulated Socket.IO clients in one process, has them join and
+send at a fixed rate, and reports join latency, end-to-end broadcast latency
+percentiles, sustained throughput and backend memory per connection as JSON.
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import re
+import sys
+import time
+import uuid
+from datetime import datetime
+
+import aiohttp
+import socketio
+
+# Every benchmark message carries a token so receivers can match it to its send time
+TOKEN_PATTERN = re.compile(r'\[bench:(\w+):(\d+):(\d+)\]')
+
+
+def percentiles(samples):
+    """Summarize latency samples (seconds) as milliseconds"""
+    if not samples:
+        return {'count': 0}
+    ordered = sorted(samples)
+
+    def pick(p):
+        return round(ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))] * 1000, 3)
+
+    return {
+        'count': len(ordered),
+        'min_ms': round(ordered[0] * 1000, 3),
+        'p50_ms': pick(50),
+        'p90_ms': pick(90),
+        'p99_ms': pick(99),
+        'max_ms': round(ordered[-1] * 1000, 3),
+        'mean_ms': round(sum(ordered) / len(ordered) * 1000, 3)
+    }
+
+
+async def backend_rss_bytes(session, backend_url):
+    """Read the backend's resident memory from its Prometheus endpoint"""
+    try:
+        async with session.get(f"{backend_url}/metrics", timeout=aiohttp.ClientTimeout(total=5)) as response:
+            text = await response.text()
+        for line in text.splitlines():
+            if line.startswith('process_resident_memory_bytes '):
+                return float(line.split()[1])
+    except Exception as e:
+        print(f"⚠️ Could not read backend memory: {e}", file=sys.stderr)
+    return None
+
+
+class BenchClient:
+    """One simulated chat user"""
+
+    def __init__(self, index, run_id, stats):
+        self.index = index
+        self.username = f"bench-{run_id}-{index}"
+        self.stats = stats
+        self.sio = socketio.AsyncClient(reconnection=False)
+        self.joined = asyncio.Event()
+        self.sent = 0
+        self.setup_events()
+
+    def setup_events(self):
+        @self.sio.event
+        async def join_success(data):
+            self.joined.set()
+
+        @self.sio.event
+        async def new_message(data):
+            match = TOKEN_PATTERN.search(data.get('message', ''))
+            if not match or match.group(1) != self.stats['run_id']:
+                return
+            sent_at = self.stats['send_times'].get((int(match.group(2)), int(match.group(3))))
+            if sent_at is not None:
+                self.stats['broadcast_latencies'].append(time.perf_counter() - sent_at)
+                self.stats['delivered'] += 1
+
+        @self.sio.event
+        async def error(data):
+            self.stats['errors'].append(data.get('message', 'Unknown error'))
+
+    async def connect(self, backend_url):
+        start = time.perf_counter()
+        await self.sio.connect(backend_url, transports=['websocket'])
+        self.stats['connect_latencies'].append(time.perf_counter() - start)
+
+    async def join(self, timeout):
+        start = time.perf_counter()
+        await self.sio.emit('join_chat', {'username': self.username})
+        await asyncio.wait_for(self.joined.wait(), timeout)
+        self.stats['join_latencies'].append(time.perf_counter() - start)
+
+    async def send_loop(self, rate, duration, ai_ratio):
+        interval = 1.0 / rate
+        # Random phase so clients don't send in lockstep
+        await asyncio.sleep(random.uniform(0, interval))
+        deadline = time.perf_counter() + duration
+        while time.perf_counter() < deadline:
+            self.sent += 1
+            prefix = '@ai ' if random.random() < ai_ratio else ''
+            token = f"[bench:{self.stats['run_id']}:{self.index}:{self.sent}]"
+            self.stats['send_times'][(self.index, self.sent)] = time.perf_counter()
+            await self.sio.emit('send_message', {'message': f"{prefix}benchmark message {token}"})
+            self.stats['sent'] += 1
+            await asyncio.sleep(interval)
+
+    async def disconnect(self):
+        if self.sio.connected:
+            await self.sio.disconnect()
+
+
+async def run_benchmark(args):
+    run_id = uuid.uuid4().hex[:8]
+    stats = {
+        'run_id': run_id,
+        'send_times': {},
+        'connect_latencies': [],
+        'join_latencies': [],
+        'broadcast_latencies': [],
+        'errors': [],
+        'sent': 0,
+        'delivered': 0
+    }
+    clients = [BenchClient(i, run_id, stats) for i in range(args.clients)]
+    semaphore = asyncio.Semaphore(args.connect_concurrency)
+
+    async def bounded(coro):
+        async with semaphore:
+            try:
+                await coro
+            except Exception as e:
+                stats['errors'].append(f"{type(e).__name__}: {e}")
+
+    async with aiohttp.ClientSession() as session:
+        rss_before = await backend_rss_bytes(session, args.url)
+
+        print(f"🔌 Connecting {args.clients} clients...", file=sys.stderr)
+        await asyncio.gather(*(bounded(c.connect(args.url)) for c in clients))
+        connected = [c for c in clients if c.sio.connected]
+
+        print(f"👋 Joining {len(connected)} clients...", file=sys.stderr)
+        await asyncio.gather(*(bounded(c.join(args.timeout)) for c in connected))
+        joined = [c for c in connected if c.joined.is_set()]
+        rss_connected = await backend_rss_bytes(session, args.url)
+
+        print(f"📤 Sending for {args.duration}s at {args.rate} msg/s per client...", file=sys.stderr)
+        send_start = time.perf_counter()
+        await asyncio.gather(*(c.send_loop(args.rate, args.duration, args.ai_ratio) for c in joined))
+        send_elapsed = time.perf_counter() - send_start
+
+        # Let in-flight broadcasts arrive before counting deliveries
+        await asyncio.sleep(args.drain)
+        elapsed = time.perf_counter() - send_start
+        rss_after = await backend_rss_bytes(session, args.url)
+
+        await asyncio.gather(*(c.disconnect() for c in clients), return_exceptions=True)
+
+    expected = stats['sent'] * len(joined)
+    memory = {
+        'rss_before_bytes': rss_before,
+        'rss_connected_bytes': rss_connected,
+        'rss_after_bytes': rss_after,
+        'per_connection_bytes': (
+            round((rss_connected - rss_before) / len(joined), 1)
+            if rss_before is not None and rss_connected is not None and joined else None
+        )
+    }
+
+    return {
+        'benchmark': 'socketio-chat',
+        'run_id': run_id,
+        'timestamp': datetime.now().isoformat(),
+        'config': {
+            'url': args.url,
+            'clients': args.clients,
+            'rate_per_client': args.rate,
+            'duration_s': args.duration,
+            'ai_ratio': args.ai_ratio,
+            'connect_concurrency': args.connect_concurrency
+        },
+        'clients': {
+            'connected': len(connected),
+            'joined': len(joined)
+        },
+        'connect_latency': percentiles(stats['connect_latencies']),
+        'join_latency': percentiles(stats['join_latencies']),
+        'broadcast_latency': percentiles(stats['broadcast_latencies']),
+        'throughput': {
+            'sent': stats['sent'],
+            'delivered': stats['delivered'],
+            'expected_deliveries': expected,
+            'delivery_ratio': round(stats['delivered'] / expected, 4) if expected else None,
+            'sent_per_sec': round(stats['sent'] / send_elapsed, 2) if send_elapsed else 0,
+            'delivered_per_sec': round(stats['delivered'] / elapsed, 2) if elapsed else 0
+        },
+        'backend_memory': memory,
+        'errors': {
+            'count': len(stats['errors']),
+            'samples': stats['errors'][:10]
+        }
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Socket.IO load and latency benchmark for the chat backend")
+    parser.add_argument('--url', default='http://localhost:5000', help="Backend URL")
+    parser.add_argument('--clients', type=int, default=50, help="Number of simulated clients")
+    parser.add_argument('--rate', type=float, default=1.0, help="Messages per second per client")
+    parser.add_argument('--duration', type=float, default=10.0, help="Seconds of sustained sending")
+    parser.add_argument('--ai-ratio', type=float, default=0.0,
+                        help="Fraction of messages sent with an @ai trigger (use with a stubbed Ollama)")
+    parser.add_argument('--connect-concurrency', type=int, default=20, help="Clients connecting at once")
+    parser.add_argument('--timeout', type=float, default=10.0, help="Join timeout in seconds")
+    parser.add_argument('--drain', type=float, default=2.0, help="Seconds to wait for in-flight broadcasts")
+    parser.add_argument('--output', help="Write the JSON results to this file instead of stdout")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    results = asyncio.run(run_benchmark(args))
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+        print(f"📊 Results written to {args.output}", file=sys.stderr)
+    else:
+        print(output)
+    return 0 if results['clients']['joined'] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
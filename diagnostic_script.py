@@ -1,12 +1,15 @@
 # Quick diagnostic script to test AI integration
 import requests
 import json
+import os
+
+# Override to diagnose a fake_ollama.py instance or a remote deployment
+OLLAMA_URL = os.getenv('OLLAMA_URL', 'http://localhost:11434')
+MODEL_NAME = os.getenv('MODEL_NAME', 'llama3.2:1b')
+BACKEND_URL = os.getenv('BACKEND_URL', 'http://localhost:5000')
 
 def test_ollama_connection():
     """Test Ollama connection and model availability"""
-    OLLAMA_URL = 'http://localhost:11434'
-    MODEL_NAME = 'llama3.2:1b'
-    
     print("🔍 Testing Ollama Connection...")
     
     # Test 1: Health check
@@ -72,8 +75,6 @@ def test_ollama_connection():
 
 def test_backend_health():
     """Test backend health"""
-    BACKEND_URL = 'http://localhost:5000'
-    
     print("\n🔍 Testing Backend Connection...")
     
     try:
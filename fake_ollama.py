@@ -0,0 +1,396 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the Ollama API, for tests and benchmarks.
+Implements /api/tags, /api/generate, /api/chat, /api/pull, /api/embed and
+/api/embeddings with configurable latency, streaming, error injection and
+a concurrency limit, so AI paths can be exercised without a real model.
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import random
+import re
+import threading
+import time
+from datetime import datetime, timezone
+
+from flask import Flask, Response, request
+from werkzeug.serving import make_server
+
+DEFAULT_CONFIG = {
+    'models': ['llama2', 'llama3.2:1b'],
+    'pullable_models': ['llama2', 'llama3.2:1b', 'llama3.2:3b', 'mistral:7b', 'nomic-embed-text'],
+    'load_latency': 0.5,          # Seconds to "load" a model that isn't resident
+    'first_token_latency': 0.05,  # Prompt evaluation time
+    'token_latency': 0.01,        # Per generated token
+    'response_tokens': 20,
+    'keep_alive': 300,            # Default seconds a model stays loaded
+    'error_rate': 0.0,            # Fraction of generate/chat/embed calls failing with a 500
+    'max_concurrency': 4,         # Requests processed at once
+    'max_queue': 16,              # Requests allowed to wait; beyond that we answer 503
+    'pull_steps': 10,
+    'pull_step_latency': 0.05,
+    'embedding_dim': 64,
+    'seed': None
+}
+
+WORD_PATTERN = re.compile(r'\w+')
+
+
+def now_iso():
+    return datetime.now(timezone.utc).isoformat()
+
+
+def normalize_model(name):
+    """Ollama treats a missing tag as ':latest'"""
+    return name if ':' in name else f"{name}:latest"
+
+
+def fake_embedding(text, dim):
+    """Deterministic bag-of-words hashing embedding: texts sharing words get similar vectors"""
+    vector = [0.0] * dim
+    for word in WORD_PATTERN.findall(text.lower()):
+        digest = hashlib.md5(word.encode()).digest()
+        index = int.from_bytes(digest[:4], 'little') % dim
+        vector[index] += 1.0 if digest[4] & 1 else -1.0
+    norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+    return [v / norm for v in vector]
+
+
+class FakeOllama:
+    """State shared by the fake server's request handlers"""
+
+    def __init__(self, **config):
+        self.config = dict(DEFAULT_CONFIG, **config)
+        self.models = {normalize_model(m) for m in self.config['models']}
+        self.loaded_until = {}  # model -> time it gets unloaded
+        self.lock = threading.Lock()
+        self.slots = threading.Semaphore(self.config['max_concurrency'])
+        self.waiting = 0
+        self.random = random.Random(self.config['seed'])
+        self.stats = {'requests': 0, 'rejected': 0, 'errors_injected': 0, 'loads': 0}
+
+    def sleep(self, seconds):
+        if seconds > 0:
+            time.sleep(seconds)
+
+    def acquire_slot(self):
+        """Block for a processing slot, or return False if the queue is full"""
+        with self.lock:
+            self.stats['requests'] += 1
+        if self.slots.acquire(blocking=False):
+            return True
+        with self.lock:
+            if self.waiting >= self.config['max_queue']:
+                self.stats['rejected'] += 1
+                return False
+            self.waiting += 1
+        self.slots.acquire()
+        with self.lock:
+            self.waiting -= 1
+        return True
+
+    def should_fail(self):
+        with self.lock:
+            failed = self.random.random() < self.config['error_rate']
+            if failed:
+                self.stats['errors_injected'] += 1
+        return failed
+
+    def load_model(self, model, keep_alive):
+        """Simulate a cold load; returns the load duration in seconds"""
+        with self.lock:
+            resident = self.loaded_until.get(model, 0) > time.time()
+        load_time = 0.0 if resident else self.config['load_latency']
+        if load_time:
+            self.stats['loads'] += 1
+            self.sleep(load_time)
+        with self.lock:
+            if keep_alive == 0:
+                self.loaded_until.pop(model, None)
+            else:
+                self.loaded_until[model] = time.time() + keep_alive
+        return load_time
+
+    def reply_tokens(self, prompt):
+        words = WORD_PATTERN.findall(prompt)[-8:] or ['nothing']
+        text = f"This is a stubbed answer about {' '.join(words)}."
+        tokens = text.split(' ')
+        count = self.config['response_tokens']
+        while len(tokens) < count:
+            tokens.append('lorem')
+        return [t + ' ' for t in tokens[:count]]
+
+
+def parse_keep_alive(value, default):
+    """Accept Ollama's keep_alive forms: seconds, '5m', '1h', '30s', negative = forever"""
+    if value is None:
+        return default
+    if isinstance(value, (int, float)):
+        return float('inf') if value < 0 else value
+    match = re.fullmatch(r'(-?\d+(?:\.\d+)?)([smh]?)', str(value).strip())
+    if not match:
+        return default
+    seconds = float(match.group(1)) * {'': 1, 's': 1, 'm': 60, 'h': 3600}[match.group(2)]
+    return float('inf') if seconds < 0 else seconds
+
+
+def create_app(**config):
+    """Build the fake Ollama Flask app; keyword arguments override DEFAULT_CONFIG"""
+    app = Flask(__name__)
+    fake = FakeOllama(**config)
+    app.config['FAKE_OLLAMA'] = fake
+
+    def error(message, status):
+        return {'error': message}, status
+
+    def ndjson(chunks, on_close=None):
+        def lines():
+            try:
+                for chunk in chunks:
+                    yield json.dumps(chunk) + '\n'
+            finally:
+                if on_close:
+                    on_close()
+        return Response(lines(), content_type='application/x-ndjson')
+
+    def with_slot(handler, stream=False):
+        """Apply the concurrency limit and error injection around a model call.
+
+        Streaming handlers return a chunk generator; the slot is held until it is exhausted.
+        """
+        if not fake.acquire_slot():
+            return error('server busy, please try again. maximum pending requests exceeded', 503)
+        if fake.should_fail():
+            fake.slots.release()
+            return error('injected failure', 500)
+        if not stream:
+            try:
+                return handler()
+            finally:
+                fake.slots.release()
+        try:
+            chunks = handler()
+        except Exception:
+            fake.slots.release()
+            raise
+        return ndjson(chunks, on_close=fake.slots.release)
+
+    def generation(model, prompt, stream, keep_alive, make_chunk):
+        """Shared body of /api/generate and /api/chat"""
+        load_time = fake.load_model(model, keep_alive)
+        start = time.time()
+        fake.sleep(fake.config['first_token_latency'])
+        prompt_eval = time.time() - start
+        tokens = fake.reply_tokens(prompt)
+
+        def final(eval_duration):
+            return {
+                'model': model,
+                'created_at': now_iso(),
+                'done': True,
+                'done_reason': 'stop',
+                'total_duration': int((load_time + prompt_eval + eval_duration) * 1e9),
+                'load_duration': int(load_time * 1e9),
+                'prompt_eval_count': len(prompt.split()),
+                'prompt_eval_duration': int(prompt_eval * 1e9),
+                'eval_count': len(tokens),
+                'eval_duration': int(eval_duration * 1e9)
+            }
+
+        if not stream:
+            eval_start = time.time()
+            fake.sleep(fake.config['token_latency'] * len(tokens))
+            return dict(make_chunk(''.join(tokens).strip()), **final(time.time() - eval_start))
+
+        def chunks():
+            eval_start = time.time()
+            for token in tokens:
+                fake.sleep(fake.config['token_latency'])
+                yield dict(make_chunk(token), model=model, created_at=now_iso(), done=False)
+            yield dict(make_chunk(''), **final(time.time() - eval_start))
+        return chunks()
+
+    @app.route('/')
+    def root():
+        return 'Ollama is running'
+
+    @app.route('/api/version')
+    def version():
+        return {'version': '0.0.0-fake'}
+
+    @app.route('/api/tags')
+    def tags():
+        return {'models': [
+            {'name': m, 'model': m, 'modified_at': now_iso(), 'size': 1_000_000_000,
+             'digest': hashlib.sha256(m.encode()).hexdigest()}
+            for m in sorted(fake.models)
+        ]}
+
+    @app.route('/api/ps')
+    def ps():
+        current = time.time()
+        return {'models': [
+            {'name': m, 'model': m, 'expires_at': datetime.fromtimestamp(
+                min(until, current + 10 ** 9), timezone.utc).isoformat()}
+            for m, until in fake.loaded_until.items() if until > current
+        ]}
+
+    @app.route('/api/generate', methods=['POST'])
+    def generate():
+        data = request.get_json(silent=True) or {}
+        model = normalize_model(data.get('model', ''))
+        if model not in fake.models:
+            return error(f"model '{data.get('model')}' not found, try pulling it first", 404)
+        prompt = data.get('prompt', '')
+        stream = data.get('stream', True)
+        keep_alive = parse_keep_alive(data.get('keep_alive'), fake.config['keep_alive'])
+
+        if not prompt:
+            # An empty prompt just loads (or with keep_alive=0 unloads) the model
+            load_time = fake.load_model(model, keep_alive)
+            return {'model': model, 'created_at': now_iso(), 'response': '', 'done': True,
+                    'done_reason': 'unload' if keep_alive == 0 else 'load',
+                    'load_duration': int(load_time * 1e9)}
+
+        return with_slot(lambda: generation(
+            model, prompt, stream, keep_alive, lambda text: {'response': text}
+        ), stream=stream)
+
+    @app.route('/api/chat', methods=['POST'])
+    def chat():
+        data = request.get_json(silent=True) or {}
+        model = normalize_model(data.get('model', ''))
+        if model not in fake.models:
+            return error(f"model '{data.get('model')}' not found, try pulling it first", 404)
+        messages = data.get('messages') or []
+        prompt = ' '.join(m.get('content', '') for m in messages)
+        stream = data.get('stream', True)
+        keep_alive = parse_keep_alive(data.get('keep_alive'), fake.config['keep_alive'])
+
+        if not messages:
+            load_time = fake.load_model(model, keep_alive)
+            return {'model': model, 'created_at': now_iso(), 'done': True,
+                    'message': {'role': 'assistant', 'content': ''},
+                    'done_reason': 'load', 'load_duration': int(load_time * 1e9)}
+
+        return with_slot(lambda: generation(
+            model, prompt, stream, keep_alive,
+            lambda text: {'message': {'role': 'assistant', 'content': text}}
+        ), stream=stream)
+
+    @app.route('/api/pull', methods=['POST'])
+    def pull():
+        data = request.get_json(silent=True) or {}
+        name = data.get('model') or data.get('name', '')
+        model = normalize_model(name)
+        if model not in {normalize_model(m) for m in fake.config['pullable_models']}:
+            return error('pull model manifest: file does not exist', 404)
+
+        total = 1_000_000_000
+        digest = 'sha256:' + hashlib.sha256(model.encode()).hexdigest()
+
+        def progress():
+            yield {'status': 'pulling manifest'}
+            steps = fake.config['pull_steps']
+            for step in range(1, steps + 1):
+                fake.sleep(fake.config['pull_step_latency'])
+                yield {'status': f'pulling {digest[7:19]}', 'digest': digest,
+                       'total': total, 'completed': total * step // steps}
+            yield {'status': 'verifying sha256 digest'}
+            yield {'status': 'writing manifest'}
+            with fake.lock:
+                fake.models.add(model)
+            yield {'status': 'success'}
+
+        if data.get('stream', True):
+            return ndjson(progress())
+        for _ in progress():
+            pass
+        return {'status': 'success'}
+
+    def embed_texts(model, texts):
+        fake.load_model(model, fake.config['keep_alive'])
+        fake.sleep(fake.config['first_token_latency'])
+        return [fake_embedding(text, fake.config['embedding_dim']) for text in texts]
+
+    @app.route('/api/embed', methods=['POST'])
+    def embed():
+        data = request.get_json(silent=True) or {}
+        model = normalize_model(data.get('model', ''))
+        if model not in fake.models:
+            return error(f"model '{data.get('model')}' not found, try pulling it first", 404)
+        texts = data.get('input', '')
+        texts = [texts] if isinstance(texts, str) else list(texts)
+        return with_slot(lambda: {'model': model, 'embeddings': embed_texts(model, texts)})
+
+    @app.route('/api/embeddings', methods=['POST'])
+    def embeddings():
+        """Legacy single-prompt embedding endpoint"""
+        data = request.get_json(silent=True) or {}
+        model = normalize_model(data.get('model', ''))
+        if model not in fake.models:
+            return error(f"model '{data.get('model')}' not found, try pulling it first", 404)
+        return with_slot(lambda: {'embedding': embed_texts(model, [data.get('prompt', '')])[0]})
+
+    @app.route('/_fake/stats')
+    def fake_stats():
+        """Counters for asserting on in tests and benchmarks"""
+        with fake.lock:
+            return dict(fake.stats, waiting=fake.waiting, models=sorted(fake.models))
+
+    return app
+
+
+class FakeOllamaServer:
+    """Run the fake in a background thread, e.g. from a test or benchmark"""
+
+    def __init__(self, host='127.0.0.1', port=0, **config):
+        self.app = create_app(**config)
+        self.server = make_server(host, port, self.app, threaded=True)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        return f"http://{self.server.host}:{self.server.port}"
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Fake Ollama server for tests and benchmarks")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=11435)
+    parser.add_argument('--models', default=','.join(DEFAULT_CONFIG['models']),
+                        help="Comma-separated models reported as already pulled")
+    parser.add_argument('--load-latency', type=float, default=DEFAULT_CONFIG['load_latency'])
+    parser.add_argument('--first-token-latency', type=float, default=DEFAULT_CONFIG['first_token_latency'])
+    parser.add_argument('--token-latency', type=float, default=DEFAULT_CONFIG['token_latency'])
+    parser.add_argument('--response-tokens', type=int, default=DEFAULT_CONFIG['response_tokens'])
+    parser.add_argument('--error-rate', type=float, default=DEFAULT_CONFIG['error_rate'])
+    parser.add_argument('--max-concurrency', type=int, default=DEFAULT_CONFIG['max_concurrency'])
+    parser.add_argument('--max-queue', type=int, default=DEFAULT_CONFIG['max_queue'])
+    parser.add_argument('--embedding-dim', type=int, default=DEFAULT_CONFIG['embedding_dim'])
+    parser.add_argument('--seed', type=int, default=None, help="Seed for deterministic error injection")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    config = {key: value for key, value in vars(args).items() if key not in ('host', 'port')}
+    config['models'] = [m.strip() for m in args.models.split(',') if m.strip()]
+    print(f"🤖 Fake Ollama listening on http://{args.host}:{args.port}")
+    create_app(**config).run(host=args.host, port=args.port, threaded=True)
@@ -1,12 +1,11 @@
 import streamlit as st
-import socketio
 import time
-import threading
 import queue
-import os
 from datetime import datetime
 import requests
 
+from chat_client import BACKEND_URL, EnhancedChatClient
+
 # Page configuration
 st.set_page_config(
     page_title="Real-time Chat with AI",
@@ -16,14 +15,7 @@ st.set_page_config(
 )
 
 # Configuration
-BACKEND_URL = os.getenv('BACKEND_URL', 'http://localhost:5000')
-<<<<<<< HEAD
-RECONNECT_ATTEMPTS = 3
-MESSAGE_REFRESH_INTERVAL = 5
-=======
-RECONNECT_ATTEMPTS = 5
 MESSAGE_REFRESH_INTERVAL = 2
->>>>>>> origin/master
 
 # Global queue to handle cross-thread communication
 if 'global_message_queue' not in st.session_state:
@@ -41,13 +33,12 @@ def init_session_state():
         'last_message_id': 0,
         'connection_error': None,
         'auto_reconnect': True,
-<<<<<<< HEAD
-        'message_sending': False
-=======
         'message_sending': False,
-        'reconnect_attempts': 0,
-        'last_reconnect': 0
->>>>>>> origin/master
+        'model_status': {},  # model name -> pull/readiness status
+        'typing_users': [],  # Latest who-is-typing snapshot for the room
+        'read_cursors': {},  # username -> highest seq they have read
+        'acked_seq': 0,  # Highest seq we have acknowledged as read
+        'direct_messages': []  # Private messages to and from this user
     }
     
     for key, value in defaults.items():
@@ -56,180 +47,6 @@ def init_session_state():
 
 init_session_state()
 
-class EnhancedChatClient:
-    def __init__(self, message_queue):
-        self.sio = socketio.Client(
-            reconnection=True,
-            reconnection_attempts=RECONNECT_ATTEMPTS,
-<<<<<<< HEAD
-            reconnection_delay=2,
-            reconnection_delay_max=10
-        )
-        self.message_queue = message_queue  # Pass queue as parameter
-=======
-            reconnection_delay=1,
-            reconnection_delay_max=5,
-            logger=True,
-            engineio_logger=True
-        )
-        self.message_queue = message_queue
->>>>>>> origin/master
-        self.setup_events()
-        self.last_heartbeat = time.time()
-    
-    def setup_events(self):
-        @self.sio.event
-        def connect():
-            self.last_heartbeat = time.time()
-            self.message_queue.put(('connection_status', {
-                'connected': True,
-                'status': 'connected',
-                'error': None,
-                'message': '✅ Connected to chat server'
-            }))
-<<<<<<< HEAD
-=======
-            # Reset reconnect attempts on successful connection
-            st.session_state.reconnect_attempts = 0
->>>>>>> origin/master
-        
-        @self.sio.event
-        def disconnect():
-            self.message_queue.put(('connection_status', {
-                'connected': False,
-                'status': 'disconnected',
-                'error': None,
-                'message': '❌ Disconnected from chat server'
-            }))
-<<<<<<< HEAD
-        
-        @self.sio.event
-        def connect_error(data):
-            self.message_queue.put(('connection_status', {
-                'connected': False,
-                'status': 'error',
-                'error': str(data),
-                'message': f'❌ Connection error: {data}'
-            }))
-=======
-            # Attempt to reconnect if auto_reconnect is enabled
-            if st.session_state.auto_reconnect:
-                current_time = time.time()
-                if current_time - st.session_state.last_reconnect > 5:  # Prevent rapid reconnection attempts
-                    st.session_state.last_reconnect = current_time
-                    st.session_state.reconnect_attempts += 1
-                    if st.session_state.reconnect_attempts <= RECONNECT_ATTEMPTS:
-                        self.connect()
-        
-        @self.sio.event
-        def connect_error(data):
-            error_msg = str(data)
-            self.message_queue.put(('connection_status', {
-                'connected': False,
-                'status': 'error',
-                'error': error_msg,
-                'message': f'❌ Connection error: {error_msg}'
-            }))
-            # Log the error for debugging
-            print(f"Connection error: {error_msg}")
->>>>>>> origin/master
-        
-        @self.sio.event
-        def reconnect():
-            self.message_queue.put(('status', '🔄 Reconnected to chat server'))
-            # Re-join chat after reconnection would need to be handled in main thread
-        
-        @self.sio.event
-        def new_message(data):
-            # Add message ID to prevent duplicates
-            if 'id' not in data:
-                data['id'] = f"{data.get('timestamp', time.time())}_{data.get('username', 'unknown')}"
-            self.message_queue.put(('message', data))
-        
-        @self.sio.event
-        def chat_history(data):
-            self.message_queue.put(('history', data))
-        
-        @self.sio.event
-        def active_users(data):
-            self.message_queue.put(('users', data))
-        
-        @self.sio.event
-        def error(data):
-            self.message_queue.put(('error', data.get('message', 'Unknown error')))
-        
-        @self.sio.event
-        def message_sent():
-            self.message_queue.put(('message_sent', True))
-    
-    def connect(self):
-        try:
-            if self.sio.connected:
-                return True
-            
-            self.message_queue.put(('connection_status', {
-                'connected': False,
-                'status': 'connecting',
-                'error': None,
-                'message': 'Connecting...'
-            }))
-            
-            # Test backend health first
-            try:
-                response = requests.get(f"{BACKEND_URL}/health", timeout=5)
-                if response.status_code != 200:
-                    raise Exception(f"Backend unhealthy: {response.status_code}")
-            except Exception as e:
-                self.message_queue.put(('connection_status', {
-                    'connected': False,
-                    'status': 'error',
-                    'error': f"Backend not available: {e}",
-                    'message': f"Backend not available: {e}"
-                }))
-                return False
-            
-            self.sio.connect(BACKEND_URL)
-            return True
-            
-        except Exception as e:
-            self.message_queue.put(('connection_status', {
-                'connected': False,
-                'status': 'error',
-                'error': str(e),
-                'message': f"Connection failed: {e}"
-            }))
-            return False
-    
-    def disconnect(self):
-        try:
-            if self.sio.connected:
-                self.sio.disconnect()
-        except Exception as e:
-            print(f"Disconnect error: {e}")
-    
-    def join_chat(self, username):
-        if self.sio.connected and username:
-            self.sio.emit('join_chat', {'username': username})
-            return True
-        return False
-    
-    def send_message(self, message):
-        if self.sio.connected and message.strip():
-            self.sio.emit('send_message', {'message': message.strip()})
-            return True
-        return False
-    
-    def is_healthy(self):
-        """Check connection health"""
-        if not self.sio.connected:
-            return False
-        
-        # Check if we haven't received any events recently
-        if time.time() - self.last_heartbeat > 30:
-            return False
-        
-        return True
-    
 
 
 def process_message_queue():
@@ -257,10 +74,39 @@ def process_message_queue():
                     
             elif msg_type == 'history':
                 st.session_state.messages = data
+                # Seqs may have restarted with the server; ack again from scratch
+                st.session_state.acked_seq = 0
+                
+            elif msg_type == 'history_delta':
+                # Messages missed while reconnecting, plus edits/deletes of ones we already have
+                positions = {msg.get('seq'): i for i, msg in enumerate(st.session_state.messages)}
+                for msg in data:
+                    if msg.get('seq') in positions:
+                        st.session_state.messages[positions[msg['seq']]] = msg
+                    else:
+                        st.session_state.messages.append(msg)
+                
+            elif msg_type == 'message_updated':
+                for i, msg in enumerate(st.session_state.messages):
+                    if msg.get('seq') == data.get('seq'):
+                        st.session_state.messages[i] = data
+                        break
                 
             elif msg_type == 'users':
                 st.session_state.active_users = data
                 
+            elif msg_type == 'typing':
+                st.session_state.typing_users = data
+                
+            elif msg_type == 'direct_message':
+                st.session_state.direct_messages.append(data)
+                
+            elif msg_type == 'read_receipts':
+                st.session_state.read_cursors.update(data)
+                
+            elif msg_type == 'model_status':
+                st.session_state.model_status[data.get('model')] = data
+                
             elif msg_type == 'status':
                 # Show status in a temporary notification
                 st.session_state.last_status = data
@@ -276,6 +122,11 @@ def process_message_queue():
                 
         except queue.Empty:
             break
+    
+    # One ack per refresh covers every message displayed since the last one
+    latest_seq = max((msg.get('seq') or 0 for msg in st.session_state.messages), default=0)
+    if latest_seq > st.session_state.acked_seq and st.session_state.sio and st.session_state.sio.ack_read(latest_seq):
+        st.session_state.acked_seq = latest_seq
 
 def format_timestamp(timestamp):
     """Format timestamp for display"""
@@ -378,13 +229,16 @@ if hasattr(st.session_state, 'last_error'):
 st.markdown("---")
 
 # Sidebar
+# Dropped for inactivity: keep the chat on screen; the next send reconnects
+idle = bool(st.session_state.sio and st.session_state.sio.idle)
+
 with st.sidebar:
     st.header("🎮 Chat Controls")
     
     # Connection Management
     st.subheader("Connection")
     
-    if not st.session_state.connected:
+    if not st.session_state.connected and not idle:
         # Username input with validation
         username_input = st.text_input(
             "Username (3-20 characters):", 
@@ -431,7 +285,10 @@ with st.sidebar:
             st.error(f"Connection Error: {st.session_state.connection_error}")
     
     else:
-        st.success(f"✅ Connected as: **{st.session_state.username}**")
+        if idle:
+            st.info(f"💤 **{st.session_state.username}** is away; send a message to rejoin")
+        else:
+            st.success(f"✅ Connected as: **{st.session_state.username}**")
         
         col1, col2 = st.columns(2)
         with col1:
@@ -449,6 +306,9 @@ with st.sidebar:
                         else:
                             st.session_state[key] = "" if key == 'username' else False
                 
+                st.session_state.read_cursors = {}
+                st.session_state.acked_seq = 0
+                st.session_state.direct_messages = []
                 st.session_state.connection_status = "disconnected"
                 st.session_state.sio = None
                 st.rerun()
@@ -456,7 +316,7 @@ with st.sidebar:
         with col2:
             if st.button("🔄 Reconnect"):
                 if st.session_state.sio:
-                    st.session_state.sio.connect()
+                    st.session_state.sio.reconnect()
     
     st.markdown("---")
     
@@ -476,6 +336,16 @@ with st.sidebar:
     st.metric("Messages", len(st.session_state.messages))
     st.metric("Online Users", len(st.session_state.active_users))
     
+    # AI model readiness (pull progress while the backend downloads it)
+    for model_status in st.session_state.model_status.values():
+        if model_status.get('ready'):
+            st.caption(f"🤖 AI model `{model_status.get('model')}` is ready")
+        else:
+            pulls = [r.get('pull', {}) for r in model_status.get('replicas', {}).values()]
+            percent = max((p.get('percent', 0) for p in pulls), default=0)
+            st.caption(f"⏳ AI model `{model_status.get('model')}` is loading ({percent:.0f}%)")
+            st.progress(min(int(percent), 100))
+    
     st.markdown("---")
     
     # Instructions
@@ -483,12 +353,13 @@ with st.sidebar:
     st.markdown("""
     • Type messages normally for group chat
     • Use `@ai` or `@bot` to talk to AI
+    • Use `@ai-large` for harder questions
     • Press Enter or click Send
     • AI responses may take a few seconds
     """)
 
 # Main Chat Area
-if st.session_state.connected:
+if st.session_state.connected or idle:
     # Chat Messages
     st.subheader("💬 Messages")
     
@@ -533,6 +404,10 @@ if st.session_state.connected:
                 
                 else:  # user message
                     icon = "👑" if username == st.session_state.username else "👤"
+                    if msg.get('deleted'):
+                        message = "<em>🗑️ message deleted</em>"
+                    elif msg.get('edited_at'):
+                        message += " <small><em>(edited)</em></small>"
                     st.markdown(f"""
                     <div class="message-container user-message">
                         <small><strong>{icon} {username} • {timestamp}</strong></small><br>
@@ -541,6 +416,19 @@ if st.session_state.connected:
                     """, unsafe_allow_html=True)
         else:
             st.info("💬 No messages yet. Start the conversation!")
+        
+        # Who has read up to my latest message
+        my_seqs = [msg.get('seq') for msg in st.session_state.messages
+                   if msg.get('username') == st.session_state.username and msg.get('seq')]
+        if my_seqs:
+            seen_by = sorted(u for u, seq in st.session_state.read_cursors.items()
+                             if seq >= my_seqs[-1] and u != st.session_state.username)
+            if seen_by:
+                st.caption(f"👀 Seen by {', '.join(seen_by)}")
+        
+        typing_users = [u for u in st.session_state.typing_users if u != st.session_state.username]
+        if typing_users:
+            st.caption(f"✍️ {', '.join(typing_users)} {'is' if len(typing_users) == 1 else 'are'} typing...")
     
     st.markdown("---")
     
@@ -583,6 +471,39 @@ if st.session_state.connected:
             else:
                 st.error(f"❌ {error_msg}")
     
+    # Direct messages go to one user only
+    other_users = [u for u in st.session_state.active_users if u != st.session_state.username]
+    with st.expander(f"🔒 Direct Messages ({len(st.session_state.direct_messages)})"):
+        for msg in st.session_state.direct_messages[-20:]:
+            timestamp = format_timestamp(msg.get('timestamp', time.time()))
+            st.markdown(f"**{msg.get('username')} → {msg.get('to')}** • {timestamp}: {msg.get('message', '')}")
+        if other_users:
+            with st.form("dm_form", clear_on_submit=True):
+                recipient = st.selectbox("To:", other_users)
+                dm_text = st.text_input("Private message:", max_chars=500)
+                if st.form_submit_button("🔒 Send privately") and dm_text.strip() and st.session_state.sio:
+                    st.session_state.sio.send_direct_message(recipient, dm_text)
+        else:
+            st.caption("Nobody else is online.")
+    
+    # Edit or delete the user's latest message
+    own_messages = [msg for msg in st.session_state.messages
+                    if msg.get('username') == st.session_state.username and msg.get('seq') and not msg.get('deleted')]
+    if own_messages:
+        last_own = own_messages[-1]
+        with st.expander("✏️ Edit or delete your last message"):
+            with st.form("edit_form", clear_on_submit=True):
+                edited_text = st.text_area("New text:", value=last_own.get('message', ''), max_chars=500)
+                col1, col2 = st.columns(2)
+                with col1:
+                    save_clicked = st.form_submit_button("💾 Save")
+                with col2:
+                    delete_clicked = st.form_submit_button("🗑️ Delete")
+                if save_clicked and edited_text.strip() and st.session_state.sio:
+                    st.session_state.sio.edit_message(last_own['seq'], edited_text)
+                elif delete_clicked and st.session_state.sio:
+                    st.session_state.sio.delete_message(last_own['seq'])
+    
     # Auto-refresh with reduced frequency
     time.sleep(MESSAGE_REFRESH_INTERVAL)
     st.rerun()
@@ -0,0 +1,451 @@
+"""Socket.IO client for the chat backend: reconnection, heartbeats and the chat protocol
+
+Kept free of Streamlit so it can run (and be tested) outside a page; events reach
+the UI only through the message queue handed to EnhancedChatClient.
+"""
+import socketio
+import time
+import threading
+import os
+import random
+import requests
+
+try:
+    import msgpack
+except ImportError:  # Without msgpack the client simply stays on JSON
+    msgpack = None
+
+# Configuration
+BACKEND_URL = os.getenv('BACKEND_URL', 'http://localhost:5000')
+RECONNECT_ATTEMPTS = 5
+RECONNECT_BASE_DELAY = 1  # Seconds; doubled on every failed attempt
+RECONNECT_MAX_DELAY = 30  # Cap for the backoff window
+BACKEND_PROBE_TTL = 10  # Seconds a successful liveness probe stays valid
+HEARTBEAT_INTERVAL = 10  # Seconds between heartbeats; the server's value from connect_response wins
+HEARTBEAT_MISSES = 3  # Unacknowledged heartbeats before the connection is treated as half-open
+RESUME_JOIN_TIMEOUT = 5  # Seconds an action after an idle disconnect waits for the rejoin
+WIRE_CODEC = os.getenv('CHAT_WIRE_CODEC', 'json')  # 'msgpack' asks the backend for compact binary messages
+
+# Compact message schema shared with backend/wire_format.py
+MESSAGE_TYPES = ('user', 'ai', 'system', 'error')
+MESSAGE_FIELDS = ('seq', 'type', 'username', 'message', 'timestamp')
+
+def decode_messages(data):
+    """Turn a MessagePack payload of positional records back into message dicts"""
+    messages = []
+    for record in msgpack.unpackb(data, raw=False):
+        message = dict(zip(MESSAGE_FIELDS, record))
+        if isinstance(message['type'], int):
+            message['type'] = MESSAGE_TYPES[message['type']]
+        if len(record) > len(MESSAGE_FIELDS):
+            message.update(record[len(MESSAGE_FIELDS)])
+        messages.append(message)
+    return messages
+
+
+class ReconnectManager:
+    """Single owner of reconnection: exponential backoff with full jitter and a cap.
+    
+    Runs in its own thread and never touches st.session_state; status updates go
+    through the client's message queue like every other background event.
+    """
+    def __init__(self, client, max_attempts=RECONNECT_ATTEMPTS,
+                 base_delay=RECONNECT_BASE_DELAY, max_delay=RECONNECT_MAX_DELAY):
+        self.client = client
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.attempts = 0
+        self.not_before = 0  # Server-suggested earliest reconnect time (draining)
+        self.stopped = threading.Event()
+        self.thread = None
+        self.lock = threading.Lock()
+    
+    def defer(self, delay):
+        """Don't reconnect for at least delay seconds, e.g. while the server is draining"""
+        self.not_before = time.time() + delay
+    
+    def next_delay(self):
+        """Random delay in [0, min(cap, base * 2^attempts)] so clients don't reconnect in lockstep"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** self.attempts))
+    
+    def start(self):
+        with self.lock:
+            if self.thread and self.thread.is_alive():
+                return
+            self.stopped.clear()
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
+    
+    def stop(self):
+        self.stopped.set()
+    
+    def reset(self):
+        self.attempts = 0
+    
+    def run(self):
+        while not self.stopped.is_set() and not self.client.sio.connected:
+            if self.attempts >= self.max_attempts:
+                self.client.message_queue.put(('connection_status', {
+                    'connected': False,
+                    'status': 'error',
+                    'error': f"Gave up after {self.max_attempts} reconnect attempts",
+                    'message': f"❌ Gave up after {self.max_attempts} reconnect attempts"
+                }))
+                return
+            
+            delay = max(self.next_delay(), self.not_before - time.time())
+            self.attempts += 1
+            self.client.message_queue.put((
+                'status', f'🔄 Reconnecting in {delay:.1f}s (attempt {self.attempts}/{self.max_attempts})'
+            ))
+            if self.stopped.wait(delay):
+                return
+            self.client.connect(probe=False)
+
+class HeartbeatMonitor:
+    """Sends `heartbeat` every interval and measures RTT from the server's ack.
+    
+    Each heartbeat reports the RTT of the previous one so the server can record it.
+    After HEARTBEAT_MISSES heartbeats in a row go unacknowledged the connection is
+    assumed half-open and dropped, which hands over to the ReconnectManager.
+    """
+    def __init__(self, client, interval=HEARTBEAT_INTERVAL, max_misses=HEARTBEAT_MISSES):
+        self.client = client
+        self.interval = interval
+        self.max_misses = max_misses
+        self.last_rtt_ms = None
+        self.acked = threading.Event()
+        self.stopped = threading.Event()
+        self.thread = None
+        self.lock = threading.Lock()
+    
+    def start(self):
+        with self.lock:
+            if self.thread and self.thread.is_alive():
+                return
+            self.stopped.clear()
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
+    
+    def stop(self):
+        self.stopped.set()
+    
+    def run(self):
+        misses = 0
+        self.acked.set()  # Nothing outstanding yet
+        while not self.stopped.wait(self.interval):
+            if not self.client.sio.connected:
+                return
+            misses = 0 if self.acked.is_set() else misses + 1
+            if misses >= self.max_misses:
+                self.client.message_queue.put(('status', '💔 Server stopped answering heartbeats, reconnecting'))
+                try:
+                    self.client.sio.disconnect()
+                except Exception as e:
+                    print(f"Disconnect error: {e}")
+                return
+            
+            sent = time.time()
+            self.acked.clear()
+            
+            def on_ack(data=None, sent=sent):
+                self.last_rtt_ms = (time.time() - sent) * 1000
+                self.client.last_heartbeat = time.time()
+                if isinstance(data, dict) and data.get('interval'):
+                    self.interval = data['interval']
+                self.acked.set()
+            
+            try:
+                self.client.sio.emit('heartbeat', {'rtt_ms': self.last_rtt_ms}, callback=on_ack)
+            except Exception as e:
+                print(f"Heartbeat error: {e}")
+
+class EnhancedChatClient:
+    def __init__(self, message_queue):
+        # Built-in reconnection is disabled; ReconnectManager is the only thing that reconnects
+        self.sio = socketio.Client(
+            reconnection=False,
+            logger=True,
+            engineio_logger=True
+        )
+        self.message_queue = message_queue
+        self.setup_events()
+        self.last_heartbeat = time.time()
+        self.last_probe_ok = 0
+        self.username = None
+        self.last_seq = 0
+        self.last_rev = 0  # Highest edit/delete revision seen, for incremental resync
+        self.epoch = None  # Server boot id our seqs belong to; a different one means full resync
+        self.sid = None  # Our current connection id, sent on rejoin to reclaim our username
+        self.auto_reconnect = True
+        self.idle = False  # Dropped for inactivity; stays offline until the user acts again
+        self.joined = threading.Event()  # Set by join_success, cleared on disconnect
+        self.reconnect_manager = ReconnectManager(self)
+        self.heartbeat = HeartbeatMonitor(self)
+    
+    def setup_events(self):
+        @self.sio.event
+        def connect():
+            self.last_heartbeat = time.time()
+            self.message_queue.put(('connection_status', {
+                'connected': True,
+                'status': 'connected',
+                'error': None,
+                'message': '✅ Connected to chat server'
+            }))
+            
+            # Re-join automatically after a reconnect, resuming from the last seen message.
+            # The old sid proves the username is ours if the server hasn't noticed the drop yet
+            previous_sid, self.sid = self.sid, self.sio.get_sid()
+            if self.username:
+                self.sio.emit('join_chat', {'username': self.username, 'last_seq': self.last_seq,
+                                            'last_rev': self.last_rev, 'epoch': self.epoch,
+                                            'previous_sid': previous_sid})
+                self.message_queue.put(('status', '🔄 Reconnected to chat server'))
+            self.reconnect_manager.reset()
+            self.heartbeat.start()
+        
+        @self.sio.event
+        def disconnect():
+            self.joined.clear()
+            self.heartbeat.stop()
+            self.message_queue.put(('connection_status', {
+                'connected': False,
+                'status': 'disconnected',
+                'error': None,
+                'message': '❌ Disconnected from chat server'
+            }))
+            if self.auto_reconnect:
+                self.reconnect_manager.start()
+        
+        @self.sio.event
+        def connect_error(data):
+            error_msg = str(data)
+            self.message_queue.put(('connection_status', {
+                'connected': False,
+                'status': 'error',
+                'error': error_msg,
+                'message': f'❌ Connection error: {error_msg}'
+            }))
+            # Log the error for debugging
+            print(f"Connection error: {error_msg}")
+        
+        @self.sio.event
+        def new_message(data):
+            for message in decode_messages(data) if isinstance(data, bytes) else [data]:
+                # The server's seq is the message id; only sender-only notices lack one
+                if 'id' not in message:
+                    message['id'] = message.get('seq') or f"{message.get('timestamp', time.time())}_{message.get('username', 'unknown')}"
+                self.last_seq = max(self.last_seq, message.get('seq', 0))
+                self.message_queue.put(('message', message))
+        
+        @self.sio.event
+        def chat_history(data):
+            if isinstance(data, bytes):
+                data = decode_messages(data)
+            # A full history replaces everything, including seqs from a previous server epoch
+            self.last_seq = max([0] + [msg.get('seq', 0) for msg in data])
+            self.last_rev = max([0] + [msg.get('rev', 0) for msg in data])
+            self.message_queue.put(('history', data))
+        
+        @self.sio.event
+        def chat_history_delta(data):
+            if isinstance(data, bytes):
+                data = decode_messages(data)
+            self.last_seq = max([self.last_seq] + [msg.get('seq', 0) for msg in data])
+            self.last_rev = max([self.last_rev] + [msg.get('rev', 0) for msg in data])
+            self.message_queue.put(('history_delta', data))
+        
+        @self.sio.event
+        def message_updated(data):
+            for message in decode_messages(data) if isinstance(data, bytes) else [data]:
+                self.last_rev = max(self.last_rev, message.get('rev', 0))
+                self.message_queue.put(('message_updated', message))
+        
+        @self.sio.event
+        def join_success(data):
+            self.epoch = data.get('epoch')
+            self.joined.set()
+        
+        @self.sio.event
+        def active_users(data):
+            self.message_queue.put(('users', data))
+        
+        @self.sio.event
+        def typing(data):
+            self.message_queue.put(('typing', data.get('usernames', [])))
+        
+        @self.sio.event
+        def direct_message(data):
+            self.message_queue.put(('direct_message', data))
+        
+        @self.sio.event
+        def read_receipts(data):
+            self.message_queue.put(('read_receipts', data.get('cursors', {})))
+        
+        @self.sio.event
+        def model_status(data):
+            self.message_queue.put(('model_status', data))
+        
+        @self.sio.event
+        def connect_response(data):
+            if data.get('heartbeat_interval'):
+                self.heartbeat.interval = data['heartbeat_interval']
+            for status in data.get('model_status') or []:
+                self.message_queue.put(('model_status', status))
+        
+        @self.sio.event
+        def idle_disconnect(data):
+            # Reconnecting straight away would only rejoin a user who isn't there;
+            # wait for their next action instead (see resume)
+            self.idle = True
+            self.auto_reconnect = False
+            self.message_queue.put(('status', f"💤 Disconnected after {data.get('idle_seconds')}s of inactivity; "
+                                              f"send a message to come back"))
+        
+        @self.sio.event
+        def server_draining(data):
+            delay = data.get('reconnect_delay', 0)
+            self.reconnect_manager.defer(delay)
+            self.message_queue.put(('status', f"🚧 Server is restarting, reconnecting in about {delay:.0f}s"))
+        
+        @self.sio.event
+        def error(data):
+            self.message_queue.put(('error', data.get('message', 'Unknown error')))
+        
+        @self.sio.event
+        def message_sent():
+            self.message_queue.put(('message_sent', True))
+    
+    def probe_backend(self):
+        """Cheap liveness probe, cached for BACKEND_PROBE_TTL seconds"""
+        if time.time() - self.last_probe_ok < BACKEND_PROBE_TTL:
+            return
+        
+        response = requests.get(f"{BACKEND_URL}/livez", timeout=2)
+        if response.status_code != 200:
+            raise Exception(f"Backend unhealthy: {response.status_code}")
+        self.last_probe_ok = time.time()
+    
+    def connect(self, probe=True):
+        """Connect to the backend; reconnects pass probe=False and go straight to the socket"""
+        try:
+            if self.sio.connected:
+                return True
+            
+            self.message_queue.put(('connection_status', {
+                'connected': False,
+                'status': 'connecting',
+                'error': None,
+                'message': 'Connecting...'
+            }))
+            
+            # Test backend liveness first (initial connect only)
+            if probe:
+                try:
+                    self.probe_backend()
+                except Exception as e:
+                    self.message_queue.put(('connection_status', {
+                        'connected': False,
+                        'status': 'error',
+                        'error': f"Backend not available: {e}",
+                        'message': f"Backend not available: {e}"
+                    }))
+                    return False
+            
+            # The backend falls back to JSON if it can't speak the requested codec
+            codec = WIRE_CODEC if msgpack else 'json'
+            self.sio.connect(BACKEND_URL, auth={'codec': codec})
+            return True
+            
+        except Exception as e:
+            self.message_queue.put(('connection_status', {
+                'connected': False,
+                'status': 'error',
+                'error': str(e),
+                'message': f"Connection failed: {e}"
+            }))
+            return False
+    
+    def disconnect(self):
+        # A deliberate disconnect must not trigger the reconnect manager
+        self.auto_reconnect = False
+        self.reconnect_manager.stop()
+        try:
+            if self.sio.connected:
+                self.sio.disconnect()
+        except Exception as e:
+            print(f"Disconnect error: {e}")
+    
+    def reconnect(self):
+        """Manual reconnect from the UI, routed through the reconnect manager"""
+        self.idle = False
+        self.auto_reconnect = True
+        self.reconnect_manager.reset()
+        self.reconnect_manager.start()
+    
+    def resume(self):
+        """After an idle disconnect, reconnect (and rejoin) before the user's next action"""
+        if self.idle and not self.sio.connected:
+            self.idle = False
+            self.auto_reconnect = True
+            self.reconnect_manager.reset()
+            # The server handles events concurrently, so let the rejoin land before the action
+            if self.connect(probe=False) and self.username:
+                self.joined.wait(RESUME_JOIN_TIMEOUT)
+    
+    def join_chat(self, username):
+        self.resume()
+        if self.sio.connected and username:
+            self.username = username
+            self.sio.emit('join_chat', {'username': username})
+            return True
+        return False
+    
+    def send_message(self, message):
+        self.resume()
+        if self.sio.connected and message.strip():
+            self.sio.emit('send_message', {'message': message.strip()})
+            return True
+        return False
+    
+    def send_direct_message(self, recipient, message):
+        self.resume()
+        if self.sio.connected and recipient and message.strip():
+            self.sio.emit('send_direct_message', {'to': recipient, 'message': message.strip()})
+            return True
+        return False
+    
+    def edit_message(self, seq, message):
+        self.resume()
+        if self.sio.connected and message.strip():
+            self.sio.emit('edit_message', {'seq': seq, 'message': message.strip()})
+            return True
+        return False
+    
+    def delete_message(self, seq):
+        self.resume()
+        if self.sio.connected:
+            self.sio.emit('delete_message', {'seq': seq})
+            return True
+        return False
+    
+    def ack_read(self, seq):
+        """Tell the server everything up to seq has been shown"""
+        if self.sio.connected and self.username:
+            self.sio.emit('ack_read', {'seq': seq})
+            return True
+        return False
+    
+    def is_healthy(self):
+        """Check connection health"""
+        if not self.sio.connected:
+            return False
+        
+        # No heartbeat acknowledged for several intervals
+        if time.time() - self.last_heartbeat > self.heartbeat.interval * HEARTBEAT_MISSES:
+            return False
+        
+        return True
+    
@@ -0,0 +1,59 @@
+"""An idle disconnect leaves the client offline until the user's next action"""
+import queue
+
+import pytest
+
+from chat_client import EnhancedChatClient
+
+
+@pytest.fixture
+def client():
+    client = EnhancedChatClient(queue.Queue())
+    client.username = 'reader'
+    client.emitted = []
+    client.sio.emit = lambda event, data=None, **kwargs: client.emitted.append((event, data))
+    yield client
+    client.heartbeat.stop()
+    client.reconnect_manager.stop()
+
+
+def trigger(client, event, *args):
+    return client.sio.handlers['/'][event](*args)
+
+
+def kicked_for_idling(client):
+    trigger(client, 'idle_disconnect', {'idle_seconds': 300, 'timeout': 300})
+    client.sio.connected = False
+    trigger(client, 'disconnect')
+
+
+def test_idle_disconnect_does_not_reconnect(client):
+    kicked_for_idling(client)
+    assert client.idle
+    assert not client.auto_reconnect
+    assert client.reconnect_manager.thread is None
+    assert client.emitted == []
+
+
+def test_other_disconnects_still_reconnect(client, monkeypatch):
+    monkeypatch.setattr(client, 'connect', lambda probe=True: False)
+    client.sio.connected = False
+    trigger(client, 'disconnect')
+    assert client.reconnect_manager.thread is not None
+
+
+def test_next_action_rejoins_before_it_is_sent(client, monkeypatch):
+    kicked_for_idling(client)
+
+    def connect(probe=True):
+        client.sio.connected = True
+        trigger(client, 'connect')
+        trigger(client, 'join_success', {'epoch': 'e'})
+        return True
+    monkeypatch.setattr(client, 'connect', connect)
+
+    assert client.send_message('back again')
+    assert [event for event, _ in client.emitted] == ['join_chat', 'send_message']
+    assert client.emitted[0][1]['username'] == 'reader'
+    assert not client.idle
+    assert client.auto_reconnect
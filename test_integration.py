@@ -7,13 +7,18 @@ Tests the core functionality including Socket.IO connections and AI responses.
 import requests
 import socketio
 import time
-import threading
 import sys
+import os
 from datetime import datetime
 
+# Point OLLAMA_URL at fake_ollama.py to run the AI tests without a real model
+BACKEND_URL = os.getenv('BACKEND_URL', 'http://localhost:5000')
+OLLAMA_URL = os.getenv('OLLAMA_URL', 'http://localhost:11434')
+
 class ChatTester:
-    def __init__(self, backend_url="http://localhost:5000"):
+    def __init__(self, backend_url=BACKEND_URL, ollama_url=OLLAMA_URL):
         self.backend_url = backend_url
+        self.ollama_url = ollama_url
         self.sio = socketio.Client()
         self.messages_received = []
         self.connected = False
@@ -58,6 +63,20 @@ class ChatTester:
             print(f"❌ Backend health check failed: {e}")
             return False
     
+    def test_backend_liveness(self):
+        """Test the lightweight liveness endpoint"""
+        try:
+            response = requests.get(f"{self.backend_url}/livez", timeout=2)
+            if response.status_code == 200 and response.json().get('status') == 'alive':
+                print("✅ Backend liveness check passed")
+                return True
+            else:
+                print(f"❌ Backend liveness check failed: {response.status_code}")
+                return False
+        except Exception as e:
+            print(f"❌ Backend liveness check failed: {e}")
+            return False
+    
     def test_connection(self):
         """Test Socket.IO connection"""
         try:
@@ -139,12 +158,32 @@ class ChatTester:
             print(f"❌ AI response test failed: {e}")
             return False
     
+    def test_history_api(self):
+        """Test the paginated history endpoint and its ETag revalidation"""
+        try:
+            response = requests.get(f"{self.backend_url}/history", params={'limit': 5}, timeout=5)
+            etag = response.headers.get('ETag')
+            if response.status_code != 200 or not etag:
+                print(f"❌ History API test failed: {response.status_code}")
+                return False
+            
+            cached = requests.get(f"{self.backend_url}/history", params={'limit': 5},
+                                  headers={'If-None-Match': etag}, timeout=5)
+            if cached.status_code == 304:
+                print(f"✅ History API test passed ({len(response.json()['messages'])} messages, 304 on revalidation)")
+                return True
+            else:
+                print(f"❌ History API revalidation returned {cached.status_code}")
+                return False
+        except Exception as e:
+            print(f"❌ History API test failed: {e}")
+            return False
+    
     def test_ollama_service(self):
         """Test Ollama service directly"""
         try:
             # Test Ollama API
-            ollama_url = "http://localhost:11434"
-            response = requests.get(f"{ollama_url}/api/tags", timeout=10)
+            response = requests.get(f"{self.ollama_url}/api/tags", timeout=10)
             
             if response.status_code == 200:
                 models = response.json()
@@ -170,7 +209,7 @@ def run_tests():
     
     tester = ChatTester()
     tests_passed = 0
-    total_tests = 6
+    total_tests = 8
     
     try:
         # Test 1: Backend Health
@@ -178,28 +217,38 @@ def run_tests():
         if tester.test_backend_health():
             tests_passed += 1
         
-        # Test 2: Ollama Service
-        print("\n2️⃣ Testing Ollama Service...")
+        # Test 2: Backend Liveness
+        print("\n2️⃣ Testing Backend Liveness...")
+        if tester.test_backend_liveness():
+            tests_passed += 1
+        
+        # Test 3: Ollama Service
+        print("\n3️⃣ Testing Ollama Service...")
         if tester.test_ollama_service():
             tests_passed += 1
         
-        # Test 3: Socket.IO Connection
-        print("\n3️⃣ Testing Socket.IO Connection...")
+        # Test 4: Socket.IO Connection
+        print("\n4️⃣ Testing Socket.IO Connection...")
         if tester.test_connection():
             tests_passed += 1
         
-        # Test 4: Join Chat
-        print("\n4️⃣ Testing Join Chat...")
+        # Test 5: Join Chat
+        print("\n5️⃣ Testing Join Chat...")
         if tester.test_join_chat():
             tests_passed += 1
         
-        # Test 5: Send Message
-        print("\n5️⃣ Testing Send Message...")
+        # Test 6: Send Message
+        print("\n6️⃣ Testing Send Message...")
         if tester.test_send_message():
             tests_passed += 1
         
-        # Test 6: AI Response
-        print("\n6️⃣ Testing AI Assistant Response...")
+        # Test 7: History API
+        print("\n7️⃣ Testing History API...")
+        if tester.test_history_api():
+            tests_passed += 1
+        
+        # Test 8: AI Response
+        print("\n8️⃣ Testing AI Assistant Response...")
         if tester.test_ai_response():
             tests_passed += 1
         